@@ -3,6 +3,8 @@ import Document from "../models/document.model.js";
 import supabase from "../utils/supabaseHelper.js";
 import axios from "axios";
 import { v4 as uuidv4 } from "uuid";
+import { StringDecoder } from "string_decoder";
+import crypto from "crypto";
 
 export const uploadDocument = asyncHandler(async (req, res) => {
   try {
@@ -98,6 +100,13 @@ export const uploadDocument = asyncHandler(async (req, res) => {
       processDocumentInBackground(docData._id, fileUrl, file.mimetype);
     }
 
+    // Have Flask extract and index the document now, so the first question doesn't wait for it.
+    // Large documents are indexed by their background extraction job instead.
+    if (file.size <= 5 * 1024 * 1024) {
+      const contentHash = crypto.createHash("sha256").update(file.buffer).digest("hex");
+      warmDocument(docData._id, fileUrl, file.mimetype, contentHash, userId);
+    }
+
     return res.status(200).json({
       message: "Document uploaded successfully",
       document: docData,
@@ -112,7 +121,33 @@ export const uploadDocument = asyncHandler(async (req, res) => {
   }
 });
 
+// Fire-and-forget: warming only saves time, so a failure (or a full warm-up queue) is just logged
+const warmDocument = (documentId, fileUrl, mimeType, contentHash, userId) => {
+  axios
+    .post(
+      `${process.env.FLASK_SERVER_URL}/api/document/${documentId}/warmup`,
+      {
+        file_url: fileUrl,
+        document_type: mimeType,
+        content_hash: contentHash
+      },
+      {
+        headers: {
+          "Content-Type": "application/json",
+          Accept: "application/json",
+          "X-User-ID": userId.toString(),
+          "X-Service-Token": process.env.AI_SERVICE_TOKEN, // Lets Flask trust X-User-ID
+        },
+        timeout: 10000,
+      }
+    )
+    .catch((err) => console.warn(`Warm-up not queued for document ${documentId}:`, err.message));
+};
+
 // Background processing for large documents
+const JOB_POLL_INTERVAL_MS = 3000;
+const SUBMIT_MAX_ATTEMPTS = 5;
+
 const processDocumentInBackground = async (documentId, fileUrl, mimeType) => {
   try {
     console.log(`Starting background processing for document: ${documentId}`);
@@ -121,24 +156,55 @@ const processDocumentInBackground = async (documentId, fileUrl, mimeType) => {
       processingStatus: "processing"
     });
 
-    // Call Flask server for processing
-    const flaskURL = `${process.env.FLASK_SERVER_URL}/api/process-large-document`;
-    
-    const response = await axios.post(
-      flaskURL,
-      {
-        document_id: documentId,
-        file_url: fileUrl,
-        mime_type: mimeType
+    // Queue extraction on the Flask server, then poll the job until it finishes
+    const flaskBaseURL = process.env.FLASK_SERVER_URL;
+    const requestOptions = {
+      headers: {
+        "Content-Type": "application/json",
+        Accept: "application/json",
       },
-      {
-        headers: {
-          "Content-Type": "application/json",
-          Accept: "application/json",
-        },
-        timeout: 300000, // 5 minutes for large documents
+      timeout: 30000,
+    };
+
+    // Flask sheds background work first when it is saturated; wait as told and resubmit
+    let submitted;
+    for (let attempt = 1; ; attempt++) {
+      try {
+        submitted = await axios.post(
+          `${flaskBaseURL}/api/process-large-document`,
+          {
+            document_id: documentId,
+            file_url: fileUrl,
+            mime_type: mimeType
+          },
+          requestOptions
+        );
+        break;
+      } catch (err) {
+        const status = err.response?.status;
+        if ((status !== 429 && status !== 503) || attempt >= SUBMIT_MAX_ATTEMPTS) {
+          throw err;
+        }
+        const retryAfter = Number(err.response.headers?.["retry-after"]) || 5;
+        await new Promise((resolve) => setTimeout(resolve, Math.min(retryAfter, 60) * 1000));
       }
-    );
+    }
+
+    const jobId = submitted.data.job_id;
+    const deadline = Date.now() + 300000; // 5 minutes for large documents
+    let status = submitted.data.status;
+
+    while (status === "queued" || status === "running") {
+      if (Date.now() > deadline) {
+        await axios.delete(`${flaskBaseURL}/api/jobs/${jobId}`, requestOptions).catch(() => {});
+        throw new Error("Document processing timed out");
+      }
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      const statusResponse = await axios.get(`${flaskBaseURL}/api/jobs/${jobId}`, requestOptions);
+      status = statusResponse.data.status;
+    }
+
+    const response = await axios.get(`${flaskBaseURL}/api/jobs/${jobId}/result`, requestOptions);
 
     if (response.data.success) {
       await Document.findByIdAndUpdate(documentId, {
@@ -211,6 +277,21 @@ export const unpinDocument = asyncHandler(async (req, res) => {
   }
 });
 
+// Pass Flask's rate limit (429) or load shedding (503) through, with its Retry-After
+const sendFlaskBusy = (res, flaskResponse) => {
+  const retryAfter = flaskResponse.headers?.["retry-after"];
+  if (retryAfter) {
+    res.set("Retry-After", retryAfter);
+  }
+  return res.status(flaskResponse.status).json({
+    message: flaskResponse.status === 429
+      ? "You're asking questions too quickly. Please wait a moment."
+      : "The AI service is busy. Please try again shortly.",
+    error: flaskResponse.status === 429 ? "Rate limited" : "Service busy",
+    retry_after: Number(retryAfter) || undefined
+  });
+};
+
 export const processDocument = asyncHandler(async (req, res) => {
   const { documentId } = req.params;
   const { question } = req.body;
@@ -255,12 +336,15 @@ export const processDocument = asyncHandler(async (req, res) => {
         file_url: doc.fileUrl,
         question: question.trim(),
         document_type: doc.mimeType,
-        previous_context: doc.questions.slice(-3) // Send last 3 questions for context
+        session_id: `${userId}:${documentId}`, // Flask keeps a rolling summary of each user's conversation
+        previous_context: doc.questions.slice(-3) // Seeds the session if Flask has none for this document
       },
       {
         headers: {
           "Content-Type": "application/json",
           Accept: "application/json",
+          "X-User-ID": userId.toString(), // Flask rate-limits per user
+          "X-Service-Token": process.env.AI_SERVICE_TOKEN,
         },
         timeout: 120000, // 2 minutes
       }
@@ -272,19 +356,7 @@ export const processDocument = asyncHandler(async (req, res) => {
 
     const aiAnswer = response.data.answer;
 
-    // Save question + answer to document history
-    doc.questions.push({ 
-      question: question.trim(), 
-      answer: aiAnswer,
-      askedAt: new Date()
-    });
-    
-    // Limit questions history to 100 entries
-    if (doc.questions.length > 100) {
-      doc.questions = doc.questions.slice(-100);
-    }
-    
-    await doc.save();
+    await saveQuestionToHistory(doc, question.trim(), aiAnswer);
 
     res.status(200).json({
       success: true,
@@ -311,6 +383,10 @@ export const processDocument = asyncHandler(async (req, res) => {
       });
     }
 
+    if (err.response?.status === 429 || err.response?.status === 503) {
+      return sendFlaskBusy(res, err.response);
+    }
+
     res.status(500).json({
       message: "AI processing failed",
       error: err.message,
@@ -319,6 +395,147 @@ export const processDocument = asyncHandler(async (req, res) => {
   }
 });
 
+// Stream an answer as Server-Sent Events, relaying tokens from Flask as they arrive
+export const processDocumentStream = asyncHandler(async (req, res) => {
+  const { documentId } = req.params;
+  const { question } = req.body;
+  const userId = req.user._id;
+
+  if (!question || question.trim().length === 0) {
+    return res.status(400).json({ message: "Question is required" });
+  }
+
+  if (question.length > 1000) {
+    return res.status(400).json({ message: "Question too long. Maximum 1000 characters." });
+  }
+
+  const doc = await Document.findOne({ _id: documentId, createdBy: userId });
+  if (!doc) {
+    return res.status(404).json({ message: "Document not found or unauthorized" });
+  }
+
+  if (doc.processingStatus === "processing") {
+    return res.status(202).json({
+      message: "Document is still being processed. Please try again in a moment.",
+      status: "processing"
+    });
+  }
+
+  if (doc.processingStatus === "failed") {
+    return res.status(500).json({
+      message: "Document processing failed. Please try uploading again.",
+      status: "failed"
+    });
+  }
+
+  const flaskURL = `${process.env.FLASK_SERVER_URL}/api/document/${documentId}/process/stream`;
+
+  let response;
+  try {
+    response = await axios.post(
+      flaskURL,
+      {
+        file_url: doc.fileUrl,
+        question: question.trim(),
+        document_type: doc.mimeType,
+        session_id: `${userId}:${documentId}`,
+        previous_context: doc.questions.slice(-3)
+      },
+      {
+        headers: {
+          "Content-Type": "application/json",
+          Accept: "text/event-stream",
+          "X-User-ID": userId.toString(),
+          "X-Service-Token": process.env.AI_SERVICE_TOKEN,
+        },
+        responseType: "stream",
+        timeout: 120000, // 2 minutes to start streaming
+      }
+    );
+  } catch (err) {
+    console.error("AI streaming error:", err.message);
+    if (err.response?.status === 429 || err.response?.status === 503) {
+      return sendFlaskBusy(res, err.response);
+    }
+    return res.status(500).json({
+      message: "AI processing failed",
+      error: err.message
+    });
+  }
+
+  res.writeHead(200, {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    Connection: "keep-alive",
+    "X-Accel-Buffering": "no"
+  });
+
+  // Relay bytes untouched, but watch for the final `done` event so the answer can be saved
+  const decoder = new StringDecoder("utf8");
+  let buffer = "";
+  let finalResult = null;
+
+  response.data.on("data", (chunk) => {
+    res.write(chunk);
+    buffer += decoder.write(chunk);
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      if (rawEvent.startsWith("event: done")) {
+        const dataLine = rawEvent.split("\n").find((line) => line.startsWith("data: "));
+        try {
+          finalResult = JSON.parse(dataLine.slice(6));
+        } catch (err) {
+          console.error("Could not parse final AI event:", err.message);
+        }
+      }
+    }
+  });
+
+  response.data.on("end", async () => {
+    try {
+      if (finalResult?.success) {
+        await saveQuestionToHistory(doc, question.trim(), finalResult.answer);
+      }
+    } catch (err) {
+      console.error("Failed to save streamed answer:", err.message);
+    }
+    res.end();
+  });
+
+  response.data.on("error", (err) => {
+    console.error("AI stream interrupted:", err.message);
+    res.write(`event: error\ndata: ${JSON.stringify({ error: "AI stream interrupted" })}\n\n`);
+    res.end();
+  });
+
+  // Stop the upstream request if the client goes away. req's "close" has already fired by
+  // now (the body was read before the awaits above), so watch the response instead.
+  res.on("close", () => {
+    if (!res.writableEnded) {
+      response.data.destroy();
+    }
+  });
+});
+
+const saveQuestionToHistory = async (doc, question, answer) => {
+  doc.questions.push({ 
+    question, 
+    answer,
+    askedAt: new Date()
+  });
+  
+  // Limit questions history to 100 entries
+  if (doc.questions.length > 100) {
+    doc.questions = doc.questions.slice(-100);
+  }
+  
+  await doc.save();
+};
+
 export const getUserDocuments = asyncHandler(async (req, res) => {
   const userId = req.user._id;
 
@@ -0,0 +1,191 @@
+import math
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+# Lower runs first when work is queued for a slot
+PRIORITIES = {"interactive": 0, "bulk": 1, "background": 2}
+
+# Priority of the work running in this context (set per request and per job)
+current_priority = contextvars.ContextVar("admission_priority", default=PRIORITIES["interactive"])
+
+def at_priority(name):
+    """Run the decorated function (a job handler, say) at the given priority."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = current_priority.set(PRIORITIES[name])
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                current_priority.reset(token)
+        return wrapper
+    return decorator
+
+def carry_priority(fn):
+    """Wrap fn to run at the caller's priority, e.g. on a ThreadPoolExecutor thread (which starts with a fresh context)."""
+    priority = current_priority.get()
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = current_priority.set(priority)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            current_priority.reset(token)
+    return wrapper
+
+# ---------------------------
+# Rate Limiting
+# ---------------------------
+
+class RateLimiter:
+    """Token buckets per client key: `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost=1):
+        """Spend `cost` tokens. Returns (allowed, seconds until it would be allowed)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            # The least recently seen buckets have refilled long ago; dropping them loses nothing
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (min(cost, self.burst) - tokens) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+# ---------------------------
+# Concurrency Slots
+# ---------------------------
+
+class PrioritySlots:
+    """A counting semaphore whose waiters are served by priority, then arrival order."""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+        self.acquired = 0
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self.hold_seconds = 1.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority):
+        with self._lock:
+            self.acquired += 1
+            if self.in_use < self.limit and not self._waiters:
+                self.in_use += 1
+                return
+            waiter = (priority, next(self._seq), threading.Event())
+            heapq.heappush(self._waiters, waiter)
+        waiter[2].wait()  # release() hands its slot straight to us
+
+    def release(self, held_seconds):
+        with self._lock:
+            self.hold_seconds = 0.9 * self.hold_seconds + 0.1 * held_seconds
+            if self._waiters:
+                heapq.heappop(self._waiters)[2].set()
+            else:
+                self.in_use -= 1
+
+    @contextmanager
+    def slot(self, priority=None):
+        self.acquire(current_priority.get() if priority is None else priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def waiting(self, up_to_priority=None):
+        """Waiters queued at or ahead of `up_to_priority` (all waiters by default)."""
+        with self._lock:
+            if up_to_priority is None:
+                return len(self._waiters)
+            return sum(1 for priority, _, _ in self._waiters if priority <= up_to_priority)
+
+    def retry_after(self):
+        """Rough seconds until the current queue drains."""
+        with self._lock:
+            rounds = (len(self._waiters) + 1) / self.limit
+            return max(1, math.ceil(rounds * self.hold_seconds))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_use": self.in_use,
+                "waiting": len(self._waiters),
+                "acquired": self.acquired,
+                "hold_seconds": round(self.hold_seconds, 3)
+            }
+
+# ---------------------------
+# Admission Control
+# ---------------------------
+
+class AdmissionController:
+    """Decides whether a request may start, and bounds the expensive work it does.
+
+    Extractions and LLM calls each take a slot from a global PrioritySlots,
+    so a burst of large documents queues instead of exhausting memory and
+    threads, and interactive work is served before bulk and background work.
+    Requests are checked at the door: over their client's rate limit they get
+    a 429, and when the slot queues are already long they get a 503 rather
+    than joining them. Lower priorities are shed first: bulk work once the
+    queue is half full, background work at a quarter.
+    """
+
+    def __init__(self, extraction_limit=4, llm_limit=16, max_queue=64,
+                 user_rate=1.0, user_burst=20, ip_rate=10.0, ip_burst=100):
+        self.slots = {
+            "extraction": PrioritySlots("extraction", extraction_limit),
+            "llm": PrioritySlots("llm", llm_limit)
+        }
+        self.max_queue = max_queue
+        self.limiters = {
+            "user": RateLimiter(user_rate, user_burst),
+            "ip": RateLimiter(ip_rate, ip_burst)
+        }
+
+    def slot(self, resource, priority=None):
+        return self.slots[resource].slot(priority)
+
+    def check(self, clients, priority, cost=1):
+        """Charge each (kind, key) in `clients`. Return None to admit, or (status, reason, retry_after) to reject."""
+        for client_kind, client_key in clients:
+            allowed, wait = self.limiters[client_kind].take(f"{client_kind}:{client_key}", cost)
+            if not allowed:
+                return 429, "rate_limited", max(1, math.ceil(wait))
+
+        queue_limit = self.max_queue >> priority
+        for slots in self.slots.values():
+            if slots.waiting(priority) >= queue_limit:
+                return 503, "overloaded", slots.retry_after()
+        return None
+
+    def stats(self):
+        return {
+            **{name: slots.stats() for name, slots in self.slots.items()},
+            "max_queue": self.max_queue,
+            "tracked_clients": {name: len(limiter) for name, limiter in self.limiters.items()}
+        }
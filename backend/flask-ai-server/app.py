@@ -1,16 +1,34 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import os
 from datetime import datetime
 import requests
-import fitz  # PyMuPDF
-from openai import OpenAI
 from dotenv import load_dotenv
 from werkzeug.middleware.proxy_fix import ProxyFix
-import tempfile
-import hashlib
 import time
 import json
+import random
+import hashlib
+import hmac
+import re
+import threading
+import uuid
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from cache import ExtractionCache, AnswerCache, create_answer_backend
+from extraction import shutdown_extraction_pool
+from extractors import extract_document, normalize_mime
+from retrieval import BM25Index
+from jobs import JobQueue
+from sessions import ConversationStore, session_fingerprint
+from singleflight import SingleFlight
+from downloader import Downloader
+from docstore import DocumentStore, is_content_hash
+from tokens import TokenCounter, chunk_by_tokens, context_window, MESSAGE_OVERHEAD
+from metrics import Metrics, SamplingProfiler, TOKEN_BUCKETS
+from llm import create_llm_backend, route_model, MicroBatcher, format_packed_questions, split_packed_answers
+from admission import AdmissionController, PRIORITIES, current_priority, at_priority, carry_priority
 
 load_dotenv()
 
@@ -25,96 +43,252 @@ CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:5173", "https://chasmos.netlify.app"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "Accept"],
+        "allow_headers": ["Content-Type", "Authorization", "Accept", "X-Request-ID"],
         "expose_headers": ["Content-Type", "X-Request-ID"]
     }
 })
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# LLM backend: OpenAI or any OpenAI-compatible server (LLM_BASE_URL, e.g. a local model),
+# or "fake" for tests. Retries are handled by create_chat_completion so they can back off per call.
+llm = create_llm_backend(
+    os.getenv("LLM_PROVIDER", "openai"),
+    api_key=os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("LLM_BASE_URL") or os.getenv("OPENAI_BASE_URL"),
+    timeout=float(os.getenv("LLM_TIMEOUT", 60)),
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", 64))
+)
+
+# Retry budget for rate-limited or transient LLM failures. A single wait is capped whatever
+# Retry-After says, and a call gives up once retrying would run past LLM_RETRY_DEADLINE
+# seconds in total, well inside the request timeout (GUNICORN_TIMEOUT).
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 10))
+LLM_RETRY_DEADLINE = float(os.getenv("LLM_RETRY_DEADLINE", 45))
+
+# Concurrent chunk calls allowed per large-document request
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", 5))
+
+# Token budgeting: tiktoken counts when available, otherwise a ~4 chars/token estimate
+token_counter = TokenCounter(os.getenv("TOKEN_ENCODING", "cl100k_base"))
+DOCUMENT_CONTEXT_TOKENS = int(os.getenv("DOCUMENT_CONTEXT_TOKENS", 6000))
+LARGE_CHUNK_TOKENS = int(os.getenv("LARGE_CHUNK_TOKENS", 1500))
+LARGE_CHUNK_OVERLAP = int(os.getenv("LARGE_CHUNK_OVERLAP", 250))
+
+# Local state (caches, job queue) lives here unless overridden per store
+DATA_DIR = os.getenv("AI_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+# Stage timings, token usage and cache counters, served at /api/metrics
+metrics = Metrics()
+
+# Requests slower than this are logged with their request id (and profiled when enabled)
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 10))
+PROFILE_SLOW_REQUESTS = os.getenv("PROFILE_SLOW_REQUESTS", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.1))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+
+# Caller-supplied request ids are echoed into logs and headers, so only plain ids are accepted
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,128}")
+
+# Cache for answered questions to avoid reprocessing
+document_cache = AnswerCache(
+    create_answer_backend(
+        os.getenv("ANSWER_CACHE_BACKEND", "memory"),
+        redis_url=os.getenv("REDIS_URL"),
+        max_bytes=int(os.getenv("ANSWER_CACHE_MAX_MB", 64)) * 1024 * 1024
+    ),
+    ttl=int(os.getenv("ANSWER_CACHE_TTL", 3600))
+)
 
-# Cache for processed documents to avoid reprocessing
-document_cache = {}
+# Shared keep-alive session for document downloads
+downloader = Downloader(
+    max_bytes=app.config['MAX_CONTENT_LENGTH'],
+    pool_size=int(os.getenv("DOWNLOAD_POOL_SIZE", 32)),
+    timeout=int(os.getenv("DOWNLOAD_TIMEOUT", 30))
+)
+
+# Coalesce concurrent identical extractions and answers
+extraction_flight = SingleFlight()
+answer_flight = SingleFlight()
+
+# Cache for extracted text, keyed by document and content hash
+text_cache = ExtractionCache(
+    cache_dir=os.getenv("TEXT_CACHE_DIR", DATA_DIR),
+    max_memory_bytes=int(os.getenv("TEXT_CACHE_MAX_MB", 256)) * 1024 * 1024,
+    max_disk_entries=int(os.getenv("TEXT_CACHE_MAX_DISK_ENTRIES", 2000)),
+    # A document has one text but many summary nodes and scanned pages
+    disk_budgets={
+        "summary": int(os.getenv("TEXT_CACHE_MAX_DISK_SUMMARIES", 20000)),
+        "ocr": int(os.getenv("TEXT_CACHE_MAX_DISK_OCR_PAGES", 20000))
+    }
+)
+
+# Full extracted text per document version, memory-mapped for paging through large documents
+document_store = DocumentStore(
+    os.getenv("DOCUMENT_STORE_DIR", os.path.join(DATA_DIR, "documents")),
+    max_bytes=int(os.getenv("DOCUMENT_STORE_MAX_MB", 2048)) * 1024 * 1024,
+    compress=os.getenv("DOCUMENT_STORE_COMPRESS", "true").lower() == "true"
+)
+
+# Most pages returned by one /pages request
+MAX_PAGES_PER_REQUEST = int(os.getenv("MAX_PAGES_PER_REQUEST", 50))
+
+# Shared secret the Node backend sends as X-Service-Token; only callers presenting it are trusted
+# to vouch for a user (X-User-ID) or read stored documents and sessions by id alone
+AI_SERVICE_TOKEN = os.getenv("AI_SERVICE_TOKEN", "")
+
+# Global limits on concurrent extractions and LLM calls, per-client rate limits, and load shedding.
+# Requests from the backend are charged to the user it forwards; anyone else is charged to their IP.
+admission = AdmissionController(
+    extraction_limit=int(os.getenv("MAX_CONCURRENT_EXTRACTIONS", 4)),
+    llm_limit=int(os.getenv("MAX_CONCURRENT_LLM_CALLS", 16)),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", 64)),
+    user_rate=float(os.getenv("RATE_LIMIT_PER_MINUTE", 60)) / 60,
+    user_burst=int(os.getenv("RATE_LIMIT_BURST", 20)),
+    ip_rate=float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", 600)) / 60,
+    ip_burst=int(os.getenv("RATE_LIMIT_IP_BURST", 100))
+)
 
 # ---------------------------
-# Enhanced PDF Text Extraction
+# Document Text Extraction
 # ---------------------------
 
-def extract_pdf_text_enhanced(url, max_pages=100):
-    """Enhanced PDF extraction with better error handling and performance."""
+SUPPORTED_FORMATS_HINT = "Please ensure it's a PDF, Word (.docx), text, Markdown, CSV or image file."
+
+def text_cache_kind(document_type):
+    """Cache kind for extracted text.
+
+    Binary formats are recognized from their bytes, so only a declared text
+    type (plain vs Markdown vs CSV for the same bytes) changes the result.
+    """
+    declared = normalize_mime(document_type)
+    return f"text:{declared}" if declared.startswith("text/") else "text"
+
+def cached_extraction_result(cached, content_hash, max_pages, start_time):
+    """Build an extraction result from a cache entry, honouring the caller's page limit."""
+    # Only PDFs have a page limit; other formats are bounded by word count
+    if cached.get("document_type", "application/pdf") == "application/pdf" and cached["page_count"] > max_pages:
+        return {
+            "success": False,
+            "error": f"PDF too large. Maximum {max_pages} pages allowed. This PDF has {cached['page_count']} pages.",
+            "text": "",
+            "page_count": cached["page_count"],
+            "word_count": 0
+        }
+
+    return {
+        "success": True,
+        **cached,
+        "content_hash": content_hash,
+        "processing_time": round(time.time() - start_time, 2),
+        "cached": True
+    }
+
+def extract_document_text(url, max_pages=100, document_id=None, document_type=None):
+    """Extract a document, sharing one download and parse between concurrent callers for the same document."""
+    result, shared = extraction_flight.do(
+        (document_id or url, url, max_pages, normalize_mime(document_type)),
+        lambda: download_and_extract(url, max_pages, document_id, document_type)
+    )
+    if shared:
+        print(f"Joined in-flight extraction for {document_id or url}")
+    return result
+
+def store_document(namespace, content_hash, extracted, url):
+    """Write extracted text to the document store; a failure only costs paging, so it is logged.
+
+    The source url is kept with it: reading the pages back requires it.
+    """
+    try:
+        with metrics.timer("stage_duration_seconds", stage="store"):
+            document_store.write(namespace, content_hash, extracted["text"], {
+                "file_url": url,
+                "page_count": extracted.get("page_count", 0),
+                "word_count": extracted.get("word_count", 0),
+                "document_type": extracted.get("document_type")
+            })
+    except OSError as e:
+        print(f"Could not store document {namespace}: {str(e)}")
+
+def download_and_extract(url, max_pages=100, document_id=None, document_type=None):
+    """Download a document and extract its text with the extractor for its type.
+
+    document_type is the declared MIME type; when missing or generic the type
+    is detected from the file itself.
+    """
     try:
         start_time = time.time()
+        cache_namespace = document_id or url
+        cache_kind = text_cache_kind(document_type)
         
-        # Download PDF with timeout
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        res = requests.get(url, headers=headers, timeout=30, stream=True)
+        # Revalidate against the version we extracted last time, if any
+        validators = text_cache.get_validators(cache_namespace, url)
+        with metrics.timer("stage_duration_seconds", stage="download"):
+            fetched = downloader.fetch(
+                url,
+                etag=validators and validators["etag"],
+                last_modified=validators and validators["last_modified"]
+            )
+        
+        if fetched["success"] and fetched["not_modified"]:
+            cached = text_cache.get(cache_namespace, validators["content_hash"], kind=cache_kind)
+            if cached:
+                text_cache.count_revalidation()
+                print(f"Extraction cache hit (not modified) for {cache_namespace}")
+                return cached_extraction_result(cached, validators["content_hash"], max_pages, start_time)
+            # The text was evicted; fetch the file unconditionally
+            with metrics.timer("stage_duration_seconds", stage="download"):
+                fetched = downloader.fetch(url)
         
-        if res.status_code != 200:
+        if not fetched["success"]:
             return {
                 "success": False,
-                "error": f"Failed to download PDF. Status: {res.status_code}",
+                "error": fetched["error"],
                 "text": "",
                 "page_count": 0,
                 "word_count": 0
             }
 
-        # Save to temp file for large PDFs
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            for chunk in res.iter_content(chunk_size=8192):
-                if chunk:
-                    tmp_file.write(chunk)
-            tmp_path = tmp_file.name
+        data = fetched["data"]
+        content_hash = fetched["content_hash"]
+        if fetched["etag"] or fetched["last_modified"]:
+            text_cache.remember_validators(
+                cache_namespace, url, fetched["etag"], fetched["last_modified"], content_hash
+            )
+
+        cached = text_cache.get(cache_namespace, content_hash, kind=cache_kind)
+        if cached:
+            print(f"Extraction cache hit for {cache_namespace}")
+            return cached_extraction_result(cached, content_hash, max_pages, start_time)
+
+        # Parse page by page (or section by section) straight from memory. Only the parse
+        # holds an extraction slot: downloads and cache hits don't compete for the CPU.
+        with admission.slot("extraction"), metrics.timer("stage_duration_seconds", stage="parse"):
+            result = extract_document(data, document_type, max_pages=max_pages, page_cache=text_cache)
+        if not result["success"]:
+            return result
+        if result["ocr_pages"]:
+            print(f"OCR'd {result['ocr_pages']} image-only page(s) for {cache_namespace}")
+            metrics.inc("ocr_pages_total", result["ocr_pages"])
+
+        extracted = {
+            "text": result["text"],
+            "page_count": result["page_count"],
+            "word_count": result["word_count"],
+            "truncated": result["truncated"],
+            "ocr_pages": result["ocr_pages"],
+            "document_type": result["document_type"]
+        }
+        text_cache.set(cache_namespace, content_hash, extracted, kind=cache_kind)
+        store_document(cache_namespace, content_hash, extracted, url)
+
+        return {
+            "success": True,
+            **extracted,
+            "content_hash": content_hash,
+            "processing_time": round(time.time() - start_time, 2)
+        }
 
-        try:
-            # Open PDF with PyMuPDF
-            doc = fitz.open(tmp_path)
-            
-            if len(doc) > max_pages:
-                return {
-                    "success": False,
-                    "error": f"PDF too large. Maximum {max_pages} pages allowed. This PDF has {len(doc)} pages.",
-                    "text": "",
-                    "page_count": len(doc),
-                    "word_count": 0
-                }
-            
-            # Extract text from all pages
-            full_text = ""
-            for page_num, page in enumerate(doc, 1):
-                text = page.get_text()
-                full_text += f"\n--- Page {page_num} ---\n{text}\n"
-                
-                # Stop if text is getting too large (approx 100K words)
-                if len(full_text.split()) > 100000:
-                    full_text += f"\n[Text truncated at page {page_num} due to size limits]\n"
-                    break
-            
-            doc.close()
-            
-            # Clean text
-            cleaned_text = full_text.strip()
-            word_count = len(cleaned_text.split())
-            
-            processing_time = time.time() - start_time
-            
-            return {
-                "success": True,
-                "text": cleaned_text,
-                "page_count": len(doc) if 'doc' in locals() else 0,
-                "word_count": word_count,
-                "processing_time": round(processing_time, 2),
-                "truncated": word_count > 100000
-            }
-            
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
-                
     except requests.exceptions.Timeout:
         return {
             "success": False,
@@ -136,78 +310,205 @@ def extract_pdf_text_enhanced(url, max_pages=100):
 # Text Processing Utilities
 # ---------------------------
 
-def chunk_text_smart(text, max_chunk_size=3000, overlap=500):
-    """Smart text chunking that respects paragraph boundaries."""
-    if not text or len(text) < max_chunk_size:
-        return [text] if text else []
-    
-    chunks = []
-    paragraphs = text.split('\n\n')
-    
-    current_chunk = ""
-    for paragraph in paragraphs:
-        if len(current_chunk) + len(paragraph) + 2 <= max_chunk_size:
-            current_chunk += paragraph + "\n\n"
-        else:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = paragraph + "\n\n"
-    
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    
-    # Add overlap between chunks for context
-    if len(chunks) > 1:
-        overlapped_chunks = []
-        for i in range(len(chunks)):
-            if i == 0:
-                overlapped_chunks.append(chunks[i])
-            else:
-                prev_chunk_end = chunks[i-1][-overlap:] if len(chunks[i-1]) > overlap else chunks[i-1]
-                overlapped_chunks.append(prev_chunk_end + "\n\n" + chunks[i])
-        return overlapped_chunks
-    
+def chunk_text_smart(text, max_tokens=750, overlap_tokens=125):
+    """Smart text chunking by model tokens that respects paragraph and page boundaries."""
+    chunks, _ = chunk_by_tokens(text, token_counter, max_tokens, overlap_tokens)
     return chunks
 
-def answer_with_openai(document_text, question, previous_context=None):
-    """Use OpenAI to answer questions about documents."""
-    try:
-        start_time = time.time()
-        
-        # Prepare system message
-        system_message = """You are Chasm AI, an intelligent document analysis assistant. 
+def record_token_usage(model, tokens):
+    metrics.observe("llm_tokens", tokens, buckets=TOKEN_BUCKETS, model=model)
+    metrics.inc("llm_tokens_total", tokens, model=model)
+
+def create_chat_completion(batch_key=None, **kwargs):
+    """Call the chat completions API, backing off on rate limits and transient errors.
+
+    batch_key marks independent map-step calls that the micro-batcher may pack
+    together with concurrent ones. Only calls with the same key share a prompt,
+    so it must identify one document or request: text from different users'
+    documents never goes into one completion.
+    """
+    if batch_key is not None:
+        return llm_batcher.complete(batch_key=batch_key, **kwargs)
+    deadline = time.monotonic() + LLM_RETRY_DEADLINE
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            if kwargs.get("stream"):
+                return llm.complete(**kwargs)  # Timed by stream_chat_completion
+            with admission.slot("llm"), metrics.timer("stage_duration_seconds", stage="llm"):
+                response = llm.complete(**kwargs)
+            record_token_usage(kwargs.get("model"), response.usage.total_tokens)
+            return response
+        except (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError) as e:
+            # Honour Retry-After when the server sends one, otherwise exponential backoff with jitter
+            delay = LLM_RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random())
+            response = getattr(e, "response", None)
+            if response is not None and response.headers.get("retry-after"):
+                try:
+                    delay = float(response.headers["retry-after"])
+                except ValueError:
+                    pass
+            delay = max(0.0, min(delay, LLM_RETRY_MAX_DELAY))
+
+            if attempt == LLM_MAX_RETRIES or time.monotonic() + delay > deadline:
+                metrics.inc("llm_errors_total", error=type(e).__name__)
+                raise
+            metrics.inc("llm_retries_total", error=type(e).__name__)
+
+            print(f"LLM call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+# Small concurrent map-step calls (chunk answers, section summaries) share one prompt
+llm_batcher = MicroBatcher(
+    create_chat_completion,
+    token_counter.count,
+    window=float(os.getenv("LLM_BATCH_WINDOW_MS", 20)) / 1000,
+    max_size=int(os.getenv("LLM_BATCH_MAX_SIZE", 4)),
+    max_prompt_tokens=int(os.getenv("LLM_BATCH_MAX_PROMPT_TOKENS", 2000)),
+    max_batch_tokens=int(os.getenv("LLM_BATCH_MAX_TOKENS", 6000))
+)
+
+def get_document_index(cache_namespace, content_hash, document_text, max_tokens=750, overlap_tokens=125):
+    """Load the chunk index for this document version, building and caching it on first use.
+
+    Chunk token counts are stored with the index, so the document is only
+    tokenized once per version.
+    """
+    kind = f"bm25:tokens:{max_tokens}:{overlap_tokens}"
+    cached = text_cache.get(cache_namespace, content_hash, kind=kind)
+    if cached:
+        return BM25Index.from_dict(cached)
+
+    with metrics.timer("stage_duration_seconds", stage="chunking"):
+        chunks, token_counts = chunk_by_tokens(document_text, token_counter, max_tokens, overlap_tokens)
+    with metrics.timer("stage_duration_seconds", stage="index"):
+        index = BM25Index.build(chunks, token_counts)
+    text_cache.set(cache_namespace, content_hash, index.to_dict(), kind=kind)
+    return index
+
+ANSWER_SYSTEM_MESSAGE = """You are Chasm AI, an intelligent document analysis assistant. 
         Your task is to answer questions based on the provided document text.
         Be thorough, accurate, and helpful. If the answer isn't in the document, say so clearly.
         Format your answers clearly with paragraphs and bullet points when appropriate."""
+
+# Models per route: final answers get the bigger model, per-chunk map steps a cheaper one
+ANSWER_PARAMS = {
+    "model": route_model("answer", "gpt-3.5-turbo-16k"),  # Use 16k context for larger documents
+    "temperature": 0.3,
+    "max_tokens": 2000,
+    "top_p": 0.9,
+    "frequency_penalty": 0.1,
+    "presence_penalty": 0.1
+}
+
+# Chunk answers are cut to 500 characters before the combine step, so a short reply is enough
+MAP_PARAMS = {
+    **ANSWER_PARAMS,
+    "model": route_model("map", "gpt-3.5-turbo"),
+    "max_tokens": int(os.getenv("MAP_MAX_TOKENS", 500))
+}
+
+COMBINE_QUESTION = "Summarize the findings into a comprehensive answer"
+
+SUMMARY_PARAMS = {
+    "model": route_model("summary", "gpt-3.5-turbo"),
+    "temperature": 0.5,
+    "max_tokens": 1000
+}
+
+SUMMARY_SYSTEM_MESSAGE = "You are a document summarization expert."
+
+SUMMARY_TEMPLATE = """Please provide a comprehensive summary of the following document. 
+        Include key points, main arguments, and important details.
         
-        # Prepare user message with document context
-        context_str = ""
-        if previous_context:
-            context_str = "\n\nPrevious questions and answers for context:\n"
-            for i, qa in enumerate(previous_context[-3:], 1):
-                context_str += f"{i}. Q: {qa.get('question', '')}\n   A: {qa.get('answer', '')[:200]}...\n"
+        Document:
+        {document}
         
-        user_message = f"""Document Content:
-{document_text[:12000]}  # Limit context to avoid token limits
+        Summary:"""
 
-{context_str}
+ANSWER_TEMPLATE = """Document Content:
+{document}
+
+{context}
 
 Question: {question}
 
 Please provide a comprehensive answer based on the document. If the document doesn't contain relevant information, state that clearly."""
+
+def document_budget(params, *prompt_parts):
+    """Tokens left for document text once the prompt around it and the reply are reserved."""
+    used = sum(token_counter.count_batch(list(prompt_parts))) + MESSAGE_OVERHEAD * len(prompt_parts)
+    available = context_window(params["model"]) - params["max_tokens"] - used
+    return max(0, min(DOCUMENT_CONTEXT_TOKENS, available))
+
+def build_summary_messages(document_text, template=SUMMARY_TEMPLATE, params=SUMMARY_PARAMS):
+    budget = document_budget(params, SUMMARY_SYSTEM_MESSAGE, template.format(document=""))
+    summary_prompt = template.format(document=token_counter.truncate(document_text, budget))
+    
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_MESSAGE},
+        {"role": "user", "content": summary_prompt}
+    ]
+
+def format_previous_context(previous_context):
+    context_str = ""
+    if previous_context:
+        context_str = "\n\nPrevious questions and answers for context:\n"
+        for i, qa in enumerate(previous_context[-3:], 1):
+            context_str += f"{i}. Q: {qa.get('question', '')}\n   A: {qa.get('answer', '')[:200]}...\n"
+    return context_str
+
+def answer_budget(question, previous_context=None, params=ANSWER_PARAMS):
+    """Tokens of document text that fit in an answer prompt for this question."""
+    prompt = ANSWER_TEMPLATE.format(document="", context=format_previous_context(previous_context), question=question)
+    return document_budget(params, ANSWER_SYSTEM_MESSAGE, prompt)
+
+def build_answer_messages(document_text, question, previous_context=None, params=ANSWER_PARAMS):
+    """Build the chat messages for a document question, truncating the document to the token budget."""
+    budget = answer_budget(question, previous_context, params)
+    user_message = ANSWER_TEMPLATE.format(
+        document=token_counter.truncate(document_text, budget),
+        context=format_previous_context(previous_context),
+        question=question
+    )
+    
+    return [
+        {"role": "system", "content": ANSWER_SYSTEM_MESSAGE},
+        {"role": "user", "content": user_message}
+    ]
+
+def stream_chat_completion(usage, **kwargs):
+    """Yield answer text deltas as they arrive, recording token usage into `usage`."""
+    # The LLM slot is held until the stream ends (or the client goes away)
+    with admission.slot("llm"):
+        start = time.perf_counter()
+        stream = create_chat_completion(
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}},
+            **kwargs
+        )
+        for chunk in stream:
+            chunk_usage = getattr(chunk, "usage", None)
+            if chunk_usage:
+                usage["total_tokens"] = chunk_usage["total_tokens"] if isinstance(chunk_usage, dict) else chunk_usage.total_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                if "completion_chunks" not in usage:
+                    metrics.observe("llm_first_token_seconds", time.perf_counter() - start)
+                usage["completion_chunks"] = usage.get("completion_chunks", 0) + 1
+                yield chunk.choices[0].delta.content
+    
+    metrics.observe("stage_duration_seconds", time.perf_counter() - start, stage="llm")
+    if usage.get("total_tokens"):
+        record_token_usage(kwargs.get("model"), usage["total_tokens"])
+
+def answer_with_openai(document_text, question, previous_context=None, params=ANSWER_PARAMS, batch_key=None):
+    """Use the LLM to answer questions about documents."""
+    try:
+        start_time = time.time()
         
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo-16k",  # Use 16k context for larger documents
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.3,
-            max_tokens=2000,
-            top_p=0.9,
-            frequency_penalty=0.1,
-            presence_penalty=0.1
+        response = create_chat_completion(
+            batch_key=batch_key,
+            messages=build_answer_messages(document_text, question, previous_context, params),
+            **params
         )
         
         answer = response.choices[0].message.content.strip()
@@ -227,10 +528,53 @@ Please provide a comprehensive answer based on the document. If the document doe
             "answer": "I apologize, but I encountered an error while processing your request. Please try again."
         }
 
-def process_large_document_in_chunks(document_text, question):
-    """Process very large documents by chunking."""
+def answer_chunks(chunks, question):
+    """Answer a question against each chunk concurrently.
+
+    Returns (chunk_answers, tokens_used, chunks_failed); failed chunks are
+    dropped so the rest can still answer.
+    """
+    # Chunks of this one request may share a prompt with each other, never with another request's
+    batch_key = ("chunks", uuid.uuid4().hex)
+    with ThreadPoolExecutor(max_workers=max(1, min(CHUNK_CONCURRENCY, len(chunks)))) as executor:
+        results = list(executor.map(
+            carry_priority(lambda chunk: answer_with_openai(chunk, question, params=MAP_PARAMS, batch_key=batch_key)), chunks
+        ))
+    
+    chunk_answers = []
+    tokens_used = 0
+    for i, result in enumerate(results):
+        if result["success"]:
+            tokens_used += result.get("tokens_used", 0)
+            chunk_answers.append({
+                "chunk": i + 1,
+                "answer": result["answer"][:500] + "..." if len(result["answer"]) > 500 else result["answer"]
+            })
+    chunks_failed = len(chunks) - len(chunk_answers)
+    if chunks_failed:
+        print(f"{chunks_failed} of {len(chunks)} chunks failed, continuing with partial results")
+    
+    return chunk_answers, tokens_used, chunks_failed
+
+def build_combine_prompt(chunk_answers, question):
+    combined_answers = "\n\n".join([f"Chunk {ca['chunk']}: {ca['answer']}" for ca in chunk_answers])
+    
+    return f"""I have analyzed a document in {len(chunk_answers)} parts. Here are the findings:
+
+{combined_answers}
+
+Based on all parts of the document, please provide a comprehensive answer to: {question}
+
+Combine information from all relevant parts and provide a complete answer."""
+
+def process_large_document_in_chunks(document_text, question, index=None):
+    """Process very large documents by chunking.
+
+    With an index, the chunks most relevant to the question are used;
+    otherwise the first chunks of the document.
+    """
     try:
-        chunks = chunk_text_smart(document_text, max_chunk_size=6000, overlap=1000)
+        chunks = index.chunks if index else chunk_text_smart(document_text, max_tokens=LARGE_CHUNK_TOKENS, overlap_tokens=LARGE_CHUNK_OVERLAP)
         
         if not chunks:
             return {
@@ -239,15 +583,9 @@ def process_large_document_in_chunks(document_text, question):
                 "answer": "The document appears to be empty or couldn't be processed."
             }
         
-        # Process each chunk
-        chunk_answers = []
-        for i, chunk in enumerate(chunks[:5]):  # Limit to first 5 chunks for performance
-            result = answer_with_openai(chunk, question)
-            if result["success"]:
-                chunk_answers.append({
-                    "chunk": i + 1,
-                    "answer": result["answer"][:500] + "..." if len(result["answer"]) > 500 else result["answer"]
-                })
+        # Process chunks concurrently
+        selected = index.top_chunks(question, k=5) if index else chunks[:5]  # Limit to 5 chunks for performance
+        chunk_answers, tokens_used, chunks_failed = answer_chunks(selected, question)
         
         if not chunk_answers:
             return {
@@ -262,57 +600,916 @@ def process_large_document_in_chunks(document_text, question):
                 "success": True,
                 "answer": chunk_answers[0]["answer"],
                 "answer_type": "direct",
-                "chunks_processed": 1
+                "chunks_processed": 1,
+                "chunks_failed": chunks_failed,
+                "tokens_used": tokens_used
             }
         else:
             # Summarize multiple answers
-            combined_answers = "\n\n".join([f"Chunk {ca['chunk']}: {ca['answer']}" for ca in chunk_answers])
+            summary_prompt = build_combine_prompt(chunk_answers, question)
+            summary_result = answer_with_openai(summary_prompt, COMBINE_QUESTION)
+            
+            return {
+                "success": True,
+                "answer": summary_result["answer"] if summary_result["success"] else "\n\n".join(
+                    [f"Chunk {ca['chunk']}: {ca['answer']}" for ca in chunk_answers]
+                ),
+                "answer_type": "combined",
+                "chunks_processed": len(chunk_answers),
+                "chunks_failed": chunks_failed,
+                "tokens_used": tokens_used + summary_result.get("tokens_used", 0)
+            }
             
-            summary_prompt = f"""I have analyzed a document in {len(chunk_answers)} parts. Here are the findings:
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Chunk processing error: {str(e)}",
+            "answer": "Error processing the document in chunks."
+        }
+
+# ---------------------------
+# Hierarchical Summarization
+# ---------------------------
+
+SECTION_SUMMARY_TEMPLATE = """Summarize this section of a longer document. 
+        Keep the key points, names, figures and conclusions; the summary will be combined with those of the other sections.
+        
+        Section:
+        {document}
+        
+        Summary:"""
+
+MERGE_SUMMARY_TEMPLATE = """Below are summaries of consecutive sections of a longer document, in order. 
+        Merge them into one summary of this part of the document, keeping the key points, names, figures and conclusions.
+        
+        Section summaries:
+        {document}
+        
+        Summary:"""
+
+COMBINE_SUMMARY_TEMPLATE = """Below are summaries of consecutive sections of one document, in order. 
+        Combine them into a comprehensive summary of the whole document.
+        Include key points, main arguments, and important details.
+        
+        Section summaries:
+        {document}
+        
+        Summary:"""
+
+SECTION_SUMMARY_PARAMS = {
+    **SUMMARY_PARAMS,
+    "model": route_model("map", "gpt-3.5-turbo"),
+    "max_tokens": int(os.getenv("SECTION_SUMMARY_TOKENS", 500))
+}
+
+# Tokens of document text summarized per leaf of the summary tree
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 3000))
+
+def summarize_section(cache_namespace, content_hash, text, template):
+    """Summarize one node of the summary tree. Returns (summary, tokens_used); summary is None on failure.
+
+    Nodes are cached under the document version by a hash of their input, so a
+    repeated or retried summary only pays for the nodes that are missing.
+    """
+    kind = "summary:" + hashlib.sha256((template + text).encode("utf-8")).hexdigest()[:32]
+    cached = text_cache.get(cache_namespace, content_hash, kind=kind)
+    if cached:
+        return cached["summary"], 0
+
+    try:
+        response = create_chat_completion(
+            batch_key=("summary", cache_namespace, content_hash),
+            messages=build_summary_messages(text, template, SECTION_SUMMARY_PARAMS),
+            **SECTION_SUMMARY_PARAMS
+        )
+    except Exception as e:
+        print(f"Section summary failed: {str(e)}")
+        return None, 0
+
+    summary = response.choices[0].message.content.strip()
+    text_cache.set(cache_namespace, content_hash, {"summary": summary}, kind=kind)
+    return summary, response.usage.total_tokens
+
+def summarize_sections(cache_namespace, content_hash, texts, template):
+    """Summarize one level of the tree concurrently. Returns (summaries, tokens_used, failed)."""
+    with ThreadPoolExecutor(max_workers=max(1, min(CHUNK_CONCURRENCY, len(texts)))) as executor:
+        results = list(executor.map(
+            carry_priority(lambda text: summarize_section(cache_namespace, content_hash, text, template)), texts
+        ))
+    
+    summaries = [summary for summary, _ in results if summary]
+    return summaries, sum(tokens for _, tokens in results), len(texts) - len(summaries)
+
+def group_within_budget(texts, budget):
+    """Group consecutive texts so each group fits in `budget` tokens."""
+    groups, current, used = [], [], 0
+    for text, count in zip(texts, token_counter.count_batch(texts)):
+        if current and used + count + 2 > budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += count + 2
+    if current:
+        groups.append(current)
+    return groups
+
+def reduce_for_summary(cache_namespace, content_hash, document_text):
+    """Map-reduce a document down to text that fits one summary prompt.
+
+    Sections are summarized concurrently, then their summaries are grouped and
+    merged level by level until they fit. Returns (text, template, stats) for
+    the final summary call; a document that already fits is returned as is.
+    """
+    stats = {"sections": 0, "sections_failed": 0, "levels": 0, "tokens_used": 0}
+    budget = document_budget(SUMMARY_PARAMS, SUMMARY_SYSTEM_MESSAGE, COMBINE_SUMMARY_TEMPLATE.format(document=""))
+    if token_counter.count(document_text) <= budget:
+        return document_text, SUMMARY_TEMPLATE, stats
+    
+    with metrics.timer("stage_duration_seconds", stage="chunking"):
+        texts, _ = chunk_by_tokens(document_text, token_counter, SUMMARY_CHUNK_TOKENS, 0)
+    template = SECTION_SUMMARY_TEMPLATE
+    stats["sections"] = len(texts)
+    while True:
+        summaries, tokens_used, failed = summarize_sections(cache_namespace, content_hash, texts, template)
+        stats["levels"] += 1
+        stats["tokens_used"] += tokens_used
+        stats["sections_failed"] += failed
+        if not summaries:
+            raise RuntimeError("Could not summarize any section of the document.")
+        
+        groups = group_within_budget(summaries, budget)
+        if len(groups) == 1 or len(groups) == len(summaries):
+            return "\n\n".join(summaries), COMBINE_SUMMARY_TEMPLATE, stats
+        texts = ["\n\n".join(group) for group in groups]
+        template = MERGE_SUMMARY_TEMPLATE
+
+def cached_summary(cache_namespace, content_hash):
+    cached = text_cache.get(cache_namespace, content_hash, kind="summary")
+    return cached["summary"] if cached else None
+
+def summarize_document_text(cache_namespace, content_hash, document_text):
+    """Summarize a whole document, reusing the cached summary and partial summaries when present."""
+    summary = cached_summary(cache_namespace, content_hash)
+    if summary:
+        return {"summary": summary, "tokens_used": 0, "cached": True}
+    
+    text, template, stats = reduce_for_summary(cache_namespace, content_hash, document_text)
+    response = create_chat_completion(messages=build_summary_messages(text, template), **SUMMARY_PARAMS)
+    summary = response.choices[0].message.content.strip()
+    text_cache.set(cache_namespace, content_hash, {"summary": summary, **stats}, kind="summary")
+    
+    return {
+        "summary": summary,
+        **stats,
+        "tokens_used": stats["tokens_used"] + response.usage.total_tokens,
+        "cached": False
+    }
+
+# ---------------------------
+# Background Jobs
+# ---------------------------
+
+def run_extraction_job(payload, job):
+    """Extract a large document in the background (job kind "extract")."""
+    document_id = payload["document_id"]
+    print(f"Starting background processing for document {document_id}")
+    
+    extraction_result = extract_document_text(
+        payload["file_url"], max_pages=200, document_id=document_id, document_type=payload.get("document_type")
+    )
+    
+    if not extraction_result["success"]:
+        return {
+            "success": False,
+            "document_id": document_id,
+            "error": extraction_result.get("error", "Extraction failed")
+        }
+    
+    # The result carries a preview; the full text is paged from the document store
+    content_hash = extraction_result["content_hash"]
+    if not document_store.exists(document_id, content_hash):
+        store_document(document_id, content_hash, extraction_result, payload["file_url"])
+    
+    # Large uploads get no separate warm-up job (it would parse the file again under another
+    # page limit); this job builds the index and summary instead
+    warmed = {} if job.cancel_requested() else warm_caches(document_id, extraction_result, job=job)
+    
+    return {
+        "success": True,
+        **warmed,
+        "document_id": document_id,
+        "content_hash": content_hash,
+        "pages_url": f"/api/document/{document_id}/pages?" + urlencode({"version": content_hash, "file_url": payload["file_url"]}),
+        "extracted_text": extraction_result["text"][:50000],  # Return first 50K chars
+        "page_count": extraction_result.get("page_count", 0),
+        "word_count": extraction_result.get("word_count", 0),
+        "processing_time": extraction_result.get("processing_time", 0),
+        "truncated": extraction_result.get("truncated", False)
+    }
+
+# Persistent queue for long-running work, kept off the request threads. Queued jobs
+# are claimed by kind: documents a user is waiting on (0) before session summaries (1)
+# before speculative warm-ups (2).
+job_queue = JobQueue(
+    os.getenv("JOB_DB_PATH", os.path.join(DATA_DIR, "jobs.sqlite3")),
+    workers=int(os.getenv("JOB_WORKERS", 2)),
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", 60))
+)
+job_queue.register("extract", at_priority("background")(run_extraction_job), priority=0)
+
+# Job workers are never started at import: the extraction pool's spawned children
+# re-import this module, and gunicorn's master imports it before forking.
+# The server entry points call init_worker() instead.
+
+def init_worker():
+    """Per-process startup for a serving process: start the job queue's worker threads."""
+    job_queue.start()
+
+def shutdown_worker(timeout=30):
+    """Let running jobs finish (or hand them back to the queue) and stop the extraction pool."""
+    job_queue.stop(timeout)
+    shutdown_extraction_pool()
+
+# ---------------------------
+# Request Tracing and Metrics
+# ---------------------------
+
+@app.before_request
+def start_request_trace():
+    request_id = request.headers.get("X-Request-ID", "")
+    g.request_id = request_id if REQUEST_ID_PATTERN.fullmatch(request_id) else uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    if PROFILE_SLOW_REQUESTS and random.random() < PROFILE_SAMPLE_RATE:
+        g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+@app.after_request
+def finish_request_trace(response):
+    request_id = g.get("request_id") or uuid.uuid4().hex
+    response.headers["X-Request-ID"] = request_id
+    
+    start = g.get("request_start", time.perf_counter())
+    profiler = g.get("profiler")
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    method = request.method
+    status = response.status_code
+    
+    def finish():
+        # Runs once the body has been sent, so streamed responses are timed in full
+        elapsed = time.perf_counter() - start
+        metrics.observe("http_request_duration_seconds", elapsed, endpoint=endpoint, method=method, status=status)
+        slow = elapsed >= SLOW_REQUEST_SECONDS
+        if slow:
+            print(f"Slow request {request_id}: {method} {endpoint} -> {status} in {elapsed:.2f}s")
+        if profiler is not None:
+            profiler.stop()
+            if slow:
+                # Named by the server, never the caller: a request id is not a safe file name
+                path = os.path.join(PROFILE_DIR, f"{uuid.uuid4().hex}.txt")
+                profiler.write(path, header=f"{request_id} {method} {endpoint} {status} {elapsed:.2f}s")
+                print(f"Profile for {request_id} written to {path}")
+    
+    response.call_on_close(finish)
+    return response
+
+# ---------------------------
+# Admission Control
+# ---------------------------
+
+# Priority class per AI endpoint: interactive Q&A is served first, then multi-answer
+# and summary requests, then large-document extraction. Other endpoints are not limited.
+ENDPOINT_PRIORITIES = {
+    "process_document_question": "interactive",
+    "stream_document_question": "interactive",
+    "process_document_batch": "bulk",
+    "summarize_document": "bulk",
+    "stream_summary": "bulk",
+    "process_large_document": "background",
+    "warm_document": "background"
+}
+
+def trusted_backend():
+    """Whether the caller presented the backend's shared secret."""
+    token = request.headers.get("X-Service-Token", "")
+    return bool(AI_SERVICE_TOKEN) and hmac.compare_digest(token.encode("utf-8"), AI_SERVICE_TOKEN.encode("utf-8"))
+
+def backend_only():
+    """A 403 response unless the caller is the trusted backend, else None."""
+    if trusted_backend():
+        return None
+    return jsonify({"success": False, "error": "This endpoint is only available to the backend"}), 403
+
+def request_session_id(data):
+    """The conversation session a question belongs to. Only the backend, which owns the ids, may name one."""
+    return data.get("session_id") if trusted_backend() else None
+
+def request_clients():
+    """[(kind, key)] rate limits a request is charged to.
+
+    The trusted backend forwards every user from one IP, so its requests are
+    charged to the user they name; anyone else is limited by IP.
+    """
+    user_id = request.headers.get("X-User-ID", "").strip()
+    if user_id and trusted_backend():
+        return [("user", user_id[:128])]
+    return [("ip", request.remote_addr or "unknown")]
+
+def request_cost():
+    """Rate limit tokens a request spends: one per question."""
+    if request.endpoint == "process_document_batch":
+        data = request.get_json(silent=True) or {}
+        if isinstance(data.get("questions"), list):
+            return max(1, len(data["questions"]))
+    return 1
+
+@app.before_request
+def admit_request():
+    """Reject AI requests over their client's rate limit (429) or while the server is saturated (503)."""
+    priority_name = ENDPOINT_PRIORITIES.get(request.endpoint)
+    priority = PRIORITIES[priority_name or "interactive"]
+    # Request threads are reused, so every request sets its own priority
+    current_priority.set(priority)
+    if priority_name is None or request.method == "OPTIONS":
+        return None
+    
+    clients = request_clients()
+    rejection = admission.check(clients, priority, cost=request_cost())
+    if rejection is None:
+        return None
+    
+    status, reason, retry_after = rejection
+    metrics.inc("admission_rejections_total", reason=reason, priority=priority_name)
+    client = ", ".join(f"{kind} {key}" for kind, key in clients)
+    print(f"Rejected {request.method} {request.path} for {client}: {reason}, retry after {retry_after}s")
+    response = jsonify({
+        "success": False,
+        "error": "Too many requests, please slow down" if status == 429 else "Server is busy, please try again shortly",
+        "reason": reason,
+        "retry_after": retry_after
+    })
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+def collect_component_stats():
+    """Export the caches', job queue's, sessions', admission limits', micro-batcher's and single-flight groups' own counters."""
+    text = text_cache.stats()
+    for kind, kind_stats in text["kinds"].items():
+        for result in ("memory_hits", "disk_hits", "revalidated", "misses"):
+            yield "cache_requests_total", "counter", {"cache": "text", "kind": kind, "result": result}, kind_stats[result]
+        yield "cache_entries", "gauge", {"cache": "text", "kind": kind, "tier": "disk"}, kind_stats["disk_entries"]
+        yield "cache_disk_budget", "gauge", {"cache": "text", "kind": kind}, kind_stats["disk_budget"]
+    yield "cache_entries", "gauge", {"cache": "text", "tier": "memory"}, text["memory_entries"]
+    yield "cache_memory_bytes", "gauge", {"cache": "text"}, text["memory_bytes"]
+    
+    answers = document_cache.stats()
+    for result in ("hits", "misses"):
+        yield "cache_requests_total", "counter", {"cache": "answer", "result": result}, answers[result]
+    if "entries" in answers:  # In-process backend only; Redis reports its own memory
+        yield "cache_entries", "gauge", {"cache": "answer", "tier": "memory"}, answers["entries"]
+        yield "cache_evictions_total", "counter", {"cache": "answer"}, answers["evictions"]
+    
+    for status, count in job_queue.stats().items():
+        if status != "workers":
+            yield "jobs", "gauge", {"status": status}, count
+    
+    yield "sessions", "gauge", {}, conversation_store.stats()["sessions"]
+    
+    limits = admission.stats()
+    for resource in admission.slots:
+        yield "admission_slots", "gauge", {"resource": resource}, limits[resource]["limit"]
+        yield "admission_in_use", "gauge", {"resource": resource}, limits[resource]["in_use"]
+        yield "admission_waiting", "gauge", {"resource": resource}, limits[resource]["waiting"]
+        yield "admission_acquired_total", "counter", {"resource": resource}, limits[resource]["acquired"]
+    for kind, clients in limits["tracked_clients"].items():
+        yield "rate_limit_clients", "gauge", {"kind": kind}, clients
+    
+    batching = llm_batcher.stats()
+    yield "llm_batcher_requests_total", "counter", {}, batching["requests"]
+    yield "llm_batcher_packed_requests_total", "counter", {}, batching["batched"]
+    yield "llm_batcher_calls_total", "counter", {}, batching["calls"]
+    yield "llm_batcher_fallbacks_total", "counter", {}, batching["fallbacks"]
+    
+    for flight, group in (("extraction", extraction_flight), ("answers", answer_flight)):
+        flight_stats = group.stats()
+        yield "single_flight_calls_total", "counter", {"flight": flight, "result": "executed"}, flight_stats["executions"]
+        yield "single_flight_calls_total", "counter", {"flight": flight, "result": "coalesced"}, flight_stats["coalesced"]
+
+metrics.add_collector(collect_component_stats)
+
+# ---------------------------
+# API Endpoints
+# ---------------------------
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition of this process's metrics."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/health", methods=["GET"])
+def health():
+    return jsonify({
+        "status": "healthy",
+        "service": "Chasm AI Document Processing Server",
+        "timestamp": datetime.utcnow().isoformat(),
+        "openai_status": "configured" if os.getenv("OPENAI_API_KEY") else "not_configured",
+        "max_file_size": "50MB",
+        "text_cache": text_cache.stats(),
+        "answer_cache": document_cache.stats(),
+        "jobs": job_queue.stats(),
+        "sessions": conversation_store.stats(),
+        "document_store": document_store.stats(),
+        "admission": admission.stats(),
+        "llm": {
+            "provider": llm.name,
+            "models": {"answer": ANSWER_PARAMS["model"], "map": MAP_PARAMS["model"], "summary": SUMMARY_PARAMS["model"]},
+            "batching": llm_batcher.stats()
+        },
+        "single_flight": {
+            "extraction": extraction_flight.stats(),
+            "answers": answer_flight.stats()
+        }
+    })
+
+@app.route("/api/ping", methods=["GET"])
+def ping():
+    return jsonify({
+        "success": True,
+        "message": "pong",
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+def validate_question_request(data):
+    """Return an error response for an invalid question payload, or None."""
+    if not data or "question" not in data or "file_url" not in data:
+        return jsonify({
+            "success": False,
+            "error": "Missing required fields: question and file_url"
+        }), 400
+    
+    question = data["question"].strip()
+    
+    if not question:
+        return jsonify({
+            "success": False,
+            "error": "Question cannot be empty"
+        }), 400
+    
+    if len(question) > 1000:
+        return jsonify({
+            "success": False,
+            "error": "Question too long. Maximum 1000 characters."
+        }), 400
+    
+    return None
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def fit_document_to_budget(document_id, content_hash, document_text, question, previous_context):
+    """The whole document if it fits the answer budget, else the passages most relevant to the question."""
+    budget = answer_budget(question, previous_context)
+    index = get_document_index(document_id, content_hash, document_text)
+    if index.total_tokens <= budget:
+        return document_text
+    return index.select_within_budget(question, budget)
+
+def answer_document_question(document_id, extraction_result, question, previous_context, cache_key, start_time):
+    """Answer a question about extracted document text and cache successful answers."""
+    # A caller that just finished may have filled the cache while we were queued behind it
+    cached_result = document_cache.get(cache_key)
+    if cached_result is not None:
+        return cached_result
+    
+    document_text = extraction_result["text"]
+    content_hash = extraction_result["content_hash"]
+    
+    # Decide processing strategy based on document size
+    word_count = extraction_result["word_count"]
+    
+    if word_count > 10000:  # Large document
+        print(f"Processing large document ({word_count} words) in chunks")
+        index = get_document_index(document_id, content_hash, document_text, LARGE_CHUNK_TOKENS, LARGE_CHUNK_OVERLAP)
+        summary = None if index.search(question, k=1) else cached_summary(document_id, content_hash)
+        if summary:
+            # Nothing in the text matches the question (e.g. "what is this about?"): answer from the summary
+            result = answer_with_openai(summary, question, previous_context)
+            result["answer_type"] = "summary"
+        else:
+            result = process_large_document_in_chunks(document_text, question, index=index)
+    else:  # Small/medium document
+        print(f"Processing document ({word_count} words) directly")
+        document_text = fit_document_to_budget(document_id, content_hash, document_text, question, previous_context)
+        result = answer_with_openai(document_text, question, previous_context)
+    
+    response_data = build_answer_response(document_id, extraction_result, result, start_time)
+    
+    # Cache the result
+    if response_data["success"]:
+        document_cache.set(cache_key, response_data)
+    
+    return response_data
+
+def build_answer_response(document_id, extraction_result, result, start_time):
+    """Shape an answer result into the response returned (and cached) for a question."""
+    if not result["success"]:
+        return {
+            "success": False,
+            "documentId": document_id,
+            "error": result.get("error", "Unknown error"),
+            "answer": result.get("answer", "Error processing document")
+        }
+    
+    return {
+        "success": True,
+        "documentId": document_id,
+        "answer": result["answer"],
+        "answer_type": result.get("answer_type", "direct"),
+        "confidence": 0.9,
+        "processing_time": round(time.time() - start_time, 2),
+        "extraction_time": extraction_result.get("processing_time", 0),
+        "word_count": extraction_result["word_count"],
+        "page_count": extraction_result.get("page_count", 0),
+        "chunks_processed": result.get("chunks_processed", 1),
+        "chunks_failed": result.get("chunks_failed", 0),
+        "tokens_used": result.get("tokens_used", 0)
+    }
+
+# ---------------------------
+# Batch Questions
+# ---------------------------
+
+# Most questions accepted in one batch request
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 20))
+
+# Questions answered concurrently when they can't share a prompt
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+
+# Questions packed into one prompt when the whole document fits alongside them
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", 5))
+
+# Reply tokens reserved per packed question
+BATCH_ANSWER_TOKENS = int(os.getenv("BATCH_ANSWER_TOKENS", 600))
+
+PACKED_ANSWER_TEMPLATE = """Document Content:
+{document}
+
+{context}
+
+Answer each of the questions below based on the document. If the document doesn't contain relevant information for a question, state that clearly.
+Start each answer on a new line with the header "### Answer N", where N is the question's number, and answer the questions in order.
+
+{questions}"""
+
+# Fields that are the same for every question in a batch, reported once at the top level
+BATCH_SHARED_FIELDS = ("documentId", "extraction_time", "word_count", "page_count", "processing_time")
+
+def packed_params(questions):
+    return {**ANSWER_PARAMS, "max_tokens": BATCH_ANSWER_TOKENS * len(questions)}
+
+def build_packed_prompt(document_text, questions, previous_context=None):
+    return PACKED_ANSWER_TEMPLATE.format(
+        document=document_text,
+        context=format_previous_context(previous_context),
+        questions=format_packed_questions(questions)
+    )
+
+def packed_budget(questions, previous_context=None):
+    """Tokens of document text that fit in one prompt together with these questions."""
+    prompt = build_packed_prompt("", questions, previous_context)
+    return document_budget(packed_params(questions), ANSWER_SYSTEM_MESSAGE, prompt)
+
+def answer_questions_packed(document_text, questions, previous_context=None):
+    """Answer several questions about the same text with one LLM call.
+
+    Returns (answers, tokens_used); an answer is None when the reply has no
+    section for that question, so the caller can ask it on its own.
+    """
+    response = create_chat_completion(
+        messages=[
+            {"role": "system", "content": ANSWER_SYSTEM_MESSAGE},
+            {"role": "user", "content": build_packed_prompt(document_text, questions, previous_context)}
+        ],
+        **packed_params(questions)
+    )
+    
+    answers = split_packed_answers(response.choices[0].message.content, len(questions))
+    return answers, response.usage.total_tokens
+
+def answer_batch_packed(document_id, extraction_result, pending, previous_context, start_time):
+    """Answer pending (question, cache_key) pairs in packed groups where the whole document fits.
+
+    Returns {cache_key: response_data} for the questions answered this way.
+    """
+    document_text = extraction_result["text"]
+    index = get_document_index(document_id, extraction_result["content_hash"], document_text)
+    answered = {}
+    
+    for i in range(0, len(pending), BATCH_PACK_SIZE):
+        group = pending[i:i + BATCH_PACK_SIZE]
+        questions = [question for question, _ in group]
+        if len(group) < 2 or index.total_tokens > packed_budget(questions, previous_context):
+            continue
+        
+        try:
+            answers, tokens_used = answer_questions_packed(document_text, questions, previous_context)
+        except Exception as e:
+            print(f"Packed answer failed ({str(e)}), answering {len(group)} questions individually")
+            continue
+        
+        found = [answer for answer in answers if answer is not None]
+        for (question, cache_key), answer in zip(group, answers):
+            if answer is None:
+                continue
+            response_data = build_answer_response(document_id, extraction_result, {
+                "success": True,
+                "answer": answer,
+                "answer_type": "batched",
+                "tokens_used": tokens_used // len(found)
+            }, start_time)
+            document_cache.set(cache_key, response_data)
+            answered[cache_key] = response_data
+    
+    return answered
+
+def answer_document_batch(document_id, extraction_result, questions, previous_context, start_time):
+    """Answer a list of questions about one extracted document.
+
+    Cached answers are reused, repeated questions are answered once, questions
+    over a document that fits in one prompt are packed into shared LLM calls,
+    and the rest are answered concurrently. Returns one (response_data, source)
+    per question, source being "cached", "packed", "single" or "repeated"
+    (a question already asked earlier in the same batch).
+    """
+    content_hash = extraction_result["content_hash"]
+    keys = [AnswerCache.make_key(document_id, content_hash, question, previous_context) for question in questions]
+    
+    answered = {}
+    pending = []
+    seen = set()
+    for question, cache_key in zip(questions, keys):
+        if cache_key in seen:
+            continue
+        seen.add(cache_key)
+        cached_result = document_cache.get(cache_key)
+        if cached_result is not None:
+            answered[cache_key] = (cached_result, "cached")
+        else:
+            pending.append((question, cache_key))
+    
+    if len(pending) > 1 and extraction_result["word_count"] <= 10000:
+        packed = answer_batch_packed(document_id, extraction_result, pending, previous_context, start_time)
+        answered.update((cache_key, (response_data, "packed")) for cache_key, response_data in packed.items())
+        pending = [(question, cache_key) for question, cache_key in pending if cache_key not in answered]
+    
+    if pending:
+        # Build the index once up front so concurrent questions share it
+        if extraction_result["word_count"] > 10000:
+            get_document_index(document_id, content_hash, extraction_result["text"], LARGE_CHUNK_TOKENS, LARGE_CHUNK_OVERLAP)
+        else:
+            get_document_index(document_id, content_hash, extraction_result["text"])
+        
+        def answer_one(item):
+            question, cache_key = item
+            response_data, _ = answer_flight.do(
+                cache_key,
+                lambda: answer_document_question(document_id, extraction_result, question, previous_context, cache_key, start_time)
+            )
+            return response_data
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_CONCURRENCY, len(pending)))) as executor:
+            for (_, cache_key), response_data in zip(pending, executor.map(carry_priority(answer_one), pending)):
+                answered[cache_key] = (response_data, "single")
+    
+    results = []
+    returned = set()
+    for cache_key in keys:
+        response_data, source = answered[cache_key]
+        results.append((response_data, "repeated" if cache_key in returned else source))
+        returned.add(cache_key)
+    return results
+
+# ---------------------------
+# Conversation Sessions
+# ---------------------------
+
+# Document excerpt budget per session turn, in tokens
+SESSION_CONTEXT_TOKENS = int(os.getenv("SESSION_CONTEXT_TOKENS", 3000))
+
+# Turns kept verbatim; older ones are folded into the rolling summary
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", 2))
+
+# Tokens of each recent answer repeated in the prompt
+SESSION_TURN_ANSWER_TOKENS = int(os.getenv("SESSION_TURN_ANSWER_TOKENS", 300))
+
+SESSION_SUMMARY_PARAMS = {**SUMMARY_PARAMS, "max_tokens": int(os.getenv("SESSION_SUMMARY_TOKENS", 300))}
+
+SESSION_SUMMARY_TEMPLATE = """Below is the running summary of a conversation about a document, followed by newer exchanges. 
+        Write an updated summary that covers both: what the user asked about and the key facts, names and numbers in the answers. 
+        Keep it under 200 words.
+        
+        Summary so far:
+        {summary}
+        
+        Newer exchanges:
+        {turns}
+        
+        Updated summary:"""
+
+SESSION_ANSWER_TEMPLATE = """Document excerpts:
+{document}
 
-{combined_answers}
+Conversation so far:
+{history}
 
-Based on all parts of the document, please provide a comprehensive answer to: {question}
+Question: {question}
 
-Combine information from all relevant parts and provide a complete answer."""
-            
-            summary_result = answer_with_openai(summary_prompt, "Summarize the findings into a comprehensive answer")
-            
-            return {
+Please provide a comprehensive answer based on the document excerpts and the conversation. If they don't contain relevant information, state that clearly."""
+
+conversation_store = ConversationStore(
+    os.getenv("SESSION_DB_PATH", os.path.join(DATA_DIR, "sessions.sqlite3")),
+    ttl=int(os.getenv("SESSION_TTL", 86400))
+)
+
+def format_session_turns(turns):
+    return "\n\n".join(
+        f"Q: {turn['question']}\nA: {token_counter.truncate(turn['answer'], SESSION_TURN_ANSWER_TOKENS)}"
+        for turn in turns
+    )
+
+def format_session_history(session):
+    parts = []
+    if session["summary"]:
+        parts.append(f"Summary of the earlier conversation: {session['summary']}")
+    if session["turns"]:
+        parts.append(format_session_turns(session["turns"]))
+    return "\n\n".join(parts) or "(This is the first question.)"
+
+def select_session_chunks(index, working_set, question, budget):
+    """Chunk ids to send for this turn: the session's working set plus new matches, within budget.
+
+    Chunks keep the order they were first sent in, so consecutive prompts
+    share their excerpt prefix. New matches append to the end, evicting the
+    oldest chunks this question doesn't match when they don't fit.
+    """
+    size = lambda i: index.token_counts[i] + 1
+    if index.total_tokens + len(index.chunks) <= budget:
+        return list(range(len(index.chunks)))
+    
+    matched = [i for i, _ in index.search(question, k=5)]
+    matched_set = set(matched)
+    selected = [i for i in working_set if i < len(index.chunks)]
+    used = sum(size(i) for i in selected)
+    
+    for i in matched:
+        if i in selected:
+            continue
+        while used + size(i) > budget:
+            stale = next((j for j in selected if j not in matched_set), None)
+            if stale is None:
+                break
+            selected.remove(stale)
+            used -= size(stale)
+        if used + size(i) <= budget:
+            selected.append(i)
+            used += size(i)
+    
+    if not selected:
+        # Nothing retrieved yet and nothing matches: start from the top of the document
+        for i in range(len(index.chunks)):
+            if used + size(i) > budget:
+                break
+            selected.append(i)
+            used += size(i)
+    return selected
+
+def build_session_messages(index, session, question):
+    """Chat messages for a session turn. Returns (messages, chunk_ids sent)."""
+    history = format_session_history(session)
+    prompt = SESSION_ANSWER_TEMPLATE.format(document="", history=history, question=question)
+    budget = min(SESSION_CONTEXT_TOKENS, document_budget(ANSWER_PARAMS, ANSWER_SYSTEM_MESSAGE, prompt))
+    chunk_ids = select_session_chunks(index, session["chunk_ids"], question, budget)
+    excerpts = token_counter.truncate("\n\n".join(index.chunks[i] for i in chunk_ids), budget)
+    
+    return [
+        {"role": "system", "content": ANSWER_SYSTEM_MESSAGE},
+        {"role": "user", "content": SESSION_ANSWER_TEMPLATE.format(document=excerpts, history=history, question=question)}
+    ], chunk_ids
+
+def open_session(session_id, document_id, content_hash, question, previous_context):
+    """Open a conversation session. Returns (session, answer cache key for its current state)."""
+    session = conversation_store.open(session_id, document_id, content_hash, seed_turns=previous_context)
+    cache_key = AnswerCache.make_key(document_id, f"{content_hash}:{session_fingerprint(session)}", question)
+    return session, cache_key
+
+def record_session_turn(session, question, response_data, chunk_ids=None):
+    """Append the answered turn and fold older turns into the summary in the background."""
+    turn, pending = conversation_store.add_turn(
+        session["session_id"], session["document_id"], question, response_data["answer"], chunk_ids
+    )
+    metrics.inc("session_turns_total")
+    if pending > SESSION_RECENT_TURNS:
+        job_queue.submit(
+            "session-summary",
+            {"session_id": session["session_id"], "document_id": session["document_id"]},
+            dedup_key=f"session-summary:{session['document_id']}:{session['session_id']}"
+        )
+    return turn
+
+def answer_session_question(document_id, extraction_result, question, session, cache_key, start_time):
+    """Answer a turn of a conversation session and record it.
+
+    Small and medium documents are answered from the session's working set of
+    excerpts plus the rolling summary instead of the whole document and raw
+    history; large documents take the chunked path with recent turns as context.
+    """
+    content_hash = extraction_result["content_hash"]
+    chunk_ids = None
+    # A caller that just finished may have filled the cache while we were queued behind it
+    cached_result = document_cache.get(cache_key)
+    if cached_result is not None:
+        response_data = cached_result
+    elif extraction_result["word_count"] > 10000:
+        response_data = answer_document_question(
+            document_id, extraction_result, question, session["turns"], cache_key, start_time
+        )
+    else:
+        index = get_document_index(document_id, content_hash, extraction_result["text"])
+        messages, chunk_ids = build_session_messages(index, session, question)
+        try:
+            response = create_chat_completion(messages=messages, **ANSWER_PARAMS)
+            result = {
                 "success": True,
-                "answer": summary_result["answer"] if summary_result["success"] else combined_answers,
-                "answer_type": "combined",
-                "chunks_processed": len(chunk_answers)
+                "answer": response.choices[0].message.content.strip(),
+                "answer_type": "conversation",
+                "tokens_used": response.usage.total_tokens
             }
-            
-    except Exception as e:
-        return {
-            "success": False,
-            "error": f"Chunk processing error: {str(e)}",
-            "answer": "Error processing the document in chunks."
-        }
+        except Exception as e:
+            result = {
+                "success": False,
+                "error": f"OpenAI API error: {str(e)}",
+                "answer": "I apologize, but I encountered an error while processing your request. Please try again."
+            }
+        response_data = build_answer_response(document_id, extraction_result, result, start_time)
+        if response_data["success"]:
+            document_cache.set(cache_key, response_data)
+    
+    if response_data["success"]:
+        response_data = {**response_data, "session_id": session["session_id"]}
+        response_data["session_turn"] = record_session_turn(session, question, response_data, chunk_ids)
+    return response_data
 
-# ---------------------------
-# API Endpoints
-# ---------------------------
+def run_session_summary_job(payload, job):
+    """Fold all but the most recent turns of a session into its rolling summary (job kind "session-summary")."""
+    session = conversation_store.get(payload["session_id"], payload["document_id"])
+    if session is None or len(session["turns"]) <= SESSION_RECENT_TURNS:
+        return {"success": True, "folded": 0}
+    
+    folded = session["turns"][:-SESSION_RECENT_TURNS]
+    prompt = SESSION_SUMMARY_TEMPLATE.format(
+        summary=session["summary"] or "(none yet)",
+        turns=format_session_turns(folded)
+    )
+    response = create_chat_completion(
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}
+        ],
+        **SESSION_SUMMARY_PARAMS
+    )
+    applied = conversation_store.fold(
+        session["session_id"], session["document_id"], response.choices[0].message.content.strip(),
+        session["summarized_turns"], folded[-1]["turn"]
+    )
+    return {"success": True, "folded": len(folded) if applied else 0}
 
-@app.route("/api/health", methods=["GET"])
-def health():
-    return jsonify({
-        "status": "healthy",
-        "service": "Chasm AI Document Processing Server",
-        "timestamp": datetime.utcnow().isoformat(),
-        "openai_status": "configured" if os.getenv("OPENAI_API_KEY") else "not_configured",
-        "max_file_size": "50MB"
-    })
+job_queue.register("session-summary", at_priority("background")(run_session_summary_job), priority=1)
 
-@app.route("/api/ping", methods=["GET"])
-def ping():
-    return jsonify({
-        "success": True,
-        "message": "pong",
-        "timestamp": datetime.utcnow().isoformat()
-    })
+@app.route("/api/document/<document_id>/session/<session_id>", methods=["GET"])
+def get_session(document_id, session_id):
+    # A session holds a user's whole Q&A history; only the backend, which owns the ids, may read it
+    denied = backend_only()
+    if denied:
+        return denied
+    session = conversation_store.get(session_id, document_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Session not found"}), 404
+    return jsonify({"success": True, **session})
+
+@app.route("/api/document/<document_id>/session/<session_id>", methods=["DELETE"])
+def delete_session(document_id, session_id):
+    denied = backend_only()
+    if denied:
+        return denied
+    conversation_store.delete(session_id, document_id)
+    return jsonify({"success": True, "session_id": session_id})
 
 @app.route("/api/document/<document_id>/process", methods=["POST"])
 def process_document_question(document_id):
@@ -321,52 +1518,120 @@ def process_document_question(document_id):
         start_time = time.time()
         data = request.get_json()
         
-        if not data or "question" not in data or "file_url" not in data:
-            return jsonify({
-                "success": False,
-                "error": "Missing required fields: question and file_url"
-            }), 400
+        error = validate_question_request(data)
+        if error:
+            return error
         
         question = data["question"].strip()
         file_url = data["file_url"]
-        document_type = data.get("document_type", "application/pdf")
+        document_type = data.get("document_type")
         previous_context = data.get("previous_context", [])
+        session_id = request_session_id(data)
+        
+        print(f"Processing question for document {document_id}: {question[:100]}...")
+        
+        # Extract text from document (served from the text cache when unchanged)
+        extraction_result = extract_document_text(file_url, document_id=document_id, document_type=document_type)
+        
+        if not extraction_result["success"]:
+            return jsonify({
+                "success": False,
+                "documentId": document_id,
+                "error": extraction_result["error"],
+                "answer": f"Unable to extract text from the document. {SUPPORTED_FORMATS_HINT}"
+            })
+        
+        document_text = extraction_result["text"]
+        
+        if not document_text or len(document_text.strip()) < 10:
+            return jsonify({
+                "success": False,
+                "documentId": document_id,
+                "answer": "The document appears to be empty or contains no extractable text."
+            })
+        
+        content_hash = extraction_result["content_hash"]
+        if session_id:
+            # The session's summary and working set replace previous_context
+            session, cache_key = open_session(session_id, document_id, content_hash, question, previous_context)
+            answer = lambda: answer_session_question(document_id, extraction_result, question, session, cache_key, start_time)
+        else:
+            cache_key = AnswerCache.make_key(document_id, content_hash, question, previous_context)
+            answer = lambda: answer_document_question(document_id, extraction_result, question, previous_context, cache_key, start_time)
+        
+        # Check the answer cache for this document version
+        cached_result = document_cache.get(cache_key)
+        if cached_result is not None:
+            print(f"Returning cached result for {cache_key}")
+            if session_id:
+                cached_result = {**cached_result, "session_id": session_id}
+                cached_result["session_turn"] = record_session_turn(session, question, cached_result)
+            return jsonify(cached_result)
         
-        if not question:
+        # Identical questions already in flight wait for that answer instead of calling the model again
+        response_data, shared = answer_flight.do(cache_key, answer)
+        if shared:
+            print(f"Joined in-flight answer for {cache_key}")
+        
+        return jsonify(response_data)
+            
+    except Exception as e:
+        print(f"Error in process_document_question: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"Server error: {str(e)}",
+            "answer": "An internal server error occurred. Please try again."
+        }), 500
+
+@app.route("/api/document/<document_id>/batch", methods=["POST"])
+def process_document_batch(document_id):
+    """Answer several questions about one document, extracting and indexing it once.
+
+    Takes `questions` (a list of strings) instead of `question`; every
+    question shares `previous_context`. Results come back in question order.
+    """
+    try:
+        start_time = time.time()
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get("questions"), list) or "file_url" not in data:
             return jsonify({
                 "success": False,
-                "error": "Question cannot be empty"
+                "error": "Missing required fields: questions (a list) and file_url"
             }), 400
         
-        if len(question) > 1000:
+        questions = [question.strip() if isinstance(question, str) else "" for question in data["questions"]]
+        if not questions:
+            return jsonify({"success": False, "error": "questions cannot be empty"}), 400
+        if len(questions) > BATCH_MAX_QUESTIONS:
             return jsonify({
                 "success": False,
-                "error": "Question too long. Maximum 1000 characters."
+                "error": f"Too many questions. Maximum {BATCH_MAX_QUESTIONS} per request."
             }), 400
+        for i, question in enumerate(questions, 1):
+            if not question or len(question) > 1000:
+                return jsonify({
+                    "success": False,
+                    "error": f"Question {i} must be a non-empty string of at most 1000 characters"
+                }), 400
         
-        print(f"Processing question for document {document_id}: {question[:100]}...")
+        file_url = data["file_url"]
+        document_type = data.get("document_type")
+        previous_context = data.get("previous_context", [])
         
-        # Check cache first
-        cache_key = f"{document_id}_{hashlib.md5(question.encode()).hexdigest()}"
-        if cache_key in document_cache:
-            cached_result = document_cache[cache_key]
-            if time.time() - cached_result["timestamp"] < 3600:  # Cache for 1 hour
-                print(f"Returning cached result for {cache_key}")
-                return jsonify(cached_result["data"])
+        print(f"Processing {len(questions)} questions for document {document_id}")
         
-        # Extract text from document
-        extraction_result = extract_pdf_text_enhanced(file_url)
+        extraction_result = extract_document_text(file_url, document_id=document_id, document_type=document_type)
         
         if not extraction_result["success"]:
             return jsonify({
                 "success": False,
                 "documentId": document_id,
                 "error": extraction_result["error"],
-                "answer": "Unable to extract text from the document. Please ensure it's a valid PDF file."
+                "answer": f"Unable to extract text from the document. {SUPPORTED_FORMATS_HINT}"
             })
         
         document_text = extraction_result["text"]
-        
         if not document_text or len(document_text.strip()) < 10:
             return jsonify({
                 "success": False,
@@ -374,62 +1639,194 @@ def process_document_question(document_id):
                 "answer": "The document appears to be empty or contains no extractable text."
             })
         
-        # Decide processing strategy based on document size
-        word_count = extraction_result["word_count"]
+        answers = answer_document_batch(document_id, extraction_result, questions, previous_context, start_time)
         
-        if word_count > 10000:  # Large document
-            print(f"Processing large document ({word_count} words) in chunks")
-            result = process_large_document_in_chunks(document_text, question)
-        else:  # Small/medium document
-            print(f"Processing document ({word_count} words) directly")
-            result = answer_with_openai(document_text, question, previous_context)
+        results = []
+        counts = {"cached": 0, "packed": 0, "single": 0, "repeated": 0}
+        tokens_used = 0
+        for question, (response_data, source) in zip(questions, answers):
+            counts[source] += 1
+            if source in ("packed", "single"):
+                tokens_used += response_data.get("tokens_used", 0)
+            results.append({
+                "question": question,
+                **{key: value for key, value in response_data.items() if key not in BATCH_SHARED_FIELDS},
+                "cached": source in ("cached", "repeated")
+            })
+        for source, count in counts.items():
+            if count:
+                metrics.inc("batch_questions_total", count, source=source)
         
-        if result["success"]:
+        return jsonify({
+            "success": True,
+            "documentId": document_id,
+            "results": results,
+            "questions_cached": counts["cached"],
+            "questions_packed": counts["packed"],
+            "tokens_used": tokens_used,
+            "processing_time": round(time.time() - start_time, 2),
+            "extraction_time": extraction_result.get("processing_time", 0),
+            "word_count": extraction_result["word_count"],
+            "page_count": extraction_result.get("page_count", 0)
+        })
+    
+    except Exception as e:
+        print(f"Error in process_document_batch: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }), 500
+
+@app.route("/api/document/<document_id>/process/stream", methods=["POST"])
+def stream_document_question(document_id):
+    """Answer a question about a document as Server-Sent Events.
+
+    Emits `meta` once the document is ready, `token` events with answer deltas,
+    then `done` with the same metadata as the non-streaming endpoint (or `error`).
+    """
+    start_time = time.time()
+    data = request.get_json()
+    
+    error = validate_question_request(data)
+    if error:
+        return error
+    
+    question = data["question"].strip()
+    file_url = data["file_url"]
+    document_type = data.get("document_type")
+    previous_context = data.get("previous_context", [])
+    session_id = request_session_id(data)
+    
+    def events():
+        try:
+            extraction_result = extract_document_text(file_url, document_id=document_id, document_type=document_type)
+            
+            if not extraction_result["success"]:
+                yield sse_event("error", {
+                    "documentId": document_id,
+                    "error": extraction_result["error"],
+                    "answer": f"Unable to extract text from the document. {SUPPORTED_FORMATS_HINT}"
+                })
+                return
+            
+            document_text = extraction_result["text"]
+            if not document_text or len(document_text.strip()) < 10:
+                yield sse_event("error", {
+                    "documentId": document_id,
+                    "answer": "The document appears to be empty or contains no extractable text."
+                })
+                return
+            
+            word_count = extraction_result["word_count"]
+            yield sse_event("meta", {
+                "documentId": document_id,
+                "word_count": word_count,
+                "page_count": extraction_result.get("page_count", 0),
+                "extraction_time": extraction_result.get("processing_time", 0)
+            })
+            
+            content_hash = extraction_result["content_hash"]
+            session = None
+            context = previous_context
+            if session_id:
+                session, cache_key = open_session(session_id, document_id, content_hash, question, previous_context)
+                context = session["turns"]
+            else:
+                cache_key = AnswerCache.make_key(document_id, content_hash, question, previous_context)
+            cached_result = document_cache.get(cache_key)
+            if cached_result is not None:
+                if session:
+                    cached_result = {**cached_result, "session_id": session_id}
+                    cached_result["session_turn"] = record_session_turn(session, question, cached_result)
+                yield sse_event("token", {"delta": cached_result["answer"]})
+                yield sse_event("done", {**cached_result, "cached": True})
+                return
+            
+            tokens_used = 0
+            chunks_processed = 1
+            chunks_failed = 0
+            answer_type = "direct"
+            messages = None
+            chunk_ids = None
+            parts = []
+            
+            summary = None
+            if word_count > 10000:
+                index = get_document_index(document_id, content_hash, document_text, LARGE_CHUNK_TOKENS, LARGE_CHUNK_OVERLAP)
+                summary = None if index.search(question, k=1) else cached_summary(document_id, content_hash)
+            
+            if summary:  # No passage matches the question: answer from the cached summary
+                answer_type = "summary"
+                messages = build_answer_messages(summary, question, context)
+            elif word_count > 10000:  # Large document: map chunks concurrently, stream the combine step
+                chunk_answers, tokens_used, chunks_failed = answer_chunks(index.top_chunks(question, k=5), question)
+                if not chunk_answers:
+                    yield sse_event("error", {
+                        "documentId": document_id,
+                        "error": "Could not process any document chunks.",
+                        "answer": "Unable to analyze the document content."
+                    })
+                    return
+                
+                chunks_processed = len(chunk_answers)
+                if len(chunk_answers) == 1:
+                    parts.append(chunk_answers[0]["answer"])
+                    yield sse_event("token", {"delta": parts[0]})
+                else:
+                    answer_type = "combined"
+                    messages = build_answer_messages(build_combine_prompt(chunk_answers, question), COMBINE_QUESTION)
+            elif session:  # Conversation turn: working set of excerpts plus the rolling summary
+                answer_type = "conversation"
+                index = get_document_index(document_id, content_hash, document_text)
+                messages, chunk_ids = build_session_messages(index, session, question)
+            else:
+                document_text = fit_document_to_budget(document_id, content_hash, document_text, question, previous_context)
+                messages = build_answer_messages(document_text, question, previous_context)
+            
+            first_token_time = None
+            if messages:
+                usage = {}
+                for delta in stream_chat_completion(usage, messages=messages, **ANSWER_PARAMS):
+                    if first_token_time is None:
+                        first_token_time = round(time.time() - start_time, 2)
+                    parts.append(delta)
+                    yield sse_event("token", {"delta": delta})
+                tokens_used += usage.get("total_tokens", usage.get("completion_chunks", 0))
+            
             response_data = {
                 "success": True,
                 "documentId": document_id,
-                "answer": result["answer"],
-                "answer_type": result.get("answer_type", "direct"),
+                "answer": "".join(parts).strip(),
+                "answer_type": answer_type,
                 "confidence": 0.9,
                 "processing_time": round(time.time() - start_time, 2),
+                "first_token_time": first_token_time,
                 "extraction_time": extraction_result.get("processing_time", 0),
                 "word_count": word_count,
                 "page_count": extraction_result.get("page_count", 0),
-                "chunks_processed": result.get("chunks_processed", 1),
-                "tokens_used": result.get("tokens_used", 0)
-            }
-            
-            # Cache the result
-            document_cache[cache_key] = {
-                "timestamp": time.time(),
-                "data": response_data
+                "chunks_processed": chunks_processed,
+                "chunks_failed": chunks_failed,
+                "tokens_used": tokens_used
             }
+            document_cache.set(cache_key, response_data)
+            if session:
+                response_data = {**response_data, "session_id": session_id}
+                response_data["session_turn"] = record_session_turn(session, question, response_data, chunk_ids)
+            yield sse_event("done", response_data)
             
-            # Clean old cache entries
-            for key in list(document_cache.keys()):
-                if time.time() - document_cache[key]["timestamp"] > 3600:
-                    del document_cache[key]
-            
-            return jsonify(response_data)
-        else:
-            return jsonify({
-                "success": False,
+        except Exception as e:
+            print(f"Error in stream_document_question: {str(e)}")
+            yield sse_event("error", {
                 "documentId": document_id,
-                "error": result.get("error", "Unknown error"),
-                "answer": result.get("answer", "Error processing document")
+                "error": f"Server error: {str(e)}",
+                "answer": "An internal server error occurred. Please try again."
             })
-            
-    except Exception as e:
-        print(f"Error in process_document_question: {str(e)}")
-        return jsonify({
-            "success": False,
-            "error": f"Server error: {str(e)}",
-            "answer": "An internal server error occurred. Please try again."
-        }), 500
+    
+    return sse_response(events())
 
 @app.route("/api/process-large-document", methods=["POST"])
 def process_large_document():
-    """Background processing endpoint for large documents."""
+    """Queue background extraction of a large document and return a job id immediately."""
     try:
         data = request.get_json()
         
@@ -439,32 +1836,248 @@ def process_large_document():
         document_id = data["document_id"]
         file_url = data["file_url"]
         
-        print(f"Starting background processing for document {document_id}")
+        job_id, deduplicated = job_queue.submit(
+            "extract",
+            {"document_id": document_id, "file_url": file_url, "document_type": data.get("mime_type")},
+            dedup_key=f"extract:{document_id}:{file_url}"
+        )
         
-        # Extract text
-        extraction_result = extract_pdf_text_enhanced(file_url, max_pages=200)
+        print(f"{'Joined existing' if deduplicated else 'Queued'} extraction job {job_id} for document {document_id}")
         
-        if extraction_result["success"]:
-            return jsonify({
-                "success": True,
-                "document_id": document_id,
-                "extracted_text": extraction_result["text"][:50000],  # Return first 50K chars
-                "page_count": extraction_result.get("page_count", 0),
-                "word_count": extraction_result.get("word_count", 0),
-                "processing_time": extraction_result.get("processing_time", 0),
-                "truncated": extraction_result.get("truncated", False)
-            })
-        else:
-            return jsonify({
-                "success": False,
-                "document_id": document_id,
-                "error": extraction_result.get("error", "Extraction failed")
-            })
+        return jsonify({
+            "success": True,
+            "document_id": document_id,
+            "job_id": job_id,
+            "status": "queued",
+            "deduplicated": deduplicated,
+            "status_url": f"/api/jobs/{job_id}",
+            "result_url": f"/api/jobs/{job_id}/result"
+        }), 202
             
     except Exception as e:
         print(f"Error in process_large_document: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# ---------------------------
+# Document Warm-up
+# ---------------------------
+
+# Most warm-up jobs queued or running at once; beyond this new requests are turned away
+WARMUP_MAX_QUEUE = int(os.getenv("WARMUP_MAX_QUEUE", 32))
+
+# Pre-summarize on warm-up: "auto" does it for documents answered in chunks, which fall back to the summary
+WARMUP_SUMMARIZE = os.getenv("WARMUP_SUMMARIZE", "auto").lower()
+
+def is_warm(document_id, content_hash):
+    return text_cache.get(document_id, content_hash, kind="warm") is not None
+
+def warm_caches(document_id, extraction_result, summarize=None, job=None):
+    """Build the chunk index (and optionally the summary) the question endpoints will read for an extraction.
+
+    Returns what was built. A version that is already warm (the same file
+    uploaded again, say) is left alone.
+    """
+    content_hash = extraction_result["content_hash"]
+    if is_warm(document_id, content_hash):
+        return {"already_warm": True}
+    
+    # The index answer_document_question will use for this document's size
+    document_text = extraction_result["text"]
+    large = extraction_result["word_count"] > 10000
+    if large:
+        index = get_document_index(document_id, content_hash, document_text, LARGE_CHUNK_TOKENS, LARGE_CHUNK_OVERLAP)
+    else:
+        index = get_document_index(document_id, content_hash, document_text)
+    warmed = {"chunks": len(index.chunks), "summarized": False}
+    
+    if summarize is None:
+        summarize = WARMUP_SUMMARIZE == "true" or (WARMUP_SUMMARIZE == "auto" and large)
+    if summarize and not (job and job.cancel_requested()) and len(document_text.strip()) >= 50:
+        try:
+            summary_result, _ = answer_flight.do(
+                ("summary", document_id, content_hash),
+                lambda: summarize_document_text(document_id, content_hash, document_text)
+            )
+            warmed["summarized"] = True
+            warmed["tokens_used"] = summary_result["tokens_used"]
+        except Exception as e:
+            # The text and index are still warm; the summary is built on first request instead
+            print(f"Warm-up summary failed for {document_id}: {str(e)}")
+    
+    text_cache.set(document_id, content_hash, {"summarized": warmed["summarized"]}, kind="warm")
+    print(f"Warmed document {document_id} ({warmed['chunks']} chunks)")
+    return warmed
+
+def run_warmup_job(payload, job):
+    """Extract, index and optionally summarize a document ahead of its first question (job kind "warmup").
+
+    Fills the same caches the question and summary endpoints read, so the
+    first question finds the text, chunk index and summary already built.
+    """
+    document_id = payload["document_id"]
+    start_time = time.time()
+    
+    extraction_result = extract_document_text(
+        payload["file_url"], document_id=document_id, document_type=payload.get("document_type")
+    )
+    if not extraction_result["success"]:
+        return {"success": False, "document_id": document_id, "error": extraction_result.get("error", "Extraction failed")}
+    
+    content_hash = extraction_result["content_hash"]
+    result = {
+        "success": True,
+        "document_id": document_id,
+        "content_hash": content_hash,
+        "page_count": extraction_result.get("page_count", 0),
+        "word_count": extraction_result.get("word_count", 0)
+    }
+    if job.cancel_requested():
+        return {"success": False, "document_id": document_id, "error": "Cancelled"}
+    
+    result.update(warm_caches(document_id, extraction_result, payload.get("summarize"), job))
+    result["processing_time"] = round(time.time() - start_time, 2)
+    return result
+
+job_queue.register("warmup", at_priority("background")(run_warmup_job), priority=2)
+
+@app.route("/api/document/<document_id>/warmup", methods=["POST"])
+def warm_document(document_id):
+    """Queue extraction, indexing and (optionally) summarization of a document before anyone asks about it.
+
+    Takes `file_url`, optional `document_type`, optional `summarize` (bool)
+    and optional `content_hash` (SHA-256 of the file): with it, a version
+    that is already warm is answered at once without queueing anything.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or "file_url" not in data:
+            return jsonify({"success": False, "error": "file_url is required"}), 400
+        
+        file_url = data["file_url"]
+        content_hash = data.get("content_hash")
+        if content_hash and is_warm(document_id, content_hash):
+            metrics.inc("warmup_requests_total", result="warm")
+            return jsonify({"success": True, "document_id": document_id, "status": "warm", "content_hash": content_hash})
+        
+        # Warming is best-effort: when the queue is full, the first question just does the work
+        if job_queue.pending("warmup") >= WARMUP_MAX_QUEUE:
+            metrics.inc("warmup_requests_total", result="rejected")
+            response = jsonify({"success": False, "document_id": document_id, "error": "Warm-up queue is full"})
+            response.status_code = 503
+            response.headers["Retry-After"] = "30"
+            return response
+        
+        job_id, deduplicated = job_queue.submit(
+            "warmup",
+            {
+                "document_id": document_id,
+                "file_url": file_url,
+                "document_type": data.get("document_type"),
+                "summarize": data.get("summarize")
+            },
+            dedup_key=f"warmup:{document_id}:{content_hash or file_url}"
+        )
+        metrics.inc("warmup_requests_total", result="deduplicated" if deduplicated else "queued")
+        
+        return jsonify({
+            "success": True,
+            "document_id": document_id,
+            "job_id": job_id,
+            "status": "queued",
+            "deduplicated": deduplicated,
+            "status_url": f"/api/jobs/{job_id}",
+            "result_url": f"/api/jobs/{job_id}/result"
+        }), 202
+    
+    except Exception as e:
+        print(f"Error in warm_document: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/api/document/<document_id>/pages", methods=["GET"])
+def get_document_pages(document_id):
+    """Page through a stored document's full extracted text.
+
+    Query: `file_url` (the document's source, as for the other endpoints),
+    `start` (1-based page, default 1), `count` (default 10), `version`
+    (content hash, default the latest stored). Only the trusted backend may
+    leave out `file_url`, and then must name the version. Pages are the
+    extractor's page or section segments, read straight from the
+    memory-mapped store.
+    """
+    try:
+        start = max(1, int(request.args.get("start", 1)))
+        count = min(MAX_PAGES_PER_REQUEST, max(1, int(request.args.get("count", 10))))
+    except ValueError:
+        return jsonify({"success": False, "error": "start and count must be integers"}), 400
+    
+    version = request.args.get("version")
+    if version is not None and not is_content_hash(version):
+        return jsonify({"success": False, "error": "version must be a content hash (64 hex characters)"}), 400
+    file_url = request.args.get("file_url")
+    if not file_url and not (version and trusted_backend()):
+        return jsonify({"success": False, "error": "file_url is required"}), 400
+    
+    document = document_store.open(document_id, version)
+    # Knowing the document id is not enough: the caller must also know where the document came from
+    if document is not None and file_url and not hmac.compare_digest(
+        document.meta.get("file_url", "").encode("utf-8"), file_url.encode("utf-8")
+    ):
+        document = None
+    if document is None:
+        return jsonify({
+            "success": False,
+            "error": "Document text not stored. Process the document first."
+        }), 404
+    
+    pages = document.pages(start - 1, start - 1 + count)
+    next_start = start + len(pages)
+    return jsonify({
+        "success": True,
+        "document_id": document_id,
+        "version": document.meta["content_hash"],
+        "page_count": document.page_count,
+        "word_count": document.meta.get("word_count", 0),
+        "start": start,
+        "pages": [{"page": start + i, "text": text} for i, text in enumerate(pages)],
+        "next_start": next_start if next_start <= document.page_count else None
+    })
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, **status})
+
+@app.route("/api/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    
+    if status["status"] in ("queued", "running"):
+        return jsonify({"success": False, "job_id": job_id, "status": status["status"], "error": "Job not finished"}), 409
+    
+    result = job_queue.result(job_id)
+    if status["status"] != "completed":
+        return jsonify({
+            "success": False,
+            "job_id": job_id,
+            "status": status["status"],
+            "error": status["error"] or f"Job {status['status']}",
+            **({"document_id": result.get("document_id")} if result else {})
+        })
+    
+    return jsonify({**result, "job_id": job_id, "status": "completed"})
+
+@app.route("/api/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    status = job_queue.cancel(job_id)
+    if status is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "job_id": job_id, "status": status})
+
 @app.route("/api/summarize", methods=["POST"])
 def summarize_document():
     """Generate a summary of the document."""
@@ -475,9 +2088,11 @@ def summarize_document():
             return jsonify({"success": False, "error": "file_url is required"}), 400
         
         file_url = data["file_url"]
+        document_id = data.get("document_id")
+        document_type = data.get("document_type")
         
         # Extract text
-        extraction_result = extract_pdf_text_enhanced(file_url)
+        extraction_result = extract_document_text(file_url, document_id=document_id, document_type=document_type)
         
         if not extraction_result["success"]:
             return jsonify({
@@ -493,30 +2108,17 @@ def summarize_document():
                 "error": "Document text too short for summarization"
             })
         
-        # Generate summary using OpenAI
-        summary_prompt = f"""Please provide a comprehensive summary of the following document. 
-        Include key points, main arguments, and important details.
-        
-        Document:
-        {document_text[:8000]}
-        
-        Summary:"""
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a document summarization expert."},
-                {"role": "user", "content": summary_prompt}
-            ],
-            temperature=0.5,
-            max_tokens=1000
+        # Summarize map-reduce style; identical concurrent requests share one run
+        cache_namespace = document_id or file_url
+        content_hash = extraction_result["content_hash"]
+        summary_result, _ = answer_flight.do(
+            ("summary", cache_namespace, content_hash),
+            lambda: summarize_document_text(cache_namespace, content_hash, document_text)
         )
         
-        summary = response.choices[0].message.content.strip()
-        
         return jsonify({
             "success": True,
-            "summary": summary,
+            **summary_result,
             "word_count": extraction_result.get("word_count", 0),
             "page_count": extraction_result.get("page_count", 0)
         })
@@ -525,6 +2127,87 @@ def summarize_document():
         print(f"Error in summarize_document: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/summarize/stream", methods=["POST"])
+def stream_summary():
+    """Generate a document summary as Server-Sent Events (`meta`, `token`..., `done` or `error`)."""
+    start_time = time.time()
+    data = request.get_json()
+    
+    if not data or "file_url" not in data:
+        return jsonify({"success": False, "error": "file_url is required"}), 400
+    
+    file_url = data["file_url"]
+    document_id = data.get("document_id")
+    document_type = data.get("document_type")
+    
+    def events():
+        try:
+            extraction_result = extract_document_text(file_url, document_id=document_id, document_type=document_type)
+            
+            if not extraction_result["success"]:
+                yield sse_event("error", {"error": extraction_result.get("error", "Extraction failed")})
+                return
+            
+            document_text = extraction_result["text"]
+            if not document_text or len(document_text.strip()) < 50:
+                yield sse_event("error", {"error": "Document text too short for summarization"})
+                return
+            
+            yield sse_event("meta", {
+                "word_count": extraction_result.get("word_count", 0),
+                "page_count": extraction_result.get("page_count", 0),
+                "extraction_time": extraction_result.get("processing_time", 0)
+            })
+            
+            cache_namespace = document_id or file_url
+            content_hash = extraction_result["content_hash"]
+            summary = cached_summary(cache_namespace, content_hash)
+            if summary:
+                yield sse_event("token", {"delta": summary})
+                yield sse_event("done", {
+                    "success": True,
+                    "summary": summary,
+                    "word_count": extraction_result.get("word_count", 0),
+                    "page_count": extraction_result.get("page_count", 0),
+                    "tokens_used": 0,
+                    "cached": True,
+                    "processing_time": round(time.time() - start_time, 2)
+                })
+                return
+            
+            # Section summaries are computed (or reused from cache) up front; the final pass streams
+            text, template, stats = reduce_for_summary(cache_namespace, content_hash, document_text)
+            
+            usage = {}
+            parts = []
+            first_token_time = None
+            for delta in stream_chat_completion(usage, messages=build_summary_messages(text, template), **SUMMARY_PARAMS):
+                if first_token_time is None:
+                    first_token_time = round(time.time() - start_time, 2)
+                parts.append(delta)
+                yield sse_event("token", {"delta": delta})
+            
+            summary = "".join(parts).strip()
+            text_cache.set(cache_namespace, content_hash, {"summary": summary, **stats}, kind="summary")
+            
+            yield sse_event("done", {
+                "success": True,
+                "summary": summary,
+                **stats,
+                "word_count": extraction_result.get("word_count", 0),
+                "page_count": extraction_result.get("page_count", 0),
+                "tokens_used": stats["tokens_used"] + usage.get("total_tokens", usage.get("completion_chunks", 0)),
+                "cached": False,
+                "first_token_time": first_token_time,
+                "processing_time": round(time.time() - start_time, 2)
+            })
+            
+        except Exception as e:
+            print(f"Error in stream_summary: {str(e)}")
+            yield sse_event("error", {"error": str(e)})
+    
+    return sse_response(events())
+
 @app.route("/", methods=["GET"])
 def home():
     return jsonify({
@@ -533,15 +2216,26 @@ def home():
         "version": "2.0.0",
         "endpoints": {
             "POST /api/document/<id>/process": "Ask questions about documents",
-            "POST /api/process-large-document": "Background processing for large documents",
+            "POST /api/document/<id>/process/stream": "Ask questions about documents (Server-Sent Events)",
+            "POST /api/document/<id>/batch": "Ask several questions about a document at once",
+            "GET /api/document/<id>/session/<session_id>": "Conversation session state (backend only)",
+            "DELETE /api/document/<id>/session/<session_id>": "End a conversation session (backend only)",
+            "POST /api/process-large-document": "Queue background processing for large documents",
+            "POST /api/document/<id>/warmup": "Prepare a document (text, index, summary) before its first question",
+            "GET /api/document/<id>/pages": "Page through a processed document's full text",
+            "GET /api/jobs/<job_id>": "Background job status",
+            "GET /api/jobs/<job_id>/result": "Background job result",
+            "DELETE /api/jobs/<job_id>": "Cancel a background job",
             "POST /api/summarize": "Generate document summaries",
+            "POST /api/summarize/stream": "Generate document summaries (Server-Sent Events)",
             "GET /api/health": "Health check",
+            "GET /api/metrics": "Prometheus metrics (per worker process)",
             "GET /api/ping": "Simple ping endpoint"
         },
         "limits": {
             "max_file_size": "50MB",
             "max_pages": "100 (configurable)",
-            "cache_ttl": "1 hour"
+            "cache_ttl": f"{document_cache.ttl} seconds"
         }
     })
 
@@ -573,4 +2267,9 @@ if __name__ == "__main__":
     print(f"Debug mode: {debug}")
     print(f"OpenAI configured: {'Yes' if os.getenv('OPENAI_API_KEY') else 'No'}")
     
+    print("Development server; use `gunicorn -c gunicorn.conf.py app:app` in production")
+    
+    # With the reloader, this block also runs in the watcher process; only the serving child takes jobs
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        init_worker()
     app.run(host="0.0.0.0", port=port, debug=debug, threaded=True)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""Compare the legacy temp-file/`+=` PDF extraction with the streaming and parallel extractors.
+
+Usage: python benchmarks/bench_extraction.py [--pages 200] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extraction
+
+def make_pdf(pages, words_per_page=450):
+    """Build a text-heavy PDF in memory."""
+    doc = fitz.open()
+    sentence = "The quick brown fox jumps over the lazy dog while the committee reviews the report. "
+    words = sentence.split()
+    for page_num in range(pages):
+        page = doc.new_page()
+        body = " ".join(words[i % len(words)] for i in range(words_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), f"Page {page_num + 1}\n{body}", fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def legacy_extract(data, max_pages=200):
+    """The pre-streaming implementation: temp file, `+=` and a full re-split per page."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        tmp_file.write(data)
+        tmp_path = tmp_file.name
+    try:
+        doc = fitz.open(tmp_path)
+        page_count = len(doc)
+        full_text = ""
+        for page_num, page in enumerate(doc, 1):
+            full_text += f"\n--- Page {page_num} ---\n{page.get_text()}\n"
+            if len(full_text.split()) > 100000:
+                full_text += f"\n[Text truncated at page {page_num} due to size limits]\n"
+                break
+        doc.close()
+        cleaned_text = full_text.strip()
+        return {"text": cleaned_text, "page_count": page_count, "word_count": len(cleaned_text.split())}
+    finally:
+        os.unlink(tmp_path)
+
+def measure(fn, data, repeat):
+    timings = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(data, max_pages=10000)
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, min(timings), peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_pdf(args.pages)
+    print(f"Generated {args.pages}-page PDF ({len(data) / 1024:.0f} KB)")
+
+    legacy, legacy_time, legacy_peak = measure(legacy_extract, data, args.repeat)
+
+    # Single process: disable the pool by raising the parallel threshold
+    parallel_min_pages = extraction.PARALLEL_MIN_PAGES
+    extraction.PARALLEL_MIN_PAGES = float("inf")
+    streamed, streamed_time, streamed_peak = measure(extraction.extract_pdf_text, data, args.repeat)
+    extraction.PARALLEL_MIN_PAGES = parallel_min_pages
+
+    rows = [("legacy", legacy_time, legacy_peak), ("streaming", streamed_time, streamed_peak)]
+    results = [streamed]
+
+    if extraction.get_extraction_pool() is not None:
+        extraction.PARALLEL_MIN_PAGES = 1
+        extraction.extract_pdf_text(data, max_pages=10000)  # Warm up the worker processes
+        parallel, parallel_time, parallel_peak = measure(extraction.extract_pdf_text, data, args.repeat)
+        rows.append((f"parallel/{extraction.EXTRACTION_WORKERS}", parallel_time, parallel_peak))
+        results.append(parallel)
+        extraction.shutdown_extraction_pool()
+
+    for result in results:
+        assert legacy["text"] == result["text"], "extractors disagree on text"
+        assert legacy["word_count"] == result["word_count"], "extractors disagree on word count"
+
+    print(f"{'':12} {'time (s)':>10} {'peak (MB)':>10} {'speedup':>8}")
+    for name, elapsed, peak in rows:
+        print(f"{name:12} {elapsed:10.3f} {peak / 1e6:10.2f} {legacy_time / elapsed:7.1f}x")
+    print("(peak memory is traced in this process only; pool workers are not included)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Minimal OpenAI-compatible chat completions server for local testing.
+
+Point the AI server at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Usage: python benchmarks/fake_openai.py [--port 8089] [--latency 0.5] [--rate-limit-every 0]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers /v1/chat/completions after `latency` seconds.
+
+    Streaming requests get the answer word by word as SSE chunks, `token_latency`
+    seconds apart, with a final usage chunk when `stream_options.include_usage`
+    is set.
+
+    Prompts that pack several `### Question N` sections get one `### Answer N`
+    section back for each.
+
+    Every `rate_limit_every`-th request (0 disables) gets a 429 with Retry-After,
+    to exercise client-side backoff.
+    """
+
+    latency = 0.5
+    token_latency = 0.02
+    rate_limit_every = 0
+    request_count = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        cls = type(self)
+        with cls.lock:
+            cls.request_count += 1
+            count = cls.request_count
+
+        if self.rate_limit_every and count % self.rate_limit_every == 0:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                            headers={"Retry-After": "0.1"})
+            return
+
+        time.sleep(self.latency)
+
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        answer = f"Fake answer #{count} for a prompt of {len(prompt)} characters."
+        packed = re.findall(r"^### Question (\d+)$", prompt, re.MULTILINE)
+        if packed:
+            # Several questions in one prompt: one headed section per question
+            answer = "\n\n".join(f"### Answer {n}\n{answer}" for n in packed)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(answer) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+        if payload.get("stream"):
+            self._stream(count, payload, answer, usage)
+            return
+
+        self._send_json(200, {
+            "id": f"chatcmpl-fake-{count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        })
+
+    def _stream(self, count, payload, answer, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def send(chunk):
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        base = {
+            "id": f"chatcmpl-fake-{count}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake")
+        }
+        for i, word in enumerate(answer.split(" ")):
+            send({**base, "choices": [{
+                "index": 0,
+                "delta": {"content": word if i == 0 else " " + word},
+                "finish_reason": None
+            }]})
+            time.sleep(self.token_latency)
+        send({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if payload.get("stream_options", {}).get("include_usage"):
+            send({**base, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def start_fake_openai(port=0, latency=0.5, rate_limit_every=0, token_latency=0.02):
+    """Start the server on a background thread and return (server, base_url)."""
+    handler = type("Handler", (FakeOpenAIHandler,), {
+        "latency": latency,
+        "token_latency": token_latency,
+        "rate_limit_every": rate_limit_every,
+        "request_count": 0,
+        "lock": threading.Lock()
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_openai(args.port, args.latency, args.rate_limit_every)
+    print(f"Fake OpenAI server listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
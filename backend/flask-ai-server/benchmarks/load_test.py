@@ -0,0 +1,145 @@
+"""Load-test the Q&A endpoint under the development server and under gunicorn.
+
+Each server is started as a subprocess against the fake OpenAI server and a
+locally served PDF, warmed up with one question, then sent `--requests`
+distinct questions (so the answer cache never hits) `--concurrency` at a time.
+
+Usage: python benchmarks/load_test.py [--requests 200] [--concurrency 32] [--latency 0.5] [--modes dev,gunicorn]
+"""
+import argparse
+import functools
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+
+# Requests are sent the way the Node backend sends them: with its shared secret and one user id per
+# virtual user, so each is rate-limited as its own user rather than all as this machine's IP
+SERVICE_TOKEN = "load-test"
+
+sys.path.insert(0, BENCH_DIR)
+
+from bench_extraction import make_pdf
+from fake_openai import start_fake_openai
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def serve_directory(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(mode, port, env):
+    if mode == "dev":
+        command = [sys.executable, "app.py"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+    process = subprocess.Popen(
+        command, cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/ping", timeout=1)
+            return process
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+def run_load(port, pdf_url, total, concurrency):
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    url = f"http://127.0.0.1:{port}/api/document/load-test/process"
+
+    def ask(i):
+        start = time.time()
+        headers = {"X-Service-Token": SERVICE_TOKEN, "X-User-ID": f"user-{i % concurrency}"}
+        try:
+            res = session.post(
+                url, json={"question": f"What does section {i} say?", "file_url": pdf_url}, headers=headers, timeout=120
+            )
+            ok = res.status_code == 200 and res.json().get("success")
+        except requests.exceptions.RequestException:
+            ok = False
+        return ok, time.time() - start
+
+    ask(-1)  # Warm up: download, extract and index the document once
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(ask, range(total)))
+    elapsed = time.time() - start
+
+    latencies = sorted(latency for ok, latency in results if ok)
+    return {
+        "ok": len(latencies),
+        "errors": total - len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0,
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99)
+    }
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[max(0, int(round(len(sorted_values) * fraction)) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM latency per call (s)")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--modes", default="dev,gunicorn")
+    args = parser.parse_args()
+
+    _, llm_url = start_fake_openai(latency=args.latency)
+    pdf_dir = tempfile.mkdtemp()
+    with open(os.path.join(pdf_dir, "report.pdf"), "wb") as f:
+        f.write(make_pdf(args.pages))
+    _, files_url = serve_directory(pdf_dir)
+
+    print(f"{args.requests} questions, {args.concurrency} concurrent, fake LLM latency {args.latency}s")
+    print(f"{'':10} {'req/s':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'errors':>7}")
+    for mode in args.modes.split(","):
+        port = free_port()
+        env = {
+            **os.environ,
+            "AI_SERVICE_TOKEN": SERVICE_TOKEN,
+            "OPENAI_BASE_URL": llm_url,
+            "OPENAI_API_KEY": "load-test",
+            "AI_DATA_DIR": tempfile.mkdtemp(),
+            "FLASK_PORT": str(port),
+            "GUNICORN_ACCESS_LOG": "/dev/null"
+        }
+        process = start_server(mode, port, env)
+        try:
+            stats = run_load(port, f"{files_url}/report.pdf", args.requests, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+        print(f"{mode:10} {stats['throughput']:8.1f} {stats['p50']:8.2f} {stats['p95']:8.2f} {stats['errors']:7}")
+
+if __name__ == "__main__":
+    main()
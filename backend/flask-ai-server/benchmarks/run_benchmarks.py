@@ -0,0 +1,267 @@
+"""Benchmark the flask-ai-server pipeline and write the results as JSON.
+
+Generates PDF fixtures (1, 50 and 200 pages, text-heavy and sparse), serves
+them locally and points the app at the fake OpenAI server. Each stage is then
+measured in-process with timing percentiles and peak RSS: download, parse,
+cold end-to-end extraction, chunking and large-document Q&A. Finally the Q&A
+endpoint's throughput and latency percentiles are measured under concurrency
+through load_test.
+
+Usage:
+  python benchmarks/run_benchmarks.py --output baseline.json
+  python benchmarks/run_benchmarks.py --baseline baseline.json --output current.json
+
+With --baseline, every metric is compared and the run exits 1 if any
+regressed by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, SERVER_DIR)
+
+from bench_extraction import make_pdf
+from fake_openai import start_fake_openai
+from load_test import serve_directory, free_port, start_server, run_load, percentile, SERVICE_TOKEN
+
+# name -> (pages, words per page)
+FIXTURES = {
+    "dense-1": (1, 450),
+    "dense-50": (50, 450),
+    "dense-200": (200, 450),
+    "sparse-1": (1, 40),
+    "sparse-50": (50, 40),
+    "sparse-200": (200, 40)
+}
+
+QUESTION = "What does the committee conclude about the report?"
+
+# ---------------------------
+# Measurement
+# ---------------------------
+
+def current_rss():
+    """Resident set size in bytes (Linux /proc; elsewhere the peak so far)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class PeakRSS:
+    """Track peak RSS above the starting level while the block runs, sampling every few ms."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.baseline = self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    @property
+    def delta_mb(self):
+        return (self.peak - self.baseline) / (1024 * 1024)
+
+def measure(fn, repeat):
+    """Run fn(i) `repeat` times; return timing percentiles (seconds) and peak RSS growth."""
+    timings = []
+    with PeakRSS() as rss:
+        for i in range(repeat):
+            start = time.perf_counter()
+            fn(i)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "p95": percentile(timings, 0.95),
+        "peak_rss_mb": round(rss.delta_mb, 2)
+    }
+
+# ---------------------------
+# Benchmarks
+# ---------------------------
+
+def bench_stages(app, files_url, fixtures, repeat):
+    results = {}
+    run_id = int(time.time())
+    for name in fixtures:
+        url = f"{files_url}/{name}.pdf"
+        print(f"  {name}")
+
+        fetched = app.downloader.fetch(url)
+        data = fetched["data"]
+        text = app.extract_document(data, max_pages=1000)["text"]
+
+        def extract_cold(i):
+            # A fresh namespace per run misses both cache tiers
+            result = app.download_and_extract(url, max_pages=1000, document_id=f"bench-{run_id}-{name}-{i}")
+            assert result["success"], result.get("error")
+
+        def answer(i):
+            index = app.get_document_index(f"bench-{run_id}-{name}-qa", fetched["content_hash"], text,
+                                           app.LARGE_CHUNK_TOKENS, app.LARGE_CHUNK_OVERLAP)
+            result = app.process_large_document_in_chunks(text, QUESTION, index=index)
+            assert result["success"], result.get("error")
+
+        results[name] = {
+            "download": measure(lambda i: app.downloader.fetch(url), repeat),
+            "parse": measure(lambda i: app.extract_document(data, max_pages=1000), repeat),
+            "extract_cold": measure(extract_cold, repeat),
+            "chunking": measure(lambda i: app.chunk_text_smart(text), repeat),
+            "qa_large": measure(answer, repeat)
+        }
+    return results
+
+def bench_endpoint(files_url, llm_url, mode, total, concurrency):
+    port = free_port()
+    env = {
+        **os.environ,
+        "AI_SERVICE_TOKEN": SERVICE_TOKEN,
+        "OPENAI_BASE_URL": llm_url,
+        "OPENAI_API_KEY": "benchmark",
+        "AI_DATA_DIR": tempfile.mkdtemp(),
+        "FLASK_PORT": str(port),
+        "GUNICORN_ACCESS_LOG": "/dev/null"
+    }
+    process = start_server(mode, port, env)
+    try:
+        return run_load(port, f"{files_url}/dense-50.pdf", total, concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+# ---------------------------
+# Baseline Comparison
+# ---------------------------
+
+def flatten(results):
+    """Yield (metric path, value, higher_is_better) for every comparable number."""
+    for fixture, stages in results.get("stages", {}).items():
+        for stage, stats in stages.items():
+            yield f"stages.{fixture}.{stage}.median", stats["median"], False
+    for endpoint, stats in results.get("endpoints", {}).items():
+        yield f"endpoints.{endpoint}.throughput", stats["throughput"], True
+        for key in ("p50", "p95", "p99"):
+            yield f"endpoints.{endpoint}.{key}", stats[key], False
+
+def compare(baseline, current, tolerance, min_delta):
+    """Print a comparison table and return the metric paths that regressed.
+
+    Timings that moved by less than min_delta seconds are never flagged, so
+    sub-millisecond noise doesn't fail the run.
+    """
+    base = {path: value for path, value, _ in flatten(baseline)}
+    regressions = []
+    print(f"\n{'metric':55} {'baseline':>10} {'current':>10} {'change':>8}")
+    for path, value, higher_is_better in flatten(current):
+        if path not in base or not base[path]:
+            continue
+        change = value / base[path] - 1
+        worse = -change if higher_is_better else change
+        flag = ""
+        noise = not higher_is_better and abs(value - base[path]) < min_delta
+        if worse > tolerance and not noise:
+            regressions.append(path)
+            flag = "  REGRESSION"
+        print(f"{path:55} {base[path]:10.4f} {value:10.4f} {change:+7.1%}{flag}")
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=SERVER_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before flagging (0.15 = 15%%)")
+    parser.add_argument("--min-delta", type=float, default=0.002, help="ignore timing changes below this (s)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fixtures", default=",".join(FIXTURES))
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency per call (s)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--modes", default="gunicorn", help="servers for the endpoint benchmark; empty to skip")
+    args = parser.parse_args()
+
+    fixtures = [name for name in args.fixtures.split(",") if name]
+    _, llm_url = start_fake_openai(latency=args.latency, token_latency=0)
+    pdf_dir = tempfile.mkdtemp()
+    for name in fixtures:
+        pages, words_per_page = FIXTURES[name]
+        with open(os.path.join(pdf_dir, f"{name}.pdf"), "wb") as f:
+            f.write(make_pdf(pages, words_per_page))
+    _, files_url = serve_directory(pdf_dir)
+
+    # The app reads its configuration at import time
+    os.environ.update({
+        "OPENAI_BASE_URL": llm_url,
+        "OPENAI_API_KEY": "benchmark",
+        "AI_DATA_DIR": tempfile.mkdtemp()
+    })
+    import app
+
+    print("Stage benchmarks")
+    results = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "exact_token_counts": app.token_counter.exact,
+            "args": vars(args)
+        },
+        "stages": bench_stages(app, files_url, fixtures, args.repeat),
+        "endpoints": {}
+    }
+    app.shutdown_extraction_pool()
+
+    for mode in filter(None, args.modes.split(",")):
+        print(f"Endpoint benchmark ({mode})")
+        results["endpoints"][f"qa-{mode}"] = bench_endpoint(files_url, llm_url, mode, args.requests, args.concurrency)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance, args.min_delta)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+import os
+import json
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# ---------------------------
+# In-memory LRU
+# ---------------------------
+
+class LRUCache:
+    """Thread-safe LRU bounded by the total size of its values, with optional TTL."""
+
+    def __init__(self, max_bytes, sizeof=len, ttl=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._expires = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        del self._data[key]
+        self._expires.pop(key, None)
+        self._bytes -= self._sizes.pop(key)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            expires_at = self._expires.get(key)
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value, ttl=None):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        ttl = ttl if ttl is not None else self.ttl
+        now = time.time()
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            if ttl is not None:
+                self._expires[key] = now + ttl
+            self._bytes += size
+
+            # Expired entries collect at the cold end, so this stops at the first live one
+            while self._data:
+                oldest = next(iter(self._data))
+                expires_at = self._expires.get(oldest)
+                if expires_at is None or expires_at > now:
+                    break
+                self._remove(oldest)
+
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+# ---------------------------
+# Extracted Text Cache
+# ---------------------------
+
+def _estimate_size(value):
+    """Approximate memory weight of a cached extraction result or artifact."""
+    if "text" in value:
+        return len(value["text"])
+    if "chunks" in value:
+        return 2 * sum(len(chunk) for chunk in value["chunks"])
+    return len(json.dumps(value))
+
+class ExtractionCache:
+    """Two-tier cache for extracted document text.
+
+    Entries are keyed by a namespace (document id or URL) plus the SHA-256 of
+    the downloaded bytes. The ETag / Last-Modified validators seen for each URL
+    are remembered with the content hash, so an unchanged file can be
+    revalidated with a conditional GET instead of downloaded again.
+    The memory tier is an LRU bounded by text size; the disk tier is a SQLite
+    file with zlib-compressed payloads that survives restarts.
+
+    Artifacts derived from the text (retrieval indexes and the like) are stored
+    under the same key with a `kind` suffix, so they are invalidated with the
+    text they were built from. On disk each kind group ("text", "bm25",
+    "summary", ... -- the kind up to its first colon) has its own entry budget
+    and counters, so a document's many summary nodes or OCR'd pages never push
+    extracted texts out. Groups without an entry in `disk_budgets` get
+    `max_disk_entries`.
+    """
+
+    def __init__(self, cache_dir, max_memory_bytes=256 * 1024 * 1024, max_disk_entries=2000, disk_budgets=None):
+        self.memory = LRUCache(max_memory_bytes, sizeof=_estimate_size)
+        self.max_disk_entries = max_disk_entries
+        self.disk_budgets = dict(disk_budgets or {})
+        self.counters = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "extracted_text.sqlite3")
+        self._conn = None
+        self._pid = None
+
+        db = sqlite3.connect(self.db_path)
+        db.execute("PRAGMA journal_mode=WAL")
+        # The disk tier is only a cache: a layout from before kind groups is dropped, not migrated
+        columns = [row[1] for row in db.execute("PRAGMA table_info(extracted_text)")]
+        if columns and "kind" not in columns:
+            db.execute("DROP TABLE extracted_text")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS extracted_text (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        db.execute("CREATE INDEX IF NOT EXISTS extracted_text_lru ON extracted_text (kind, accessed_at)")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS validators (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT NOT NULL
+            )""")
+        db.commit()
+        db.close()
+
+    @property
+    def _db(self):
+        """This process's connection (callers hold self._lock).
+
+        Opened lazily per process, so a pre-forking server that imports the app
+        in its master never shares a SQLite handle across fork.
+        """
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _key(namespace, content_hash, kind="text"):
+        key = f"{namespace}:{content_hash}"
+        return key if kind == "text" else f"{key}:{kind}"
+
+    @staticmethod
+    def _group(kind):
+        """Budget and counter group of a kind: "bm25:tokens:750:125" -> "bm25"."""
+        return kind.split(":", 1)[0]
+
+    def _budget(self, group):
+        return self.disk_budgets.get(group, self.max_disk_entries)
+
+    def _count(self, group, name):
+        with self._lock:
+            self._counters(group)[name] += 1
+
+    def _counters(self, group):
+        """This group's counters (callers hold self._lock)."""
+        if group not in self.counters:
+            self.counters[group] = {"memory_hits": 0, "disk_hits": 0, "revalidated": 0, "misses": 0, "stores": 0}
+        return self.counters[group]
+
+    def get(self, namespace, content_hash, kind="text"):
+        key = self._key(namespace, content_hash, kind)
+        group = self._group(kind)
+
+        result = self.memory.get(key)
+        if result is not None:
+            self._count(group, "memory_hits")
+            return result
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload FROM extracted_text WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._db.execute(
+                    "UPDATE extracted_text SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                )
+                self._db.commit()
+
+        if row is None:
+            self._count(group, "misses")
+            return None
+
+        result = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        self.memory.set(key, result)
+        self._count(group, "disk_hits")
+        return result
+
+    def set(self, namespace, content_hash, result, kind="text"):
+        key = self._key(namespace, content_hash, kind)
+        group = self._group(kind)
+        self.memory.set(key, result)
+
+        payload = zlib.compress(json.dumps(result).encode("utf-8"), 6)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO extracted_text (key, kind, payload, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, group, payload, time.time())
+            )
+            # Walks the group's newest `budget` rows on the index to find the cut-off, then drops what's older
+            self._db.execute(
+                """DELETE FROM extracted_text WHERE kind = ? AND accessed_at < (
+                       SELECT accessed_at FROM extracted_text WHERE kind = ?
+                       ORDER BY accessed_at DESC LIMIT 1 OFFSET ?
+                   )""",
+                (group, group, max(0, self._budget(group) - 1))
+            )
+            self._db.commit()
+            self._counters(group)["stores"] += 1
+
+    def get_page_text(self, page_hash):
+        """OCR text for a page fingerprint, or None if that page was never recognized."""
+        cached = self.get("pages", page_hash, kind="ocr")
+        return cached["text"] if cached else None
+
+    def set_page_text(self, page_hash, text):
+        self.set("pages", page_hash, {"text": text}, kind="ocr")
+
+    def get_validators(self, namespace, url):
+        """Return {"etag", "last_modified", "content_hash"} last seen for this URL, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, content_hash FROM validators WHERE key = ?",
+                (self._key(namespace, url),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2]}
+
+    def remember_validators(self, namespace, url, etag, last_modified, content_hash):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO validators (key, etag, last_modified, content_hash) VALUES (?, ?, ?, ?)",
+                (self._key(namespace, url), etag, last_modified, content_hash)
+            )
+            self._db.commit()
+
+    def count_revalidation(self):
+        self._count("text", "revalidated")
+
+    def stats(self):
+        """Memory tier totals, plus counters, disk entries and budget per kind group."""
+        with self._lock:
+            counters = {group: dict(group_counters) for group, group_counters in self.counters.items()}
+            disk_entries = dict(self._db.execute("SELECT kind, COUNT(*) FROM extracted_text GROUP BY kind").fetchall())
+            for group in disk_entries:
+                counters.setdefault(group, dict(self._counters(group)))
+
+        kinds = {}
+        for group, group_counters in sorted(counters.items()):
+            lookups = group_counters["memory_hits"] + group_counters["disk_hits"] + group_counters["misses"]
+            hits = group_counters["memory_hits"] + group_counters["disk_hits"]
+            kinds[group] = {
+                **group_counters,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "disk_entries": disk_entries.get(group, 0),
+                "disk_budget": self._budget(group)
+            }
+        return {
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size_bytes,
+            "kinds": kinds
+        }
+
+# ---------------------------
+# Answer Cache
+# ---------------------------
+
+class MemoryBackend:
+    """Answer store local to one process."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.lru = LRUCache(max_bytes, sizeof=lambda v: len(json.dumps(v)))
+
+    def get(self, key):
+        return self.lru.get(key)
+
+    def set(self, key, value, ttl):
+        self.lru.set(key, value, ttl=ttl)
+
+    def stats(self):
+        return {
+            "entries": len(self.lru),
+            "bytes": self.lru.size_bytes,
+            "evictions": self.lru.evictions
+        }
+
+class RedisBackend:
+    """Answer store shared by every worker that points at the same Redis server.
+
+    Redis enforces TTLs itself; size is bounded by the server's maxmemory policy
+    (allkeys-lru is recommended).
+    """
+
+    name = "redis"
+
+    def __init__(self, url, prefix="chasm:answer:"):
+        import redis  # Optional dependency, only needed for the shared backend
+
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.prefix = prefix
+
+    def get(self, key):
+        payload = self.client.get(self.prefix + key)
+        return json.loads(payload) if payload else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl))
+
+    def stats(self):
+        info = self.client.info("memory")
+        return {"used_memory": info.get("used_memory", 0)}
+
+def create_answer_backend(kind, redis_url=None, max_bytes=64 * 1024 * 1024):
+    """Build the configured backend, falling back to process memory if Redis is unavailable."""
+    if kind == "redis" and redis_url:
+        try:
+            backend = RedisBackend(redis_url)
+            backend.client.ping()
+            return backend
+        except Exception as e:
+            print(f"Redis answer cache unavailable ({e}), using in-process cache")
+    return MemoryBackend(max_bytes=max_bytes)
+
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question).strip().casefold()
+
+def normalize_context(previous_context):
+    """Reduce previous Q&A to exactly what reaches the prompt."""
+    return [
+        [normalize_question(qa.get("question", "")), qa.get("answer", "")[:200].strip()]
+        for qa in (previous_context or [])[-3:]
+    ]
+
+class AnswerCache:
+    """TTL cache for generated answers on top of a pluggable backend."""
+
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(document_id, document_version, question, previous_context=None):
+        material = json.dumps([
+            document_id,
+            document_version,
+            normalize_question(question),
+            normalize_context(previous_context)
+        ])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Answer cache read failed: {e}")
+            self._count("errors")
+            return None
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value, self.ttl)
+            self._count("stores")
+        except Exception as e:
+            print(f"Answer cache write failed: {e}")
+            self._count("errors")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        try:
+            backend_stats = self.backend.stats()
+        except Exception:
+            backend_stats = {}
+        return {
+            "backend": self.backend.name,
+            "ttl": self.ttl,
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 3) if lookups else 0.0,
+            **backend_stats
+        }
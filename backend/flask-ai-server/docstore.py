@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import mmap
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:  # Optional: pages are stored uncompressed without it
+    zstandard = None
+
+# File layout (little-endian):
+#   header   magic "CHDS", version u8, flags u8, reserved u16, page_count u32, meta_length u32
+#   meta     JSON, meta_length bytes
+#   offsets  (page_count + 1) u64, page i is data[offsets[i]:offsets[i + 1]]
+#   data     UTF-8 page text, each page zstd-compressed on its own when FLAG_ZSTD is set
+MAGIC = b"CHDS"
+VERSION = 1
+FLAG_ZSTD = 1
+HEADER = struct.Struct("<4sBBHII")
+
+# Versions are SHA-256 content hashes; anything else could name a path outside the store
+CONTENT_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def is_content_hash(value):
+    return isinstance(value, str) and CONTENT_HASH_RE.match(value) is not None
+
+# Where a page (or section) starts in extracted text
+PAGE_MARKER_RE = re.compile(r"^--- (?:Page|Section) \d+ ---$", re.MULTILINE)
+
+def split_pages(text):
+    """Split extracted text at its page/section markers; joining the pages gives the text back."""
+    starts = [match.start() for match in PAGE_MARKER_RE.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+
+# ---------------------------
+# Stored Documents
+# ---------------------------
+
+class StoredDocument:
+    """A read-only, memory-mapped document file.
+
+    Only the header and offset table are parsed on open; page text is sliced
+    out of the map (and decompressed) on demand, so reading a page range
+    touches just those pages. Every process that opens the file shares the
+    same OS page cache.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.flags, _, self.page_count, meta_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} document file")
+
+        self.meta = json.loads(self._map[HEADER.size:HEADER.size + meta_length])
+        offsets_start = HEADER.size + meta_length
+        self._offsets = struct.unpack_from(f"<{self.page_count + 1}Q", self._map, offsets_start)
+        self._data_start = offsets_start + 8 * (self.page_count + 1)
+        self._decompressor = threading.local()
+
+    @property
+    def compressed(self):
+        return bool(self.flags & FLAG_ZSTD)
+
+    @property
+    def size_bytes(self):
+        return len(self._map)
+
+    def page(self, i):
+        """Text of page i (0-based)."""
+        if not 0 <= i < self.page_count:
+            raise IndexError(f"page {i} out of range (document has {self.page_count})")
+        raw = self._map[self._data_start + self._offsets[i]:self._data_start + self._offsets[i + 1]]
+        if self.compressed:
+            decompressor = getattr(self._decompressor, "value", None)
+            if decompressor is None:
+                decompressor = self._decompressor.value = zstandard.ZstdDecompressor()
+            raw = decompressor.decompress(raw)
+        return raw.decode("utf-8")
+
+    def pages(self, start=0, end=None):
+        """Pages [start, end) as a list of strings."""
+        end = self.page_count if end is None else min(end, self.page_count)
+        return [self.page(i) for i in range(max(0, start), end)]
+
+    def text(self, start=0, end=None):
+        return "".join(self.pages(start, end))
+
+    def close(self):
+        self._map.close()
+
+class DocumentStore:
+    """Extracted text on disk, one compact file per document version.
+
+    Files are keyed like the text cache (namespace plus content hash) and
+    written atomically, so readers in any worker never see a partial file.
+    Open files stay mapped in a small LRU. Once the store grows past
+    `max_bytes`, the least recently written files are removed.
+    """
+
+    def __init__(self, root, max_bytes=2 * 1024 * 1024 * 1024, compress=True, compression_level=3, max_open=64):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.compress = compress and zstandard is not None
+        self.compression_level = compression_level
+        self.max_open = max_open
+        self.counters = {"writes": 0, "opens": 0, "removed": 0}
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, namespace):
+        return os.path.join(self.root, hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:32])
+
+    def path(self, namespace, content_hash):
+        if not is_content_hash(content_hash):
+            raise ValueError(f"Not a content hash: {content_hash!r}")
+        return os.path.join(self._dir(namespace), f"{content_hash}.doc")
+
+    def exists(self, namespace, content_hash):
+        return os.path.exists(self.path(namespace, content_hash))
+
+    def write(self, namespace, content_hash, text, meta=None):
+        """Store text split into pages. Returns the file size in bytes."""
+        pages = [page.encode("utf-8") for page in split_pages(text)]
+        flags = 0
+        if self.compress:
+            compressor = zstandard.ZstdCompressor(level=self.compression_level)
+            pages = [compressor.compress(page) for page in pages]
+            flags |= FLAG_ZSTD
+
+        meta_bytes = json.dumps({**(meta or {}), "content_hash": content_hash}).encode("utf-8")
+        offsets = [0]
+        for page in pages:
+            offsets.append(offsets[-1] + len(page))
+
+        path = self.path(namespace, content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, flags, 0, len(pages), len(meta_bytes)))
+            f.write(meta_bytes)
+            f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+            for page in pages:
+                f.write(page)
+            size = f.tell()
+        os.replace(tmp_path, path)
+
+        # The newest version of a document is what page requests without one read
+        latest_tmp = os.path.join(os.path.dirname(path), f"latest.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(latest_tmp, "w") as f:
+            f.write(content_hash)
+        os.replace(latest_tmp, os.path.join(os.path.dirname(path), "latest"))
+
+        with self._lock:
+            self.counters["writes"] += 1
+        self._prune()
+        return size
+
+    def latest(self, namespace):
+        """Content hash of the most recently stored version, or None."""
+        try:
+            with open(os.path.join(self._dir(namespace), "latest")) as f:
+                content_hash = f.read().strip()
+            return content_hash if is_content_hash(content_hash) else None
+        except FileNotFoundError:
+            return None
+
+    def open(self, namespace, content_hash=None):
+        """The stored document (latest version by default), or None if it isn't stored."""
+        content_hash = content_hash or self.latest(namespace)
+        if not content_hash:
+            return None
+        path = self.path(namespace, content_hash)
+
+        with self._lock:
+            document = self._open.get(path)
+            if document is not None:
+                self._open.move_to_end(path)
+                return document
+
+        try:
+            document = StoredDocument(path)
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            self.counters["opens"] += 1
+            self._open[path] = document
+            # Evicted maps are not closed: a request may still be reading one, and the GC unmaps it
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return document
+
+    def _prune(self):
+        files = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            for file in os.scandir(entry.path):
+                if file.name.endswith(".doc"):
+                    stat = file.stat()
+                    files.append((stat.st_mtime, stat.st_size, file.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self._lock:
+                self.counters["removed"] += 1
+                self._open.pop(path, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "open_files": len(self._open),
+                "compression": "zstd" if self.compress else None
+            }
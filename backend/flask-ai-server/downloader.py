@@ -0,0 +1,124 @@
+import hashlib
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ---------------------------
+# Pooled Document Downloads
+# ---------------------------
+
+class Downloader:
+    """Fetch documents over a shared keep-alive session.
+
+    Reuses pooled connections to storage instead of a fresh TCP/TLS handshake
+    per request, revalidates with If-None-Match / If-Modified-Since when the
+    caller knows a previous version, rejects oversized files from
+    Content-Length before reading the body, and resumes interrupted transfers
+    with a Range request when the server supports it.
+    """
+
+    USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+    def __init__(self, max_bytes, pool_size=32, timeout=30, chunk_size=1024 * 1024, resume_attempts=2, session=None):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.resume_attempts = resume_attempts
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        session.headers["User-Agent"] = self.USER_AGENT
+        self.session = session
+
+    def _too_large(self):
+        return {
+            "success": False,
+            "error": f"Document too large. Maximum size is {self.max_bytes // (1024 * 1024)}MB.",
+            "status_code": 413
+        }
+
+    def fetch(self, url, etag=None, last_modified=None):
+        """Download url into memory.
+
+        Returns {"success": True, "not_modified": True} on a 304, otherwise
+        {"success": True, "not_modified": False, "data", "content_hash", "etag",
+        "last_modified"}; failures return {"success": False, "error", "status_code"}.
+        Timeouts propagate as requests exceptions.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        res = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        with res:
+            if res.status_code == 304:
+                return {"success": True, "not_modified": True}
+
+            if res.status_code != 200:
+                return {
+                    "success": False,
+                    "error": f"Failed to download PDF. Status: {res.status_code}",
+                    "status_code": res.status_code
+                }
+
+            content_length = res.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                return self._too_large()
+
+            validators = {
+                "etag": res.headers.get("ETag"),
+                "last_modified": res.headers.get("Last-Modified")
+            }
+            can_resume = res.headers.get("Accept-Ranges") == "bytes" and not res.headers.get("Content-Encoding")
+
+            data = bytearray()
+            digest = hashlib.sha256()
+            response = res
+            attempts = 0
+            try:
+                while True:
+                    try:
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            data += chunk
+                            digest.update(chunk)
+                            if len(data) > self.max_bytes:
+                                return self._too_large()
+                        break
+                    except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+                        if not can_resume or attempts >= self.resume_attempts:
+                            raise
+                        attempts += 1
+                        print(f"Download interrupted at {len(data)} bytes, resuming {url}")
+                        if response is not res:
+                            response.close()
+                        response = self._resume(url, len(data), validators)
+                        if response is None:
+                            raise
+            finally:
+                if response is not None and response is not res:
+                    response.close()
+
+        return {
+            "success": True,
+            "not_modified": False,
+            "data": data,
+            "content_hash": digest.hexdigest(),
+            **validators
+        }
+
+    def _resume(self, url, offset, validators):
+        """Request the rest of the file, or None if the server can't serve that exact range."""
+        headers = {"Range": f"bytes={offset}-"}
+        if validators["etag"] or validators["last_modified"]:
+            headers["If-Range"] = validators["etag"] or validators["last_modified"]
+        response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        content_range = response.headers.get("Content-Range", "")
+        if response.status_code != 206 or not content_range.startswith(f"bytes {offset}-"):
+            response.close()
+            return None
+        return response
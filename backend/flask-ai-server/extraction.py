@@ -0,0 +1,316 @@
+import os
+import io
+import hashlib
+import multiprocessing
+from multiprocessing import shared_memory
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # Optional: scanned pages stay empty without OCR
+    pytesseract = None
+
+# Stop extracting once a document passes roughly this many words
+MAX_WORDS = 100000
+
+# Worker processes for parallel extraction (1 disables the pool)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", min(os.cpu_count() or 1, 8)))
+
+# Documents with fewer pages than this are extracted in the request thread
+PARALLEL_MIN_PAGES = int(os.getenv("EXTRACTION_PARALLEL_MIN_PAGES", 40))
+
+# OCR for image-only pages (needs the tesseract binary as well as pytesseract)
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_PAGE_TIMEOUT = int(os.getenv("OCR_PAGE_TIMEOUT", 60))
+
+# Pages with less text than this that carry images are treated as scans
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", 25))
+
+_pool = None
+_pool_lock = threading.Lock()
+_ocr_available = None
+
+# ---------------------------
+# PDF Page Streaming
+# ---------------------------
+
+def open_pdf(data):
+    """Open a PDF held in memory (bytes, bytearray or memoryview) without touching disk."""
+    return fitz.open(stream=data, filetype="pdf")
+
+def page_segment(page_num, text):
+    return f"\n--- Page {page_num} ---\n{text}\n"
+
+def iter_page_segments(doc):
+    """Lazily yield one marked segment per page, in order."""
+    for page_num, page in enumerate(doc, 1):
+        yield page_segment(page_num, page.get_text())
+
+def iter_counted(segments, max_words=MAX_WORDS):
+    """Yield (segment, running_word_count) for page segments, in order.
+
+    Words are counted per page so the total is never re-tokenized. Stops after
+    the page that crosses `max_words`, yielding a truncation note as the final
+    segment.
+    """
+    word_count = 0
+    for page_num, segment in enumerate(segments, 1):
+        word_count += len(segment.split())
+        yield segment, word_count
+
+        if word_count > max_words:
+            note = f"\n[Text truncated at page {page_num} due to size limits]\n"
+            word_count += len(note.split())
+            yield note, word_count
+            return
+
+def join_segments(segments, max_words=MAX_WORDS):
+    """Join page segments once, returning (text, word_count)."""
+    parts = []
+    word_count = 0
+    for segment, word_count in iter_counted(segments, max_words):
+        parts.append(segment)
+    return "".join(parts), word_count
+
+# ---------------------------
+# OCR Fallback
+# ---------------------------
+
+def ocr_available():
+    """Whether OCR can run here; checked once per process."""
+    global _ocr_available
+    if _ocr_available is None:
+        _ocr_available = False
+        if OCR_ENABLED and pytesseract is not None:
+            try:
+                pytesseract.get_tesseract_version()
+                _ocr_available = True
+            except Exception as e:
+                print(f"OCR unavailable ({e}), image-only pages will be left empty")
+    return _ocr_available
+
+def needs_ocr(page, segment):
+    """A page is a scan if it has next to no text layer but does have images."""
+    text = segment.split("---\n", 1)[-1]
+    return len(text.strip()) < OCR_MIN_TEXT_CHARS and bool(page.get_images(full=False))
+
+def page_fingerprint(page):
+    """Hash of what the page draws (content stream and raw image data) plus the OCR settings.
+
+    Identical scanned pages share OCR results across documents and versions,
+    without rendering the page to find out.
+    """
+    digest = hashlib.sha256(f"{OCR_DPI}:{OCR_LANG}:".encode("utf-8"))
+    digest.update(page.read_contents())
+    for image in page.get_images(full=False):
+        digest.update(page.parent.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+def render_page(page):
+    """Render a page to grayscale PNG bytes at OCR_DPI."""
+    return page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY).tobytes("png")
+
+def _ocr_image(png, lang=OCR_LANG, timeout=OCR_PAGE_TIMEOUT):
+    """Worker: OCR one rendered page."""
+    try:
+        return pytesseract.image_to_string(Image.open(io.BytesIO(png)), lang=lang, timeout=timeout)
+    except Exception as e:
+        # Some pytesseract errors can't be unpickled in the parent, which would break the whole pool
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+def iter_ocr_segments(doc, segments, pool=None, page_cache=None, stats=None):
+    """Yield page segments in order, replacing image-only pages with their OCR text.
+
+    Pages are rendered here and recognized in the pool while later pages are
+    still being read, with at most a few pages per worker in flight. Pages with
+    a text layer pass straight through, and OCR results are cached per page
+    fingerprint so a page is only ever recognized once. A page whose OCR fails
+    keeps its (empty) text layer. `stats["ocr_pages"]` counts recognized pages.
+    """
+    window = 2 * (EXTRACTION_WORKERS if pool is not None else 1)
+    pending = deque()
+    in_flight = {}    # fingerprint -> OCR work, so repeated pages are recognized once
+    recognized = {}   # fingerprint -> text
+
+    def submit(png):
+        nonlocal pool
+        if pool is not None:
+            try:
+                return pool.submit(_ocr_image, png)
+            except BrokenProcessPool:
+                print("Extraction pool crashed, running OCR in-process")
+                shutdown_extraction_pool()
+                pool = None
+        return lambda: _ocr_image(png)
+
+    def ready(item):
+        return isinstance(item, str) or (not callable(item) and item.done())
+
+    def resolve(page_num, item, fingerprint):
+        if isinstance(item, str):
+            return item
+        if fingerprint in recognized:
+            return page_segment(page_num, recognized[fingerprint])
+        try:
+            text = item() if callable(item) else item.result(timeout=OCR_PAGE_TIMEOUT + 5)
+        except Exception as e:
+            print(f"OCR failed for page {page_num}: {type(e).__name__}: {e}")
+            return page_segment(page_num, "")
+        finally:
+            in_flight.pop(fingerprint, None)
+        recognized[fingerprint] = text
+        if page_cache is not None:
+            page_cache.set_page_text(fingerprint, text)
+        return page_segment(page_num, text)
+
+    try:
+        for page_num, segment in enumerate(segments, 1):
+            page = doc[page_num - 1]
+            fingerprint = None
+            if needs_ocr(page, segment):
+                if stats is not None:
+                    stats["ocr_pages"] = stats.get("ocr_pages", 0) + 1
+                fingerprint = page_fingerprint(page)
+                cached = recognized.get(fingerprint)
+                if cached is None and page_cache is not None:
+                    cached = page_cache.get_page_text(fingerprint)
+                if cached is not None:
+                    segment = page_segment(page_num, cached)
+                elif fingerprint in in_flight:
+                    segment = in_flight[fingerprint]
+                else:
+                    segment = in_flight[fingerprint] = submit(render_page(page))
+            pending.append((page_num, segment, fingerprint))
+
+            # Emit finished pages in order; block on the oldest page once the window is full
+            while pending and (ready(pending[0][1]) or len(pending) > window):
+                yield resolve(*pending.popleft())
+
+        while pending:
+            yield resolve(*pending.popleft())
+    finally:
+        # Stopped early (word limit): drop OCR work nobody will read
+        for _, item, _ in pending:
+            if not isinstance(item, str) and not callable(item):
+                item.cancel()
+
+# ---------------------------
+# Parallel Extraction
+# ---------------------------
+
+def get_extraction_pool():
+    """Return the shared process pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None and EXTRACTION_WORKERS > 1:
+            # spawn keeps workers clear of locks held by request threads at fork time
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+def _extract_page_range(shm_name, size, start, stop):
+    """Worker: map the shared document and return the segments for pages [start, stop)."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    view = shm.buf[:size]
+    doc = None
+    try:
+        doc = open_pdf(view)
+        return [page_segment(page_num + 1, doc[page_num].get_text()) for page_num in range(start, stop)]
+    finally:
+        if doc is not None:
+            doc.close()
+        # The document keeps a reference to the view; drop it so the mapping can be closed
+        doc = None
+        view.release()
+        shm.close()
+
+def extract_segments_parallel(data, page_count, pool):
+    """Split the page range across the pool and return segments in page order.
+
+    The document is copied once into a shared memory block that every worker
+    maps, rather than pickled to each slice's worker.
+    """
+    slices = min(EXTRACTION_WORKERS, page_count)
+    step = -(-page_count // slices)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+        futures = [
+            pool.submit(_extract_page_range, shm.name, len(data), start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+
+        segments = []
+        for future in futures:
+            segments.extend(future.result())
+        return segments
+    finally:
+        shm.close()
+        shm.unlink()
+
+def extract_pdf_text(data, max_pages=100, max_words=MAX_WORDS, page_cache=None):
+    """Extract text from PDF bytes, joining page segments once at the end.
+
+    Documents with at least PARALLEL_MIN_PAGES pages are split across the
+    extraction pool; smaller ones, or any run where the pool is unavailable,
+    are extracted in the calling thread. Image-only pages are OCR'd when OCR is
+    available; `page_cache` (get_page_text / set_page_text) keeps their text.
+    """
+    doc = open_pdf(data)
+    try:
+        page_count = doc.page_count
+
+        if page_count > max_pages:
+            return {
+                "success": False,
+                "error": f"PDF too large. Maximum {max_pages} pages allowed. This PDF has {page_count} pages.",
+                "text": "",
+                "page_count": page_count,
+                "word_count": 0
+            }
+
+        segments = None
+        pool = get_extraction_pool() if page_count >= PARALLEL_MIN_PAGES else None
+        if pool is not None:
+            try:
+                segments = extract_segments_parallel(data, page_count, pool)
+            except BrokenProcessPool:
+                print("Extraction pool crashed, falling back to single-process extraction")
+                shutdown_extraction_pool()
+
+        if segments is None:
+            segments = iter_page_segments(doc)
+
+        ocr_stats = {"ocr_pages": 0}
+        if ocr_available():
+            segments = iter_ocr_segments(doc, segments, get_extraction_pool(), page_cache, ocr_stats)
+
+        text, word_count = join_segments(segments, max_words)
+
+        return {
+            "success": True,
+            "text": text.strip(),
+            "page_count": page_count,
+            "word_count": word_count,
+            "truncated": word_count > max_words,
+            "ocr_pages": ocr_stats["ocr_pages"]
+        }
+    finally:
+        doc.close()
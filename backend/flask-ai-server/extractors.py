@@ -0,0 +1,386 @@
+import io
+import csv
+import codecs
+import hashlib
+import zipfile
+import xml.etree.ElementTree as ET
+
+from extraction import (
+    MAX_WORDS, OCR_DPI, OCR_LANG, OCR_PAGE_TIMEOUT,
+    extract_pdf_text, join_segments, page_segment, ocr_available, get_extraction_pool, _ocr_image
+)
+
+# Target size of one section of a non-paged document, in characters (about a page)
+SECTION_CHARS = 4000
+
+# Bytes decoded per step when streaming plain text
+DECODE_CHUNK_BYTES = 64 * 1024
+
+CSV_ROWS_PER_SECTION = 50
+
+# Refuse DOCX files whose document XML inflates past this (zip bombs)
+DOCX_MAX_XML_BYTES = 200 * 1024 * 1024
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+MIME_ALIASES = {
+    "image/jpg": "image/jpeg",
+    "image/pjpeg": "image/jpeg",
+    "text/x-markdown": "text/markdown",
+    "application/csv": "text/csv",
+    "text/comma-separated-values": "text/csv",
+    "application/x-pdf": "application/pdf"
+}
+
+EXTRACTORS = {}
+
+def register_extractor(*mime_types):
+    """Register fn(data, max_pages, max_words, page_cache) -> extraction result for these types."""
+    def decorator(fn):
+        for mime_type in mime_types:
+            EXTRACTORS[mime_type] = fn
+        return fn
+    return decorator
+
+def section_segment(section_num, text):
+    return f"\n--- Section {section_num} ---\n{text}\n"
+
+# ---------------------------
+# Type Detection
+# ---------------------------
+
+def normalize_mime(mime_type):
+    mime_type = (mime_type or "").split(";")[0].strip().lower()
+    return MIME_ALIASES.get(mime_type, mime_type)
+
+def sniff_mime(data):
+    """Recognize binary formats by their signature; anything else is treated as text."""
+    head = bytes(data[:16])
+    if head.startswith(b"%PDF"):
+        return "application/pdf"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                if "word/document.xml" in archive.namelist():
+                    return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        except zipfile.BadZipFile:
+            pass
+        return "application/zip"
+    if head.startswith(b"\xd0\xcf\x11\xe0"):
+        # Legacy Office (.doc/.xls/.ppt) compound file
+        return "application/x-ole-storage"
+    return "text/plain"
+
+def resolve_mime(data, declared):
+    """The type to extract as: a recognized binary signature wins, otherwise the declared type.
+
+    Bytes without a signature are only read as text when the declared type is
+    a text type (or missing/generic), so an unsupported binary isn't decoded
+    as garbage.
+    """
+    sniffed = sniff_mime(data)
+    if sniffed != "text/plain":
+        return sniffed
+    declared = normalize_mime(declared)
+    if declared.startswith("text/"):
+        return declared if declared in EXTRACTORS else sniffed
+    return declared if declared not in ("", "application/octet-stream") else sniffed
+
+def extract_document(data, mime_type=None, max_pages=100, max_words=MAX_WORDS, page_cache=None):
+    """Extract text from a downloaded document with the extractor registered for its type.
+
+    Every format returns the same result shape as extract_pdf_text, with text
+    split into `--- Page N ---` or `--- Section N ---` segments.
+    """
+    resolved = resolve_mime(data, mime_type)
+    extractor = EXTRACTORS.get(resolved)
+    if extractor is None:
+        return {
+            "success": False,
+            "error": f"Unsupported document type: {mime_type or resolved}",
+            "text": "",
+            "page_count": 0,
+            "word_count": 0
+        }
+
+    try:
+        result = extractor(data, max_pages=max_pages, max_words=max_words, page_cache=page_cache)
+    except (zipfile.BadZipFile, ET.ParseError, csv.Error, UnicodeError, ValueError) as e:
+        return {
+            "success": False,
+            "error": f"Could not read {resolved} document: {str(e)}",
+            "text": "",
+            "page_count": 0,
+            "word_count": 0
+        }
+    result.setdefault("ocr_pages", 0)
+    result["document_type"] = resolved
+    return result
+
+register_extractor("application/pdf")(extract_pdf_text)
+
+# ---------------------------
+# Plain Text Formats
+# ---------------------------
+
+def detect_encoding(data):
+    """BOM first, then UTF-8 if the start of the file decodes cleanly, else Windows-1252."""
+    head = bytes(data[:4])
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    view = memoryview(data)
+    sample_end = min(len(data), DECODE_CHUNK_BYTES)
+    if sample_end < len(data):
+        sample_end = data.rfind(b"\n", 0, sample_end) + 1 or sample_end
+    try:
+        str(view[:sample_end], "utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of the sample still means UTF-8
+        return "utf-8" if e.start >= sample_end - 3 else "cp1252"
+
+def iter_decoded(data, encoding, chunk_bytes=DECODE_CHUNK_BYTES):
+    """Decode the buffer a chunk at a time through memoryview slices (no copy of the bytes).
+
+    Chunks end just after a newline, so lines never straddle two chunks.
+    """
+    view = memoryview(data)
+    if encoding == "utf-16":
+        yield str(view, encoding, "replace")
+        return
+
+    start, size = 0, len(data)
+    while start < size:
+        end = min(start + chunk_bytes, size)
+        if end < size:
+            newline = data.rfind(b"\n", start, end)
+            if newline != -1:
+                end = newline + 1
+            else:
+                # No line break: at least don't cut a UTF-8 character in half
+                while end > start + 1 and (data[end] & 0xC0) == 0x80:
+                    end -= 1
+        yield str(view[start:end], encoding, "replace")
+        start = end
+
+def iter_lines(data):
+    for chunk in iter_decoded(data, detect_encoding(data)):
+        yield from chunk.splitlines(keepends=True)
+
+def group_sections(lines, starts_section=None, max_chars=SECTION_CHARS):
+    """Group lines into section segments of about max_chars.
+
+    Sections prefer to end before a blank line once half full, and always start
+    at a line for which starts_section(line) is true.
+    """
+    current, size, section_num = [], 0, 0
+    for line in lines:
+        blank = not line.strip()
+        if current and ((starts_section is not None and starts_section(line))
+                        or size >= max_chars or (blank and size >= max_chars // 2)):
+            text = "".join(current).strip()
+            if text:
+                section_num += 1
+                yield section_segment(section_num, text)
+            current, size = [], 0
+        if blank and not current:
+            continue
+        current.append(line)
+        size += len(line)
+
+    text = "".join(current).strip()
+    if text:
+        yield section_segment(section_num + 1, text)
+
+def text_result(segments, max_words):
+    """Join section segments into the shared extraction result shape."""
+    sections = 0
+
+    def counted():
+        nonlocal sections
+        for segment in segments:
+            sections += 1
+            yield segment
+
+    text, word_count = join_segments(counted(), max_words)
+    return {
+        "success": True,
+        "text": text.strip(),
+        "page_count": sections,
+        "word_count": word_count,
+        "truncated": word_count > max_words
+    }
+
+@register_extractor("text/plain")
+def extract_plain_text(data, max_pages=100, max_words=MAX_WORDS, page_cache=None):
+    return text_result(group_sections(iter_lines(data)), max_words)
+
+@register_extractor("text/markdown")
+def extract_markdown(data, max_pages=100, max_words=MAX_WORDS, page_cache=None):
+    """Markdown keeps its syntax; sections start at headings outside code fences."""
+    in_fence = False
+
+    def starts_section(line):
+        nonlocal in_fence
+        stripped = line.lstrip()
+        if stripped.startswith(("```", "~~~")):
+            in_fence = not in_fence
+            return False
+        return not in_fence and stripped.startswith("#")
+
+    return text_result(group_sections(iter_lines(data), starts_section), max_words)
+
+@register_extractor("text/csv", "text/tab-separated-values")
+def extract_csv(data, max_pages=100, max_words=MAX_WORDS, page_cache=None):
+    """Rows are rendered as `a | b | c` in sections of CSV_ROWS_PER_SECTION, each repeating the header."""
+    encoding = detect_encoding(data)
+    sample = next(iter_decoded(data, encoding, chunk_bytes=8192), "")
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel_tab if b"\t" in data[:8192] and b"," not in data[:8192] else csv.excel
+
+    def lines():
+        for chunk in iter_decoded(data, encoding):
+            yield from chunk.splitlines(keepends=True)
+
+    def segments():
+        reader = csv.reader(lines(), dialect)
+        header = next(reader, None)
+        if header is None:
+            return
+        header_line = " | ".join(header)
+        rows, section_num = [], 0
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            rows.append(" | ".join(row))
+            if len(rows) == CSV_ROWS_PER_SECTION:
+                section_num += 1
+                yield section_segment(section_num, header_line + "\n" + "\n".join(rows))
+                rows = []
+        if rows or section_num == 0:
+            yield section_segment(section_num + 1, header_line + ("\n" + "\n".join(rows) if rows else ""))
+
+    return text_result(segments(), max_words)
+
+# ---------------------------
+# Word Documents
+# ---------------------------
+
+PAGE_BREAK = None
+
+def iter_docx_paragraphs(data):
+    """Stream paragraph texts out of word/document.xml; PAGE_BREAK marks explicit page breaks.
+
+    Table rows come out as one `cell | cell` line each.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        info = archive.getinfo("word/document.xml")
+        if info.file_size > DOCX_MAX_XML_BYTES:
+            raise ValueError("document body is too large")
+
+        with archive.open(info) as xml:
+            parts, cells = [], []
+            table_depth = 0
+            for event, elem in ET.iterparse(xml, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    if tag == WORD_NS + "tbl":
+                        table_depth += 1
+                    continue
+
+                if tag == WORD_NS + "t":
+                    parts.append(elem.text or "")
+                elif tag == WORD_NS + "tab":
+                    parts.append("\t")
+                elif tag in (WORD_NS + "br", WORD_NS + "cr"):
+                    if elem.get(WORD_NS + "type") == "page" and not table_depth:
+                        if parts:
+                            yield "".join(parts)
+                            parts = []
+                        yield PAGE_BREAK
+                    else:
+                        parts.append("\n")
+                elif tag == WORD_NS + "p":
+                    if table_depth:
+                        parts.append(" ")
+                    else:
+                        if parts:
+                            yield "".join(parts)
+                            parts = []
+                        elem.clear()
+                elif tag == WORD_NS + "tc":
+                    cells.append("".join(parts).strip())
+                    parts = []
+                elif tag == WORD_NS + "tr":
+                    if any(cells):
+                        yield " | ".join(cells)
+                    cells = []
+                    elem.clear()
+                elif tag == WORD_NS + "tbl":
+                    table_depth -= 1
+                    elem.clear()
+
+@register_extractor("application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+def extract_docx(data, max_pages=100, max_words=MAX_WORDS, page_cache=None):
+    """DOCX without python-docx: sections break at explicit page breaks or every SECTION_CHARS."""
+    def lines():
+        for paragraph in iter_docx_paragraphs(data):
+            yield "\f" if paragraph is PAGE_BREAK else paragraph + "\n"
+
+    segments = group_sections(lines(), starts_section=lambda line: line == "\f")
+    return text_result((segment.replace("\f", "") for segment in segments), max_words)
+
+# ---------------------------
+# Images
+# ---------------------------
+
+@register_extractor("image/png", "image/jpeg", "image/gif", "image/tiff", "image/bmp", "image/webp")
+def extract_image(data, max_pages=100, max_words=MAX_WORDS, page_cache=None):
+    """OCR a single image, cached by the hash of its bytes like a scanned PDF page."""
+    if not ocr_available():
+        return {
+            "success": False,
+            "error": "Text recognition for images is not available on this server.",
+            "text": "",
+            "page_count": 1,
+            "word_count": 0
+        }
+
+    image = bytes(data)
+    fingerprint = hashlib.sha256(f"{OCR_DPI}:{OCR_LANG}:".encode("utf-8") + image).hexdigest()
+    text = page_cache.get_page_text(fingerprint) if page_cache is not None else None
+    if text is None:
+        pool = get_extraction_pool()
+        try:
+            text = pool.submit(_ocr_image, image).result(timeout=OCR_PAGE_TIMEOUT + 5) if pool else _ocr_image(image)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Text recognition failed: {str(e)}",
+                "text": "",
+                "page_count": 1,
+                "word_count": 0
+            }
+        if page_cache is not None:
+            page_cache.set_page_text(fingerprint, text)
+
+    result = text_result([page_segment(1, text.strip())], max_words)
+    result["ocr_pages"] = 1
+    return result
@@ -0,0 +1,40 @@
+"""Production settings: `gunicorn -c gunicorn.conf.py app:app` from this directory.
+
+Requests spend most of their time waiting on downloads and the LLM, so each
+worker process runs a pool of threads; extra processes add CPU for PDF
+parsing. The app (and its OpenAI client) is imported once in the master and
+forked, and SIGTERM drains in-flight requests for up to `graceful_timeout`.
+
+Each worker keeps its own in-memory caches. The extraction cache's SQLite
+tier is shared by every worker on the host, and answers are shared too when
+ANSWER_CACHE_BACKEND=redis. Each worker also has its own extraction process
+pool, sized so that together they use about one process per core.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('FLASK_PORT', 5001)}")
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", max(2, multiprocessing.cpu_count())))
+threads = int(os.getenv("GUNICORN_THREADS", 32))
+preload_app = True
+
+# Each worker starts its own extraction pool; split the cores between them rather than
+# letting every worker spawn one process per core. The app is preloaded after this file runs.
+os.environ.setdefault("EXTRACTION_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
+
+# Streamed answers keep a request open well past a single LLM call
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+def post_worker_init(worker):
+    from app import init_worker
+    init_worker()
+
+def worker_exit(server, worker):
+    from app import shutdown_worker
+    shutdown_worker(timeout=graceful_timeout)
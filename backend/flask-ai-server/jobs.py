@@ -0,0 +1,314 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+# ---------------------------
+# Persistent Job Queue
+# ---------------------------
+
+class JobQueue:
+    """SQLite-backed job queue worked by a small pool of background threads.
+
+    Jobs survive restarts: anything still queued is picked up again. A running
+    job holds a lease that its process renews every `lease_seconds / 3`, so a
+    job left `running` by a dead process is requeued once its lease expires,
+    however long a live one takes. Queued jobs are claimed by their kind's
+    priority (lower first, set at register()), then in arrival order.
+    Submitting a job whose dedup key matches a queued or running job returns
+    the existing job instead of a new one. Handlers receive (payload, job) and
+    return a result dict; a result with `"success": False` marks the job failed.
+    Long handlers should check `job.cancel_requested()` between steps.
+    """
+
+    def __init__(self, db_path, workers=2, lease_seconds=60, retention=86400):
+        self.handlers = {}
+        self.priorities = {}
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+        self._heartbeat_thread = None
+        self._running = set()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self._conn = None
+        self._pid = None
+
+        db = sqlite3.connect(db_path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                dedup_key TEXT,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result BLOB,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                lease_expires_at REAL
+            )""")
+        # Queues created before priorities and leases keep their jobs
+        columns = [row[1] for row in db.execute("PRAGMA table_info(jobs)")]
+        if "priority" not in columns:
+            db.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        if "lease_expires_at" not in columns:
+            db.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, created_at)")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status)")
+        db.commit()
+        db.close()
+
+    @property
+    def _db(self):
+        """This process's connection (callers hold self._lock), opened lazily so it never crosses a fork."""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    def register(self, kind, handler, priority=0):
+        self.handlers[kind] = handler
+        self.priorities[kind] = priority
+
+    def start(self):
+        """Start the worker threads and the lease heartbeat (once per process)."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop(self, timeout=30):
+        """Stop taking jobs and wait up to `timeout` seconds for running ones.
+
+        Jobs still running afterwards are put back in the queue for another
+        process rather than waiting out their lease.
+        """
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+        deadline = time.time() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.time()))
+        self._threads = []
+        # Leases are renewed while running jobs drain, then handed back below
+        self._stopped.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+
+        with self._lock:
+            unfinished = list(self._running)
+            for job_id in unfinished:
+                self._db.execute(
+                    """UPDATE jobs SET status = 'queued', started_at = NULL, lease_expires_at = NULL
+                       WHERE id = ? AND status = 'running'""",
+                    (job_id,)
+                )
+            self._db.commit()
+        if unfinished:
+            print(f"Requeued {len(unfinished)} unfinished job(s) on shutdown")
+
+    # --- Submission and status ---
+
+    def submit(self, kind, payload, dedup_key=None):
+        """Queue a job. Returns (job_id, deduplicated)."""
+        now = time.time()
+        with self._lock:
+            if dedup_key:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running') LIMIT 1",
+                    (dedup_key,)
+                ).fetchone()
+                if row:
+                    return row[0], True
+
+            job_id = uuid.uuid4().hex
+            self._db.execute(
+                """INSERT INTO jobs (id, kind, dedup_key, status, payload, created_at, priority)
+                   VALUES (?, ?, ?, 'queued', ?, ?, ?)""",
+                (job_id, kind, dedup_key, json.dumps(payload), now, self.priorities.get(kind, 0))
+            )
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed', 'cancelled') AND finished_at < ?",
+                (now - self.retention,)
+            )
+            self._db.commit()
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id, False
+
+    def status(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                """SELECT id, kind, status, error, cancel_requested, created_at, started_at, finished_at, priority
+                   FROM jobs WHERE id = ?""",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[2] == "queued":
+                position = self._db.execute(
+                    """SELECT COUNT(*) FROM jobs WHERE status = 'queued'
+                       AND (priority < ? OR (priority = ? AND created_at < ?))""",
+                    (row[8], row[8], row[5])
+                ).fetchone()[0]
+
+        return {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "error": row[3],
+            "cancel_requested": bool(row[4]),
+            "queue_position": position,
+            "created_at": row[5],
+            "started_at": row[6],
+            "finished_at": row[7]
+        }
+
+    def result(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row or row[0] is None:
+            return None
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def cancel(self, job_id):
+        """Cancel a queued job immediately, or flag a running one. Returns the new status."""
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] == "queued":
+                self._db.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (time.time(), job_id)
+                )
+            elif row[0] == "running":
+                self._db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            self._db.commit()
+            return "cancelled" if row[0] == "queued" else row[0]
+
+    def pending(self, kind):
+        """Jobs of this kind queued or running, across every process sharing the queue."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE kind = ? AND status IN ('queued', 'running')", (kind,)
+            ).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"workers": self.workers, **{status: count for status, count in rows}}
+
+    # --- Workers ---
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            # Requeue jobs orphaned by a crashed process: nothing has renewed their lease.
+            # A lease-less running job predates leases; its process has since restarted.
+            self._db.execute(
+                """UPDATE jobs SET status = 'queued', started_at = NULL, lease_expires_at = NULL
+                   WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)""",
+                (now,)
+            )
+            row = self._db.execute(
+                "SELECT id, kind, payload FROM jobs WHERE status = 'queued' ORDER BY priority, created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                self._db.commit()
+                return None
+            claimed = self._db.execute(
+                """UPDATE jobs SET status = 'running', started_at = ?, lease_expires_at = ?
+                   WHERE id = ? AND status = 'queued'""",
+                (now, now + self.lease_seconds, row[0])
+            ).rowcount
+            self._db.commit()
+        return Job(self, row[0], row[1], json.loads(row[2])) if claimed else None
+
+    def _finish(self, job_id, status, result=None, error=None):
+        payload = zlib.compress(json.dumps(result).encode("utf-8")) if result is not None else None
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, payload, error, time.time(), job_id)
+            )
+            self._db.commit()
+
+    def _heartbeat(self):
+        """Renew the leases of this process's running jobs until the queue stops."""
+        while not self._stopped.wait(self.lease_seconds / 3):
+            with self._lock:
+                if not self._running:
+                    continue
+                running = list(self._running)
+                self._db.execute(
+                    f"""UPDATE jobs SET lease_expires_at = ?
+                        WHERE status = 'running' AND id IN ({", ".join("?" * len(running))})""",
+                    (time.time() + self.lease_seconds, *running)
+                )
+                self._db.commit()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job = self._claim()
+            if job is None:
+                # Poll as well as wait, so jobs queued by other processes are picked up
+                with self._wakeup:
+                    self._wakeup.wait(timeout=2)
+                continue
+
+            with self._lock:
+                self._running.add(job.id)
+            handler = self.handlers.get(job.kind)
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler registered for job kind '{job.kind}'")
+                result = handler(job.payload, job)
+                if job.cancel_requested():
+                    self._finish(job.id, "cancelled")
+                elif result.get("success", True):
+                    self._finish(job.id, "completed", result=result)
+                else:
+                    self._finish(job.id, "failed", result=result, error=result.get("error"))
+            except Exception as e:
+                print(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+                self._finish(job.id, "failed", error=str(e))
+            finally:
+                with self._lock:
+                    self._running.discard(job.id)
+
+class Job:
+    def __init__(self, queue, job_id, kind, payload):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+
+    def cancel_requested(self):
+        with self.queue._lock:
+            row = self.queue._db.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)
+            ).fetchone()
+        return bool(row and row[0])
@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from types import SimpleNamespace
+
+# Several prompts packed into one: numbered `### Question N` sections in,
+# `### Answer N` sections out
+PACKED_TASKS_TEMPLATE = """Complete each of the independent tasks below on its own.
+Start each answer on a new line with the header "### Answer N", where N is the task's number, and answer the tasks in order.
+
+{tasks}"""
+
+PACKED_ANSWER_RE = re.compile(r"^#{1,3}\s*Answer\s+(\d+)\s*:?\s*$", re.MULTILINE)
+
+def format_packed_questions(texts):
+    return "\n\n".join(f"### Question {i}\n{text}" for i, text in enumerate(texts, 1))
+
+def split_packed_answers(reply, count):
+    """Split a packed reply into `count` answers; None where the reply has no section for one."""
+    answers = [None] * count
+    parts = PACKED_ANSWER_RE.split(reply or "")
+    for number, text in zip(parts[1::2], parts[2::2]):
+        i = int(number) - 1
+        if 0 <= i < count and text.strip():
+            answers[i] = text.strip()
+    return answers
+
+def route_model(route, default):
+    """Model for an endpoint route: LLM_MODEL_<ROUTE>, else LLM_MODEL (one local model for everything), else default."""
+    return os.getenv(f"LLM_MODEL_{route.upper()}") or os.getenv("LLM_MODEL") or default
+
+def completion_response(content, total_tokens, model=None):
+    """A chat completion shaped like the OpenAI SDK's, for responses built locally."""
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+        usage=SimpleNamespace(total_tokens=total_tokens)
+    )
+
+# ---------------------------
+# Backends
+# ---------------------------
+
+class OpenAIBackend:
+    """Any OpenAI-compatible chat completions server.
+
+    With base_url this is a local or self-hosted server (vLLM, llama.cpp,
+    Ollama, ...) instead of OpenAI. One pooled HTTP client is kept for the
+    process, so connections are reused across requests.
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key=None, base_url=None, timeout=60, max_connections=64):
+        import httpx
+        from openai import OpenAI
+
+        self.base_url = base_url
+        self.client = OpenAI(
+            # Local servers usually ignore the key, but the SDK insists on one
+            api_key=api_key or ("not-needed" if base_url else None),
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0,
+            http_client=httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        )
+
+    def complete(self, **kwargs):
+        return self.client.chat.completions.create(**kwargs)
+
+class FakeBackend:
+    """Deterministic in-process backend for tests: no network, same answer for the same prompt.
+
+    Packed prompts (`### Question N` sections) get one `### Answer N`
+    section back per question, and streaming yields the answer word by word.
+    """
+
+    name = "fake"
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, messages, model=None, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+
+        prompt = messages[-1]["content"]
+        digest = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()[:12]
+        answer = f"Fake answer {digest} for a prompt of {len(prompt)} characters."
+        packed = re.findall(r"^### Question (\d+)$", prompt, re.MULTILINE)
+        if packed:
+            answer = "\n\n".join(f"### Answer {n}\n{answer} (part {n})" for n in packed)
+        total_tokens = sum(len(message["content"]) for message in messages) // 4 + len(answer) // 4
+
+        if not stream:
+            return completion_response(answer, total_tokens, model)
+        return self._stream(answer, total_tokens, kwargs.get("extra_body") or {})
+
+    def _stream(self, answer, total_tokens, extra_body):
+        for i, word in enumerate(answer.split(" ")):
+            delta = SimpleNamespace(content=word if i == 0 else " " + word)
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)], usage=None)
+        if extra_body.get("stream_options", {}).get("include_usage"):
+            yield SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=total_tokens))
+
+def create_llm_backend(kind, api_key=None, base_url=None, timeout=60, max_connections=64):
+    if kind == "fake":
+        return FakeBackend()
+    if kind != "openai":
+        print(f"Unknown LLM provider '{kind}', using the OpenAI-compatible backend")
+    return OpenAIBackend(api_key=api_key, base_url=base_url, timeout=timeout, max_connections=max_connections)
+
+# ---------------------------
+# Micro-batching
+# ---------------------------
+
+class _Batch:
+    def __init__(self):
+        self.prompts = []
+        self.tokens = 0
+        self.closed = threading.Event()
+        self.done = threading.Event()
+        self.answers = None
+        self.total_tokens = 0
+        self.error = None
+
+class MicroBatcher:
+    """Packs small concurrent chat requests into one call.
+
+    Requests with the same batch key, system message and parameters that
+    arrive within `window` seconds of each other are sent as one prompt of
+    numbered tasks, up to `max_size` tasks and `max_batch_tokens` prompt
+    tokens. The first request of a batch waits out the window and makes the
+    call; the rest wait for its reply. A task missing from the reply is retried on its own.
+    Requests over `max_prompt_tokens`, or with a window of 0, pass straight
+    through to `call`.
+    """
+
+    def __init__(self, call, count_tokens, window=0.02, max_size=4, max_prompt_tokens=2000, max_batch_tokens=6000):
+        self.call = call
+        self.count_tokens = count_tokens
+        self.window = window
+        self.max_size = max_size
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_batch_tokens = max_batch_tokens
+        self.counters = {"requests": 0, "batched": 0, "calls": 0, "fallbacks": 0}
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def complete(self, messages, batch_key=None, **params):
+        self._count("requests")
+        system, prompt = messages[0], messages[-1]
+        if self.window <= 0 or self.max_size < 2 or len(messages) != 2 or system["role"] != "system":
+            return self.call(messages=messages, **params)
+        tokens = self.count_tokens(prompt["content"])
+        if tokens > self.max_prompt_tokens:
+            return self.call(messages=messages, **params)
+
+        # Callers key by document or request, so one user's text never lands in another's prompt
+        key = (json.dumps(batch_key), system["content"], json.dumps(params, sort_keys=True))
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None or batch.tokens + tokens > self.max_batch_tokens
+            if leader:
+                if batch is not None:
+                    batch.closed.set()  # Full by tokens: send it now
+                batch = self._open[key] = _Batch()
+            position = len(batch.prompts)
+            batch.prompts.append(prompt["content"])
+            batch.tokens += tokens
+            if len(batch.prompts) >= self.max_size:
+                del self._open[key]
+                batch.closed.set()
+
+        if leader:
+            batch.closed.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._send(batch, system, params)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        answer = batch.answers[position]
+        if answer is None:
+            self._count("fallbacks")
+            return self.call(messages=messages, **params)
+        return completion_response(answer, batch.total_tokens // len(batch.prompts), params.get("model"))
+
+    def _send(self, batch, system, params):
+        try:
+            self._count("calls")
+            if len(batch.prompts) == 1:
+                response = self.call(messages=[system, {"role": "user", "content": batch.prompts[0]}], **params)
+                batch.answers = [response.choices[0].message.content]
+            else:
+                self._count("batched", len(batch.prompts))
+                packed_params = {**params, "max_tokens": params.get("max_tokens", 1000) * len(batch.prompts)}
+                response = self.call(messages=[system, {
+                    "role": "user",
+                    "content": PACKED_TASKS_TEMPLATE.format(tasks=format_packed_questions(batch.prompts))
+                }], **packed_params)
+                batch.answers = split_packed_answers(response.choices[0].message.content, len(batch.prompts))
+            batch.total_tokens = response.usage.total_tokens
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {"window": self.window, "max_size": self.max_size, **self.counters}
@@ -0,0 +1,162 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Seconds; covers cache hits through multi-minute large-document runs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+# ---------------------------
+# Metrics Registry
+# ---------------------------
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """In-process counters and histograms rendered in the Prometheus text format.
+
+    Metrics are per process; under gunicorn each worker reports its own, so
+    scrape every worker or read them as a sample. Components that already keep
+    their own stats are exported at render time through collectors.
+    """
+
+    def __init__(self, prefix="ai_"):
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (self.prefix + name, tuple(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (self.prefix + name, tuple(labels.items()))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the block in seconds, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collect):
+        """Register collect() -> iterable of (name, type, labels, value), called on every render."""
+        self._collectors.append(collect)
+
+    def render(self):
+        families = {}
+
+        def sample(name, kind, line):
+            families.setdefault(name, (kind, []))[1].append(line)
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                sample(name, "counter", f"{name}{_format_labels(dict(labels))} {_format_value(value)}")
+            for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                labels = dict(labels)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                    sample(name, "histogram", f"{name}_bucket{bucket_labels} {cumulative}")
+                sample(name, "histogram", f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+                sample(name, "histogram", f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                sample(name, "histogram", f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        for collect in self._collectors:
+            try:
+                for name, kind, labels, value in collect():
+                    name = self.prefix + name
+                    sample(name, kind, f"{name}{_format_labels(labels)} {_format_value(value)}")
+            except Exception as e:
+                print(f"Metrics collector failed: {str(e)}")
+
+        lines = []
+        for name, (kind, samples) in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+# ---------------------------
+# Slow Request Profiling
+# ---------------------------
+
+class SamplingProfiler:
+    """Samples one thread's stack every `interval` seconds from a helper thread.
+
+    Cheap enough to leave on for a fraction of requests: the profiled thread
+    runs untouched, and stacks are only formatted for requests that turn out
+    slow.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path, header=""):
+        """Write samples as collapsed stacks (flamegraph.pl / speedscope input), busiest first."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            if header:
+                f.write(f"# {header}\n")
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
@@ -0,0 +1,107 @@
+import math
+import re
+from collections import Counter
+
+# Common words that carry no retrieval signal
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have how i if in
+into is it its may me my no not of on or our should so than that the their them then there
+these they this those to was we were what when where which who why will with would you your
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+# ---------------------------
+# BM25 Chunk Index
+# ---------------------------
+
+class BM25Index:
+    """Okapi BM25 inverted index over the chunks of one document.
+
+    Built once per document version and cached with the extracted text, so a
+    follow-up question only pays for scoring the postings of its own terms.
+    """
+
+    def __init__(self, chunks, postings, chunk_lengths, token_counts=None, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.postings = postings
+        self.chunk_lengths = chunk_lengths
+        # Model tokens per chunk, used for budgeting (character counts if unknown)
+        self.token_counts = token_counts or [len(chunk) for chunk in chunks]
+        self.k1 = k1
+        self.b = b
+        self.avg_length = (sum(chunk_lengths) / len(chunk_lengths)) if chunk_lengths else 0.0
+
+    @property
+    def total_tokens(self):
+        return sum(self.token_counts)
+
+    @classmethod
+    def build(cls, chunks, token_counts=None):
+        postings = {}
+        chunk_lengths = []
+        for i, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk))
+            chunk_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings.setdefault(term, []).append([i, tf])
+        return cls(chunks, postings, chunk_lengths, token_counts)
+
+    def to_dict(self):
+        return {
+            "chunks": self.chunks,
+            "postings": self.postings,
+            "chunk_lengths": self.chunk_lengths,
+            "token_counts": self.token_counts
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["chunks"], data["postings"], data["chunk_lengths"], data.get("token_counts"))
+
+    def search(self, query, k=5):
+        """Return up to k (chunk_index, score) pairs, best first. Empty if nothing matches."""
+        n = len(self.chunks)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.chunk_lengths[i] / (self.avg_length or 1))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def top_chunks(self, query, k=5):
+        """The k most relevant chunks in document order, or the first k if nothing matches."""
+        ranked = [i for i, _ in self.search(query, k)]
+        if not ranked:
+            return self.chunks[:k]
+        return [self.chunks[i] for i in sorted(ranked)]
+
+    def select_within_budget(self, query, budget):
+        """Pack the most relevant chunks into `budget` tokens, returned in document order.
+
+        Matching chunks go first; leftover budget is filled with the rest in order.
+        """
+        matched = [i for i, _ in self.search(query, len(self.chunks))]
+        matched_set = set(matched)
+        ranked = matched + [i for i in range(len(self.chunks)) if i not in matched_set]
+        selected = []
+        used = 0
+        for i in ranked:
+            size = self.token_counts[i] + 1
+            if used + size > budget:
+                continue
+            selected.append(i)
+            used += size
+
+        if not selected:
+            # Every chunk is larger than the budget; fall back to the best one (callers truncate)
+            return self.chunks[ranked[0]] if ranked else ""
+        return "\n\n".join(self.chunks[i] for i in sorted(selected))
@@ -0,0 +1,215 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+
+# ---------------------------
+# Conversation Sessions
+# ---------------------------
+
+class ConversationStore:
+    """SQLite-backed conversation sessions, one per (session id, document).
+
+    A session holds a rolling summary of the dialogue, the turns not yet
+    folded into that summary, and its working set: the ids of the document
+    chunks retrieved so far, in the order they were first sent. Sessions
+    untouched for `ttl` seconds are dropped. The file is shared by every
+    worker process, so a conversation can continue on any of them.
+    """
+
+    def __init__(self, db_path, ttl=86400):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self._conn = None
+        self._pid = None
+
+        db = sqlite3.connect(db_path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                summary TEXT NOT NULL DEFAULT '',
+                summarized_turns INTEGER NOT NULL DEFAULT 0,
+                turn_count INTEGER NOT NULL DEFAULT 0,
+                chunk_ids TEXT NOT NULL DEFAULT '[]',
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (session_id, document_id)
+            )""")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS session_turns (
+                session_id TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                turn INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                PRIMARY KEY (session_id, document_id, turn)
+            )""")
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+        db.commit()
+        db.close()
+
+    @property
+    def _db(self):
+        """This process's connection (callers hold self._lock), opened lazily so it never crosses a fork."""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _load(self, session_id, document_id):
+        row = self._db.execute(
+            """SELECT content_hash, summary, summarized_turns, turn_count, chunk_ids, updated_at
+               FROM sessions WHERE session_id = ? AND document_id = ?""",
+            (session_id, document_id)
+        ).fetchone()
+        if row is None:
+            return None
+        turns = self._db.execute(
+            """SELECT turn, question, answer FROM session_turns
+               WHERE session_id = ? AND document_id = ? AND turn > ? ORDER BY turn""",
+            (session_id, document_id, row[2])
+        ).fetchall()
+        return {
+            "session_id": session_id,
+            "document_id": document_id,
+            "content_hash": row[0],
+            "summary": row[1],
+            "summarized_turns": row[2],
+            "turn_count": row[3],
+            "chunk_ids": json.loads(row[4]),
+            "turns": [{"turn": turn, "question": question, "answer": answer} for turn, question, answer in turns],
+            "updated_at": row[5]
+        }
+
+    def _delete(self, session_id, document_id):
+        self._db.execute("DELETE FROM sessions WHERE session_id = ? AND document_id = ?", (session_id, document_id))
+        self._db.execute("DELETE FROM session_turns WHERE session_id = ? AND document_id = ?", (session_id, document_id))
+
+    def _insert_turn(self, session_id, document_id, question, answer):
+        self._db.execute(
+            "UPDATE sessions SET turn_count = turn_count + 1 WHERE session_id = ? AND document_id = ?",
+            (session_id, document_id)
+        )
+        turn = self._db.execute(
+            "SELECT turn_count FROM sessions WHERE session_id = ? AND document_id = ?", (session_id, document_id)
+        ).fetchone()[0]
+        self._db.execute(
+            "INSERT OR REPLACE INTO session_turns (session_id, document_id, turn, question, answer) VALUES (?, ?, ?, ?, ?)",
+            (session_id, document_id, turn, question, answer)
+        )
+        return turn
+
+    def get(self, session_id, document_id):
+        """The session, or None if it doesn't exist or has expired."""
+        with self._lock:
+            session = self._load(session_id, document_id)
+            if session and session["updated_at"] < time.time() - self.ttl:
+                self._delete(session_id, document_id)
+                self._db.commit()
+                return None
+        return session
+
+    def open(self, session_id, document_id, content_hash, seed_turns=None):
+        """Load the session for this document version, creating it if needed.
+
+        A new session is seeded with `seed_turns` (the client's own history, as
+        [{"question", "answer"}]) so an expired conversation picks up where the
+        client left off. If the document changed, the working set is dropped:
+        its chunk ids point into the old version.
+        """
+        now = time.time()
+        with self._lock:
+            session = self._load(session_id, document_id)
+            if session and session["updated_at"] < now - self.ttl:
+                self._delete(session_id, document_id)
+                session = None
+
+            if session is None:
+                self._db.execute(
+                    "INSERT INTO sessions (session_id, document_id, content_hash, updated_at) VALUES (?, ?, ?, ?)",
+                    (session_id, document_id, content_hash, now)
+                )
+                for qa in seed_turns or []:
+                    if qa.get("question") and qa.get("answer"):
+                        self._insert_turn(session_id, document_id, qa["question"], qa["answer"])
+                # Drop sessions nobody has touched within the TTL
+                expired = self._db.execute(
+                    "SELECT session_id, document_id FROM sessions WHERE updated_at < ?", (now - self.ttl,)
+                ).fetchall()
+                for expired_session, expired_document in expired:
+                    self._delete(expired_session, expired_document)
+            elif session["content_hash"] != content_hash:
+                self._db.execute(
+                    "UPDATE sessions SET content_hash = ?, chunk_ids = '[]' WHERE session_id = ? AND document_id = ?",
+                    (content_hash, session_id, document_id)
+                )
+            else:
+                return session
+
+            self._db.commit()
+            return self._load(session_id, document_id)
+
+    def add_turn(self, session_id, document_id, question, answer, chunk_ids=None):
+        """Append a turn (and the working set it was answered with). Returns (turn, unsummarized turns)."""
+        with self._lock:
+            turn = self._insert_turn(session_id, document_id, question, answer)
+            if chunk_ids is not None:
+                self._db.execute(
+                    "UPDATE sessions SET chunk_ids = ? WHERE session_id = ? AND document_id = ?",
+                    (json.dumps(chunk_ids), session_id, document_id)
+                )
+            self._db.execute(
+                "UPDATE sessions SET updated_at = ? WHERE session_id = ? AND document_id = ?",
+                (time.time(), session_id, document_id)
+            )
+            pending = turn - self._db.execute(
+                "SELECT summarized_turns FROM sessions WHERE session_id = ? AND document_id = ?",
+                (session_id, document_id)
+            ).fetchone()[0]
+            self._db.commit()
+        return turn, pending
+
+    def fold(self, session_id, document_id, summary, previous_turns, through_turn):
+        """Replace the summary with one covering turns up to `through_turn`.
+
+        Only applies if no other fold landed since the caller read the session
+        (summarized_turns is still `previous_turns`). Returns True if applied.
+        """
+        with self._lock:
+            applied = self._db.execute(
+                """UPDATE sessions SET summary = ?, summarized_turns = ?
+                   WHERE session_id = ? AND document_id = ? AND summarized_turns = ?""",
+                (summary, through_turn, session_id, document_id, previous_turns)
+            ).rowcount
+            if applied:
+                self._db.execute(
+                    "DELETE FROM session_turns WHERE session_id = ? AND document_id = ? AND turn <= ?",
+                    (session_id, document_id, through_turn)
+                )
+            self._db.commit()
+        return bool(applied)
+
+    def delete(self, session_id, document_id):
+        with self._lock:
+            self._delete(session_id, document_id)
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            sessions, turns = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(turn_count), 0) FROM sessions WHERE updated_at >= ?",
+                (time.time() - self.ttl,)
+            ).fetchone()
+        return {"sessions": sessions, "turns": turns, "ttl": self.ttl}
+
+def session_fingerprint(session):
+    """Hash of everything in the session that shapes the next prompt."""
+    material = json.dumps([session["summary"], session["turns"], session["chunk_ids"]])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
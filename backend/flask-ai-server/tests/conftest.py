@@ -0,0 +1,23 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# The server modules live one directory up and are imported as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """The server module, imported once against the fake LLM and a scratch data directory."""
+    env = {"LLM_PROVIDER": "fake", "AI_DATA_DIR": str(tmp_path_factory.mktemp("data")), "AI_SERVICE_TOKEN": "test-token"}
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        yield importlib.import_module("app")
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
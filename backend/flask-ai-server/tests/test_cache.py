@@ -0,0 +1,50 @@
+import sqlite3
+
+from cache import ExtractionCache
+
+def test_disk_budget_is_per_kind(tmp_path):
+    # No memory tier, so every lookup reads the disk tier
+    cache = ExtractionCache(str(tmp_path), max_memory_bytes=0, max_disk_entries=3, disk_budgets={"summary": 10})
+    for i in range(3):
+        cache.set("doc", f"hash{i}", {"text": f"text {i}"})
+    for i in range(50):
+        cache.set("doc", "hash0", {"summary": f"node {i}"}, kind=f"summary:{i}")
+
+    # The summary nodes pushed out older nodes, not the texts
+    assert [cache.get("doc", f"hash{i}")["text"] for i in range(3)] == ["text 0", "text 1", "text 2"]
+    assert cache.get("doc", "hash0", kind="summary:0") is None
+    assert cache.get("doc", "hash0", kind="summary:49") == {"summary": "node 49"}
+
+    kinds = cache.stats()["kinds"]
+    assert (kinds["text"]["disk_entries"], kinds["text"]["disk_hits"], kinds["text"]["stores"]) == (3, 3, 3)
+    assert (kinds["summary"]["disk_entries"], kinds["summary"]["disk_budget"], kinds["summary"]["misses"]) == (10, 10, 1)
+
+def test_least_recently_read_is_evicted(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_memory_bytes=0, max_disk_entries=2)
+    cache.set("doc", "old", {"text": "old"})
+    cache.set("doc", "newer", {"text": "newer"})
+    cache.get("doc", "old")
+    cache.set("doc", "newest", {"text": "newest"})
+
+    assert cache.get("doc", "old") == {"text": "old"}
+    assert cache.get("doc", "newer") is None
+
+def test_ocr_pages_have_their_own_budget(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_memory_bytes=0, max_disk_entries=2)
+    cache.set("doc", "hash", {"text": "text"})
+    for i in range(5):
+        cache.set_page_text(f"page{i}", f"page {i}")
+
+    assert cache.get("doc", "hash") == {"text": "text"}
+    assert cache.get_page_text("page4") == "page 4"
+    assert cache.stats()["kinds"]["ocr"]["disk_entries"] == 2
+
+def test_cache_from_before_kind_groups_is_dropped(tmp_path):
+    db = sqlite3.connect(str(tmp_path / "extracted_text.sqlite3"))
+    db.execute("CREATE TABLE extracted_text (key TEXT PRIMARY KEY, payload BLOB NOT NULL, accessed_at REAL NOT NULL)")
+    db.commit()
+    db.close()
+
+    cache = ExtractionCache(str(tmp_path))
+    cache.set("doc", "hash", {"text": "text"})
+    assert cache.stats()["kinds"]["text"]["disk_entries"] == 1
@@ -0,0 +1,128 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from downloader import Downloader
+
+BODY = bytes(range(256)) * 400  # 100 KiB
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+class DocumentHandler(BaseHTTPRequestHandler):
+    """Serves BODY with validators; /flaky drops the first full transfer halfway, /huge lies about its size."""
+
+    protocol_version = "HTTP/1.1"
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, dict(self.headers)))
+        if self.path == "/missing.pdf":
+            self.send_error(404)
+            return
+        if self.path == "/huge.pdf":
+            self.send_response(200)
+            self.send_header("Content-Length", str(10 * 1024 * 1024))
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") == ETAG:
+            offset = int(range_header.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {offset}-{len(BODY) - 1}/{len(BODY)}")
+            self._send_body(BODY[offset:])
+            return
+
+        self.send_response(200)
+        if self.path == "/flaky.pdf":
+            # Promise the whole file, send half of it and hang up
+            self._send_headers(len(BODY))
+            self.wfile.write(BODY[:len(BODY) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self._send_body(BODY)
+
+    def _send_headers(self, length):
+        self.send_header("Content-Length", str(length))
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def _send_body(self, body):
+        self._send_headers(len(body))
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    DocumentHandler.requests_seen = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), DocumentHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def downloader():
+    return Downloader(max_bytes=1024 * 1024, timeout=5, chunk_size=8192)
+
+def test_fetch_returns_data_hash_and_validators(server, downloader):
+    result = downloader.fetch(f"{server}/report.pdf")
+
+    assert result["success"] and not result["not_modified"]
+    assert bytes(result["data"]) == BODY
+    assert result["content_hash"] == hashlib.sha256(BODY).hexdigest()
+    assert result["etag"] == ETAG
+    assert result["last_modified"] == LAST_MODIFIED
+
+def test_matching_etag_revalidates_with_304(server, downloader):
+    result = downloader.fetch(f"{server}/report.pdf", etag=ETAG, last_modified=LAST_MODIFIED)
+
+    assert result == {"success": True, "not_modified": True}
+    _, headers = DocumentHandler.requests_seen[-1]
+    assert headers["If-None-Match"] == ETAG
+    assert headers["If-Modified-Since"] == LAST_MODIFIED
+
+def test_interrupted_download_resumes_with_range_request(server, downloader):
+    result = downloader.fetch(f"{server}/flaky.pdf")
+
+    assert result["success"]
+    assert bytes(result["data"]) == BODY
+    assert result["content_hash"] == hashlib.sha256(BODY).hexdigest()
+    _, resume_headers = DocumentHandler.requests_seen[-1]
+    # Picks up after the bytes it kept, which may stop short of what the server sent
+    offset = int(resume_headers["Range"].split("=")[1].rstrip("-"))
+    assert 0 < offset <= len(BODY) // 2
+    assert resume_headers["If-Range"] == ETAG
+
+def test_oversized_content_length_is_rejected_before_reading(server, downloader):
+    result = downloader.fetch(f"{server}/huge.pdf")
+
+    assert not result["success"]
+    assert result["status_code"] == 413
+
+def test_body_over_the_limit_is_rejected(server):
+    result = Downloader(max_bytes=len(BODY) // 2, timeout=5, chunk_size=8192).fetch(f"{server}/report.pdf")
+
+    assert not result["success"]
+    assert result["status_code"] == 413
+
+def test_missing_document_reports_status(server, downloader):
+    result = downloader.fetch(f"{server}/missing.pdf")
+
+    assert not result["success"]
+    assert result["status_code"] == 404
+    assert "404" in result["error"]
@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+import time
+
+from jobs import JobQueue
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_jobs_claimed_by_kind_priority(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), workers=1)
+    order = []
+    queue.register("warmup", lambda payload, job: order.append(payload["n"]) or {}, priority=2)
+    queue.register("extract", lambda payload, job: order.append(payload["n"]) or {}, priority=0)
+
+    warmup_id, _ = queue.submit("warmup", {"n": "warmup"})
+    extract_id, _ = queue.submit("extract", {"n": "extract"})
+    assert queue.status(extract_id)["queue_position"] == 0
+    assert queue.status(warmup_id)["queue_position"] == 1
+
+    queue.start()
+    try:
+        assert wait_for(lambda: len(order) == 2)
+    finally:
+        queue.stop(5)
+    assert order == ["extract", "warmup"]
+
+def test_heartbeat_keeps_long_job_leased(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    release = threading.Event()
+    runs = []
+
+    def slow(payload, job):
+        runs.append(job.id)
+        release.wait(5)
+        return {}
+
+    queue = JobQueue(path, workers=1, lease_seconds=0.3)
+    queue.register("slow", slow)
+    job_id, _ = queue.submit("slow", {})
+    queue.start()
+    try:
+        assert wait_for(lambda: runs)
+        time.sleep(1)  # several leases long
+        # Another process looking for work must not take over the live job
+        assert JobQueue(path, lease_seconds=0.3)._claim() is None
+        release.set()
+        assert wait_for(lambda: queue.status(job_id)["status"] == "completed")
+    finally:
+        release.set()
+        queue.stop(5)
+    assert runs == [job_id]
+
+def test_expired_lease_is_requeued(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    dead = JobQueue(path, lease_seconds=0.1)
+    job_id, _ = dead.submit("extract", {})
+    assert dead._claim().id == job_id  # claimed, then never renewed
+
+    other = JobQueue(path, lease_seconds=0.1)
+    assert other._claim() is None
+    time.sleep(0.2)
+    assert other._claim().id == job_id
+
+def test_queue_from_before_leases_keeps_its_jobs(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute("""
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedup_key TEXT, status TEXT NOT NULL,
+            payload TEXT NOT NULL, result BLOB, error TEXT, cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL, started_at REAL, finished_at REAL
+        )""")
+    db.execute("INSERT INTO jobs (id, kind, status, payload, created_at) VALUES ('old', 'extract', 'queued', '{}', 0)")
+    db.commit()
+    db.close()
+
+    queue = JobQueue(path)
+    assert queue.status("old")["queue_position"] == 0
+    assert queue._claim().id == "old"
@@ -0,0 +1,43 @@
+import httpx
+import pytest
+from openai import RateLimitError
+
+def rate_limited(retry_after):
+    request = httpx.Request("POST", "http://llm.test/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return RateLimitError("rate limited", response=response, body=None)
+
+@pytest.fixture
+def sleeps(app_module, monkeypatch):
+    """Record retry waits instead of sleeping them."""
+    waits = []
+    monkeypatch.setattr(app_module.time, "sleep", waits.append)
+    return waits
+
+def test_retry_after_is_capped(app_module, sleeps, monkeypatch):
+    calls = []
+    fake_complete = app_module.llm.complete
+
+    def complete(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise rate_limited("3600")
+        return fake_complete(**kwargs)
+
+    monkeypatch.setattr(app_module.llm, "complete", complete)
+    response = app_module.create_chat_completion(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+
+    assert response.choices[0].message.content
+    assert sleeps == [app_module.LLM_RETRY_MAX_DELAY]
+
+def test_gives_up_at_retry_deadline(app_module, sleeps, monkeypatch):
+    def complete(**kwargs):
+        raise rate_limited("3600")
+
+    monkeypatch.setattr(app_module.llm, "complete", complete)
+    monkeypatch.setattr(app_module, "LLM_RETRY_MAX_DELAY", 10)
+    monkeypatch.setattr(app_module, "LLM_RETRY_DEADLINE", 5)
+
+    with pytest.raises(RateLimitError):
+        app_module.create_chat_completion(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+    assert sleeps == []
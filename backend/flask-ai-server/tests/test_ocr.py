@@ -0,0 +1,80 @@
+import fitz
+import pytest
+
+import extraction
+
+SCAN_TEXT = "Recognized text of the scanned page"
+
+def make_pdf(scanned_pages=(2,), pages=3):
+    """A PDF whose `scanned_pages` (1-based) carry only an image, the rest a text layer."""
+    doc = fitz.open()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 32, 32), False)
+    pixmap.set_rect(pixmap.irect, (200, 200, 200))
+    for page_num in range(1, pages + 1):
+        page = doc.new_page()
+        if page_num in scanned_pages:
+            page.insert_image(fitz.Rect(36, 36, 300, 300), pixmap=pixmap)
+        else:
+            page.insert_text((36, 72), f"Text layer of page {page_num} with enough words to skip OCR.")
+    return doc.tobytes()
+
+class PageCache:
+    def __init__(self):
+        self.pages = {}
+
+    def get_page_text(self, page_hash):
+        return self.pages.get(page_hash)
+
+    def set_page_text(self, page_hash, text):
+        self.pages[page_hash] = text
+
+@pytest.fixture
+def ocr_calls(monkeypatch):
+    """Stub out tesseract (and the process pool, which can't run a stub) and record OCR calls."""
+    calls = []
+
+    def fake_ocr(png, *args, **kwargs):
+        calls.append(png)
+        return SCAN_TEXT
+
+    monkeypatch.setattr(extraction, "ocr_available", lambda: True)
+    monkeypatch.setattr(extraction, "get_extraction_pool", lambda: None)
+    monkeypatch.setattr(extraction, "_ocr_image", fake_ocr)
+    return calls
+
+def test_image_only_pages_are_replaced_with_ocr_text(ocr_calls):
+    result = extraction.extract_pdf_text(make_pdf())
+
+    assert result["success"]
+    assert result["ocr_pages"] == 1
+    assert len(ocr_calls) == 1
+    assert f"--- Page 2 ---\n{SCAN_TEXT}" in result["text"]
+    assert "Text layer of page 1" in result["text"] and "Text layer of page 3" in result["text"]
+
+def test_identical_scanned_pages_are_recognized_once(ocr_calls):
+    result = extraction.extract_pdf_text(make_pdf(scanned_pages=(1, 2, 3)))
+
+    assert result["ocr_pages"] == 3
+    assert len(ocr_calls) == 1
+    assert result["text"].count(SCAN_TEXT) == 3
+
+def test_page_cache_skips_recognition_on_the_next_extraction(ocr_calls):
+    page_cache = PageCache()
+    data = make_pdf()
+
+    first = extraction.extract_pdf_text(data, page_cache=page_cache)
+    second = extraction.extract_pdf_text(data, page_cache=page_cache)
+
+    assert len(ocr_calls) == 1
+    assert len(page_cache.pages) == 1
+    assert second["text"] == first["text"]
+
+def test_failed_ocr_keeps_the_empty_page(ocr_calls, monkeypatch):
+    def broken_ocr(png, *args, **kwargs):
+        raise RuntimeError("tesseract crashed")
+
+    monkeypatch.setattr(extraction, "_ocr_image", broken_ocr)
+    result = extraction.extract_pdf_text(make_pdf())
+
+    assert result["success"]
+    assert "--- Page 2 ---\n\n" in result["text"]
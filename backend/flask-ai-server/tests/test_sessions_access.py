@@ -0,0 +1,60 @@
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz
+import pytest
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def server(app_module, tmp_path_factory):
+    """The app, with a small PDF served over local HTTP."""
+    docs_dir = tmp_path_factory.mktemp("docs")
+    doc = fitz.open()
+    doc.new_page().insert_text((36, 72), "Section 1 says the quick brown fox jumps over the lazy dog.")
+    doc.save(str(docs_dir / "doc.pdf"))
+
+    http = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(docs_dir)))
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    yield app_module, f"http://127.0.0.1:{http.server_address[1]}/doc.pdf"
+    http.shutdown()
+
+def ask(client, file_url, question, headers=None, path="process"):
+    return client.post(
+        f"/api/document/doc-1/{path}",
+        json={"question": question, "file_url": file_url, "session_id": "user-1:doc-1"},
+        headers=headers or {}
+    )
+
+def test_session_id_ignored_without_service_token(server):
+    app, file_url = server
+    client = app.app.test_client()
+
+    result = ask(client, file_url, "What does section 1 say?").get_json()
+
+    assert result["success"]
+    assert "session_id" not in result and "session_turn" not in result
+    assert app.conversation_store.get("user-1:doc-1", "doc-1") is None
+
+def test_stream_session_id_ignored_without_service_token(server):
+    app, file_url = server
+    client = app.app.test_client()
+
+    body = ask(client, file_url, "What does the fox do?", path="process/stream").get_data(as_text=True)
+
+    assert "session_turn" not in body
+    assert app.conversation_store.get("user-1:doc-1", "doc-1") is None
+
+def test_session_opened_for_backend(server):
+    app, file_url = server
+    client = app.app.test_client()
+    headers = {"X-Service-Token": app.AI_SERVICE_TOKEN, "X-User-ID": "user-1"}
+
+    result = ask(client, file_url, "Who jumps over the dog?", headers=headers).get_json()
+
+    assert result["success"]
+    assert result["session_id"] == "user-1:doc-1" and result["session_turn"] == 1
+    assert app.conversation_store.get("user-1:doc-1", "doc-1")["turn_count"] == 1
@@ -0,0 +1,151 @@
+import math
+import os
+import re
+from itertools import accumulate
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to an estimate
+    tiktoken = None
+
+# Context window per model, in tokens
+MODEL_CONTEXT = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000
+}
+# Models not listed (local ones, say) are assumed to have this window
+DEFAULT_CONTEXT = int(os.getenv("LLM_CONTEXT_WINDOW", 8192))
+
+# Per-message framing the chat format adds on top of the content
+MESSAGE_OVERHEAD = 4
+
+# Lines that make good chunk boundaries: blank lines and page/section markers
+BOUNDARY_RE = re.compile(r"^\s*$|^--- (Page|Section) \d+ ---$")
+
+def context_window(model):
+    return MODEL_CONTEXT.get(model, DEFAULT_CONTEXT)
+
+# ---------------------------
+# Token Counting
+# ---------------------------
+
+class TokenCounter:
+    """Counts tokens with tiktoken when its encoding is available, else estimates ~4 chars/token."""
+
+    def __init__(self, encoding_name="cl100k_base"):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                print(f"tiktoken encoding unavailable ({e}), estimating token counts")
+
+    @property
+    def exact(self):
+        return self.encoding is not None
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode_ordinary(text))
+        return math.ceil(len(text) / 4)
+
+    def count_batch(self, texts):
+        """Count many strings in one call (tiktoken encodes the batch in parallel)."""
+        if self.encoding is not None:
+            return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+        return [math.ceil(len(text) / 4) for text in texts]
+
+    def truncate(self, text, max_tokens):
+        """Cut text to at most max_tokens, preferring a whitespace boundary."""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode_ordinary(text)
+            if len(tokens) <= max_tokens:
+                return text
+            text = self.encoding.decode(tokens[:max_tokens])
+        elif len(text) <= max_tokens * 4:
+            return text
+        else:
+            text = text[:max_tokens * 4]
+        cut = text.rfind(" ", len(text) * 3 // 4)
+        return text[:cut] if cut > 0 else text
+
+    def split(self, text, max_tokens):
+        """Split one oversized piece of text into pieces of at most max_tokens."""
+        pieces = []
+        while text:
+            piece = self.truncate(text, max_tokens)
+            if not piece:
+                piece = text[:max(1, max_tokens)]
+            pieces.append(piece)
+            text = text[len(piece):].lstrip(" ")
+        return pieces
+
+# ---------------------------
+# Token-based Chunking
+# ---------------------------
+
+def chunk_by_tokens(text, counter, max_tokens=750, overlap_tokens=125):
+    """Split text into chunks of at most max_tokens, returning (chunks, token_counts).
+
+    Lines are counted in one batch and chunk sizes come from prefix sums, so the
+    text is only tokenized once. Chunks prefer to end on a blank line or page
+    marker, and each starts with up to overlap_tokens of the previous chunk's
+    trailing lines for context.
+    """
+    if not text or not text.strip():
+        return [], []
+
+    lines = text.split("\n")
+    counts = [n + 1 for n in counter.count_batch(lines)]  # +1 for the newline
+
+    # Oversized single lines (text without line breaks) are split by tokens
+    if max(counts) > max_tokens:
+        units, unit_counts = [], []
+        for line, n in zip(lines, counts):
+            if n > max_tokens:
+                pieces = counter.split(line, max_tokens - 1)
+                units.extend(pieces)
+                unit_counts.extend(c + 1 for c in counter.count_batch(pieces))
+            else:
+                units.append(line)
+                unit_counts.append(n)
+        lines, counts = units, unit_counts
+
+    prefix = list(accumulate(counts, initial=0))
+    boundaries = [bool(BOUNDARY_RE.match(line)) for line in lines]
+
+    chunks, token_counts = [], []
+    start = 0
+    while start < len(lines):
+        # Carry trailing lines of the previous chunk forward as overlap
+        overlap_start = start
+        while overlap_start > 0 and prefix[start] - prefix[overlap_start - 1] <= overlap_tokens:
+            overlap_start -= 1
+
+        # Fill up to the budget, then back off to the last good boundary past the halfway mark
+        end = start
+        while end < len(lines) and prefix[end + 1] - prefix[overlap_start] <= max_tokens:
+            end += 1
+        if end == start:
+            overlap_start, end = start, start + 1
+        elif end < len(lines):
+            halfway = start + (end - start) // 2
+            for i in range(end - 1, halfway, -1):
+                if boundaries[i]:
+                    # Blank lines close the chunk; page/section markers open the next one
+                    end = i if lines[i].startswith("---") else i + 1
+                    break
+
+        chunk = "\n".join(lines[overlap_start:end]).strip()
+        if chunk:
+            chunks.append(chunk)
+            token_counts.append(prefix[end] - prefix[overlap_start])
+        start = end
+
+    return chunks, token_counts
@@ -2,6 +2,7 @@ import express from "express";
 import {
   uploadDocument,
   processDocument,
+  processDocumentStream,
   getUserDocuments,
   getDocument,
   deleteDocument,
@@ -52,6 +53,9 @@ router.post("/new", protect, upload.single("file"), uploadDocument);
 // Ask a question on an existing document
 router.post("/:documentId/process", protect, processDocument);
 
+// Ask a question and stream the answer as Server-Sent Events
+router.post("/:documentId/process/stream", protect, processDocumentStream);
+
 // Get all user documents (summary list)
 router.get("/", protect, getUserDocuments);
 